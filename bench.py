@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+# Offline benchmarks for the giveaway bot: no token, gateway or guild needed.
+#
+#   python bench.py render [--iterations N]
+#   python bench.py storm [--members N] [--messages N] [--valid-ratio X] ... [--output FILE]
+#   python bench.py gateway [--messages N] [--giveaway-ratio X] ... [--output FILE]
+#
+# "storm" replays synthetic traffic through the real event handlers against the fake
+# Discord objects from fake_discord.py, whose REST calls are counted per route.
+# "gateway" feeds raw MESSAGE_CREATE payloads to discord.py's parser and to the raw
+# fast path (MESSAGE_PARSE_MODE) and compares CPU and allocations per message.
+import argparse
+import asyncio
+import collections
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+# main.py reads its config and opens its state DB at import time: point it at a
+# throwaway DB and a fixed benchmark giveaway, whatever the local .env says
+BENCH_GUILD_ID = 1000
+BENCH_CHANNEL_ID = 2000
+BENCH_PARTICIPANT_ROLE_ID = 3000
+BENCH_QUIET_ROLE_ID = 3001
+BENCH_BOT_ID = 4000
+
+os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="giveaway-bench-"), "state.db")
+os.environ["GUILD_ID"] = str(BENCH_GUILD_ID)
+os.environ["CHANNEL_ID"] = str(BENCH_CHANNEL_ID)
+os.environ["PARTICIPANT_ROLE_IDS"] = str(BENCH_PARTICIPANT_ROLE_ID)
+os.environ["QUIET_ROLE_IDS"] = str(BENCH_QUIET_ROLE_ID)
+os.environ["ADMIN_ROLE_IDS"] = ""
+# Quiet hours cover the whole day so quiet-role traffic is always moderated
+os.environ["QUIET_START"] = "00:00"
+os.environ["QUIET_END"] = "23:59"
+os.environ.setdefault("COUNTDOWN_SECONDS", "3600")
+os.environ.setdefault("INVITE_MIN_ACCOUNT_AGE_DAYS", "0")
+
+import discord  # noqa: E402
+
+from fake_discord import (  # noqa: E402
+    FakeGuild,
+    FakeHTTP,
+    FakeInvite,
+    FakeMember,
+    FakeMessage,
+    FakeTextChannel,
+    FakeUser,
+    next_snowflake,
+)
+
+BENCH_TARGET_MESSAGE_ID = next_snowflake()
+os.environ["TARGET_MESSAGE_ID"] = str(BENCH_TARGET_MESSAGE_ID)
+
+import main  # noqa: E402
+
+
+def _legacy_countdown(user, seconds_left: int, notice=None) -> discord.Embed:
+    # The per-tick render as it was before templates: every string and the embed rebuilt
+    s = main.bonus_ledger.totals(user.id)
+    inv_applied = int(s.get("invites_applied", 0))
+    inv_secs = int(s.get("invite_seconds_applied", 0))
+    role_applied = int(s.get("role_bonuses_applied", 0))
+    role_secs = int(s.get("role_seconds_applied", 0))
+    desc = (
+        f"Active participant: {user.mention}\n"
+        f"⏳ Remaining: **{seconds_left}s**\n"
+        f"Reply to the pinned target message to take over."
+    )
+    if notice:
+        desc += f"\n\n{notice}"
+    fields = [
+        ("Invites Applied", f"{inv_applied} (−{inv_secs}s)", True),
+        ("Role Bonuses Applied", f"{role_applied} (−{role_secs}s)", True),
+        ("Total Bonus", f"−{inv_secs + role_secs}s", True),
+    ]
+    return main.make_embed("Giveaway Countdown", desc, fields=fields)
+
+
+def _time_per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_render(iterations: int) -> dict:
+    user = FakeUser(FakeHTTP(0.0), 1234)
+    template = main.countdown_template
+
+    # Each tick renders a new second; "payload" also serialises it, as message.edit would
+    legacy = _time_per_call(lambda i: _legacy_countdown(user, i % 600), iterations)
+    templated = _time_per_call(lambda i: template.render(template.frame(user, i % 600)), iterations)
+    legacy_payload = _time_per_call(lambda i: _legacy_countdown(user, i % 600).to_dict(), iterations)
+    templated_payload = _time_per_call(
+        lambda i: template.render(template.frame(user, i % 600)).to_dict(), iterations
+    )
+    # A frame whose payload matches the last one sent stops at the key comparison
+    last = template.frame(user, 42)
+    identical = _time_per_call(lambda i: template.frame(user, 42) == last, iterations)
+    static_legacy = _time_per_call(
+        lambda i: main.make_embed("How To Participate", "Please reply to the pinned target message to participate."),
+        iterations,
+    )
+    static_cached = _time_per_call(lambda i: main.msg_deleted_non_reply(), iterations)
+
+    return {
+        "iterations": iterations,
+        "countdown_tick_us": {"legacy": round(legacy, 3), "template": round(templated, 3)},
+        "countdown_payload_us": {"legacy": round(legacy_payload, 3), "template": round(templated_payload, 3)},
+        "identical_frame_skip_us": round(identical, 3),
+        "static_embed_us": {"legacy": round(static_legacy, 3), "cached": round(static_cached, 3)},
+    }
+
+
+# ---------------- Storm ----------------
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]  # noqa: E731
+    return {
+        "count": len(ordered),
+        "p50_ms": round(pick(0.50) * 1000, 3),
+        "p99_ms": round(pick(0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+async def _monitor_loop_lag(interval: float, samples: List[float], stop: asyncio.Event):
+    # How late the loop wakes a task that asked to sleep for `interval`
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+
+def _build_guild(http: FakeHTTP, args, rng: random.Random):
+    guild = FakeGuild(http, BENCH_GUILD_ID, chunked=not main.member_cache.lean)
+    channel = FakeTextChannel(http, guild, BENCH_CHANNEL_ID, BENCH_BOT_ID)
+    for i in range(args.members):
+        roles = set()
+        if rng.random() >= args.unregistered_ratio:
+            roles.add(BENCH_PARTICIPANT_ROLE_ID)
+        if rng.random() < args.quiet_ratio:
+            roles.add(BENCH_QUIET_ROLE_ID)
+        member = FakeMember(http, guild, next_snowflake(), roles)
+        guild.members[member.id] = member
+    inviters = rng.sample(list(guild.members.values()), min(args.inviters, len(guild.members)))
+    guild.invite_list = [FakeInvite(f"inv{i}", inviter) for i, inviter in enumerate(inviters)]
+    return guild, channel
+
+
+async def _drain(timeout: float) -> bool:
+    # Wait for ingest, DMs, invite batches and moderation deletes to settle
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        busy = (
+            any(s.ingest.stats()["queue_depth"] for s in main.sessions.values())
+            or main.deletion_queue.queue_depth()
+            or main.dm_dispatcher.stats()["queue_depth"]
+            or any(not task.done() for task in main.invite_attributor._flushers.values())
+        )
+        if not busy:
+            await main.state_writer.flush()
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def run_storm(args) -> dict:
+    rng = random.Random(args.seed)
+    http = FakeHTTP(args.rest_latency / 1000)
+    guild, channel = _build_guild(http, args, rng)
+    members = list(guild.members.values())
+    session = main.sessions[BENCH_CHANNEL_ID]
+    session.channel = channel
+
+    # End-to-end latency: from dispatch until the ingest batch holding the message is processed
+    injected_at: Dict[int, float] = {}
+    e2e: List[float] = []
+    process_batch = main.process_ingest_batch
+
+    async def timed_batch(sess, messages):
+        try:
+            return await process_batch(sess, messages)
+        finally:
+            done = time.perf_counter()
+            e2e.extend(done - injected_at.pop(m.id, done) for m in messages)
+
+    main.process_ingest_batch = timed_batch
+
+    # Interleave message and join events in one stream
+    events = ["message"] * args.messages + ["join"] * args.joins
+    rng.shuffle(events)
+    dispatch: Dict[str, List[float]] = {"message": [], "join": []}
+    lag: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor_loop_lag(args.lag_interval / 1000, lag, stop))
+    gap = 1.0 / args.rate if args.rate > 0 else 0.0
+
+    start = time.perf_counter()
+    for kind in events:
+        if kind == "message":
+            author = rng.choice(members)
+            reference = BENCH_TARGET_MESSAGE_ID if rng.random() < args.valid_ratio else None
+            message = FakeMessage(http, channel, author, reference_id=reference)
+            injected_at[message.id] = t0 = time.perf_counter()
+            await main.on_message(message)
+        else:
+            member = FakeMember(http, guild, next_snowflake(), {BENCH_PARTICIPANT_ROLE_ID})
+            guild.members[member.id] = member
+            if guild.invite_list:
+                rng.choice(guild.invite_list).uses += 1
+            t0 = time.perf_counter()
+            await main.on_member_join(member)
+        dispatch[kind].append(time.perf_counter() - t0)
+        await asyncio.sleep(gap)
+    injected = time.perf_counter() - start
+    drained = await _drain(args.drain_timeout)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+    main.process_ingest_batch = process_batch
+
+    total_events = len(events)
+    return {
+        "scenario": {
+            key: getattr(args, key)
+            for key in (
+                "members", "messages", "joins", "valid_ratio", "unregistered_ratio",
+                "quiet_ratio", "inviters", "rate", "rest_latency", "seed",
+            )
+        },
+        "events": total_events,
+        "drained": drained,
+        "inject_seconds": round(injected, 4),
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_events_per_s": round(total_events / elapsed, 2) if elapsed else 0.0,
+        "dispatch_latency": {kind: _percentiles(samples) for kind, samples in dispatch.items()},
+        "message_latency": _percentiles(e2e),
+        "loop_lag": _percentiles(lag),
+        "rest": {
+            "total": http.total(),
+            "per_event": round(http.total() / total_events, 4) if total_events else 0.0,
+            "by_route": dict(sorted(http.calls.items())),
+        },
+        "components": {
+            "ingest": session.ingest.stats(),
+            "renderer": session.renderer.stats(),
+            "deletes": main.deletion_queue.stats(),
+            "dms": main.dm_dispatcher.stats(),
+            "invites": main.invite_attributor.stats(),
+            "roles": main.role_cache.stats(),
+            "members": main.member_cache.stats(),
+            "throttle": main.message_throttle.stats(),
+            "warnings": main.warning_batcher.stats(),
+            "bonuses": main.bonus_ledger.stats(),
+            "persistence": main.state_writer.stats(),
+        },
+    }
+
+
+# ---------------- Gateway ----------------
+BENCH_OTHER_CHANNELS = 20
+
+
+def _gateway_guild(args, rng: random.Random) -> List[dict]:
+    # A real discord.py guild (giveaway channel plus busy neighbours) and its member payloads
+    role = lambda role_id, name: {  # noqa: E731
+        "id": str(role_id), "name": name, "permissions": "0", "position": 0,
+        "color": 0, "hoist": False, "managed": False, "mentionable": False,
+    }
+    members = []
+    for i in range(args.members):
+        roles = []
+        if rng.random() >= args.unregistered_ratio:
+            roles.append(str(BENCH_PARTICIPANT_ROLE_ID))
+        if rng.random() < args.quiet_ratio:
+            roles.append(str(BENCH_QUIET_ROLE_ID))
+        members.append({
+            "user": {"id": str(next_snowflake()), "username": f"user{i}", "discriminator": "0", "avatar": None, "global_name": None},
+            "roles": roles, "joined_at": "2024-01-01T00:00:00+00:00", "flags": 0, "deaf": False, "mute": False,
+        })
+    channels = [{"id": str(BENCH_CHANNEL_ID), "type": 0, "name": "giveaway", "position": 0, "permission_overwrites": []}]
+    channels += [
+        {"id": str(BENCH_CHANNEL_ID + 1 + i), "type": 0, "name": f"chat-{i}", "position": i + 1, "permission_overwrites": []}
+        for i in range(BENCH_OTHER_CHANNELS)
+    ]
+    main.bot._connection._add_guild_from_data({
+        "id": str(BENCH_GUILD_ID), "name": "bench", "owner_id": str(BENCH_BOT_ID),
+        "roles": [
+            role(BENCH_GUILD_ID, "@everyone"),
+            role(BENCH_PARTICIPANT_ROLE_ID, "participant"),
+            role(BENCH_QUIET_ROLE_ID, "quiet"),
+        ],
+        "channels": channels, "members": members if args.cached_members else [],
+        "member_count": len(members), "emojis": [], "stickers": [], "features": [],
+    })
+    return members
+
+
+def _gateway_payloads(members: List[dict], args, rng: random.Random) -> List[dict]:
+    payloads = []
+    for _ in range(args.messages):
+        member = rng.choice(members)
+        in_giveaway = rng.random() < args.giveaway_ratio
+        channel_id = BENCH_CHANNEL_ID if in_giveaway else BENCH_CHANNEL_ID + 1 + rng.randrange(BENCH_OTHER_CHANNELS)
+        payload = {
+            "id": str(next_snowflake()), "channel_id": str(channel_id), "guild_id": str(BENCH_GUILD_ID),
+            "author": member["user"], "member": {k: v for k, v in member.items() if k != "user"},
+            "content": "hello there " * rng.randint(1, 8), "timestamp": "2024-01-01T00:00:00+00:00",
+            "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [],
+            "mention_roles": [], "attachments": [], "embeds": [], "pinned": False, "type": 0, "flags": 0,
+        }
+        if in_giveaway and rng.random() < args.valid_ratio:
+            payload["type"] = 19
+            payload["message_reference"] = {
+                "message_id": str(BENCH_TARGET_MESSAGE_ID), "channel_id": str(channel_id), "guild_id": str(BENCH_GUILD_ID),
+            }
+        payloads.append(payload)
+    return payloads
+
+
+async def _gateway_pass(parse, payloads: List[dict], traced: bool) -> dict:
+    # Parse every payload as the gateway would, letting dispatched handlers run in between
+    state = main.bot._connection
+    peaks = []
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    if traced:
+        tracemalloc.start()
+        retained_from = tracemalloc.get_traced_memory()[0]
+    cpu = time.process_time()
+    for i, payload in enumerate(payloads):
+        if traced:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            parse(payload)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        else:
+            parse(payload)
+        if i % 100 == 99:
+            await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    cpu = time.process_time() - cpu
+    result = {"cpu_us_per_message": round(cpu / len(payloads) * 1e6, 3)}
+    if traced:
+        gc.collect()
+        result["alloc_peak_bytes_per_message"] = round(sum(peaks) / len(peaks), 1)
+        result["retained_bytes_per_message"] = round(
+            (tracemalloc.get_traced_memory()[0] - retained_from) / len(payloads), 1
+        )
+        tracemalloc.stop()
+    else:
+        gc.collect()
+        result["retained_blocks_per_message"] = round((sys.getallocatedblocks() - blocks) / len(payloads), 3)
+    result["message_cache"] = len(state._messages) if state._messages is not None else 0
+    return result
+
+
+async def run_gateway(args) -> dict:
+    rng = random.Random(args.seed)
+    await main.bot._async_setup_hook()
+    members = _gateway_guild(args, rng)
+    payloads = _gateway_payloads(members, args, rng)
+    state = main.bot._connection
+    session = main.sessions[BENCH_CHANNEL_ID]
+    session.channel = main.bot.get_channel(BENCH_CHANNEL_ID)
+
+    # Both paths end in route_message; count what reaches it (with its role check)
+    routed = collections.Counter()
+    route = main.route_message
+
+    def counting_route(sess, message):
+        routed[main.author_flags(message.author)] += 1
+
+    main.route_message = counting_route
+    fast = main.gateway_fast_path
+    full_parse = fast._full_parse or state.parsers["MESSAGE_CREATE"]
+    modes = {
+        # discord.py with its default 1000-message cache, as before the fast path
+        "full": (full_parse, collections.deque(maxlen=1000)),
+        "raw": (fast.parse_message_create, None),
+    }
+    if fast._full_parse is None:
+        fast._full_parse = full_parse
+    result = {
+        "scenario": {
+            key: getattr(args, key)
+            for key in ("messages", "members", "giveaway_ratio", "valid_ratio", "cached_members", "seed")
+        },
+    }
+    for mode, (parse, cache) in modes.items():
+        state._messages = cache
+        routed.clear()
+        timed = await _gateway_pass(parse, payloads, traced=False)
+        state._messages = collections.deque(maxlen=1000) if cache is not None else None
+        traced = await _gateway_pass(parse, payloads, traced=True)
+        result[mode] = dict(timed, **traced, routed=sum(routed.values()) // 2)
+    main.route_message = route
+    full, raw = result["full"], result["raw"]
+    result["speedup_cpu"] = round(full["cpu_us_per_message"] / raw["cpu_us_per_message"], 2) if raw["cpu_us_per_message"] else 0.0
+    return result
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Giveaway bot offline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    render = sub.add_parser("render", help="per-tick countdown render cost")
+    render.add_argument("--iterations", type=int, default=20000)
+
+    storm = sub.add_parser("storm", help="replay a synthetic message/join storm through the handlers")
+    storm.add_argument("--members", type=int, default=500, help="guild members sending messages")
+    storm.add_argument("--messages", type=int, default=5000, help="messages to inject")
+    storm.add_argument("--joins", type=int, default=200, help="member joins to inject")
+    storm.add_argument("--valid-ratio", type=float, default=0.3, help="share of messages replying to the target")
+    storm.add_argument("--unregistered-ratio", type=float, default=0.1, help="share of members without the participant role")
+    storm.add_argument("--quiet-ratio", type=float, default=0.1, help="share of members with a quiet-hours role")
+    storm.add_argument("--inviters", type=int, default=20, help="members owning an invite link")
+    storm.add_argument("--rate", type=float, default=2000.0, help="events per second (0 = as fast as possible)")
+    storm.add_argument("--rest-latency", type=float, default=20.0, help="simulated REST latency in ms")
+    storm.add_argument("--lag-interval", type=float, default=5.0, help="event-loop lag probe interval in ms")
+    storm.add_argument("--drain-timeout", type=float, default=30.0, help="seconds to wait for queues to settle")
+    storm.add_argument("--seed", type=int, default=1)
+    gateway = sub.add_parser("gateway", help="MESSAGE_CREATE parsing: discord.py models vs the raw fast path")
+    gateway.add_argument("--messages", type=int, default=20000, help="payloads to parse")
+    gateway.add_argument("--members", type=int, default=2000, help="distinct authors")
+    gateway.add_argument("--giveaway-ratio", type=float, default=0.05, help="share of messages in the giveaway channel")
+    gateway.add_argument("--valid-ratio", type=float, default=0.3, help="share of giveaway messages replying to the target")
+    gateway.add_argument("--unregistered-ratio", type=float, default=0.1, help="share of members without the participant role")
+    gateway.add_argument("--quiet-ratio", type=float, default=0.1, help="share of members with a quiet-hours role")
+    gateway.add_argument("--no-cached-members", dest="cached_members", action="store_false", help="lean member cache")
+    gateway.add_argument("--seed", type=int, default=1)
+    for command in (render, storm, gateway):
+        command.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+
+    if args.command == "render":
+        result = bench_render(args.iterations)
+    elif args.command == "gateway":
+        result = asyncio.run(run_gateway(args))
+        main.state_writer.close()
+    else:
+        result = asyncio.run(run_storm(args))
+        main.state_writer.close()
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main_cli()
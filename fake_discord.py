@@ -0,0 +1,223 @@
+# Offline stand-ins for the discord.py objects the bot touches, shared by bench.py
+# and simulate.py. Every REST-backed method goes through FakeHTTP, which counts calls
+# per route and can add (real or virtual) latency.
+import asyncio
+import datetime as dt
+import itertools
+from typing import Callable, Dict, List, Optional
+
+import discord
+
+_snowflake_seq = itertools.count()
+_utcnow: Callable[[], dt.datetime] = discord.utils.utcnow
+
+
+def set_time_source(utcnow: Callable[[], dt.datetime]):
+    # Snowflakes carry a timestamp; simulations point this at their virtual clock
+    global _utcnow
+    _utcnow = utcnow
+
+
+def next_snowflake() -> int:
+    # Real timestamps keep the IDs eligible for bulk delete
+    return discord.utils.time_snowflake(_utcnow()) + next(_snowflake_seq) % (1 << 22)
+
+
+class FakeHTTP:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+
+    async def request(self, route: str):
+        self.calls[route] = self.calls.get(route, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+
+class FakePermissions:
+    def __init__(self, administrator: bool = False):
+        self.administrator = administrator
+
+
+class FakeUser:
+    def __init__(self, http: FakeHTTP, user_id: int, *, bot: bool = False):
+        self._http = http
+        self.id = user_id
+        self.bot = bot
+        self.mention = f"<@{user_id}>"
+        self.display_name = f"user{user_id}"
+        self.created_at = discord.utils.snowflake_time(user_id)
+
+    async def send(self, content=None, *, embed=None):
+        await self._http.request("POST /channels/{dm}/messages")
+
+
+class FakeMember(FakeUser):
+    def __init__(self, http: FakeHTTP, guild: "FakeGuild", member_id: int, role_ids=(), *, admin: bool = False):
+        super().__init__(http, member_id)
+        self.guild = guild
+        self.role_ids = set(role_ids)
+        self.guild_permissions = FakePermissions(admin)
+        self.joined_at = _utcnow()
+
+    @property
+    def roles(self) -> List[int]:
+        return sorted(self.role_ids)
+
+    def get_role(self, role_id: int):
+        return role_id if role_id in self.role_ids else None
+
+    async def timeout(self, until, *, reason=None):
+        await self._http.request("PATCH /guilds/{guild}/members/{member}")
+        self.timed_out_for = until
+
+    def with_roles(self, role_ids) -> "FakeMember":
+        # The `after` side of an on_member_update
+        member = FakeMember(self._http, self.guild, self.id, role_ids, admin=self.guild_permissions.administrator)
+        member.joined_at = self.joined_at
+        return member
+
+
+class FakeInvite:
+    def __init__(self, code: str, inviter: FakeMember, max_uses: int = 0):
+        self.code = code
+        self.inviter = inviter
+        self.uses = 0
+        self.max_uses = max_uses
+
+
+class FakeGuild:
+    # `members` is the whole server; the client-side cache is all of it when chunked,
+    # otherwise only what the bot adds (the lean member cache mode)
+    def __init__(self, http: FakeHTTP, guild_id: int, *, chunked: bool = True):
+        self._http = http
+        self.id = guild_id
+        self.default_role = discord.Object(id=guild_id)
+        self.members: Dict[int, FakeMember] = {}
+        self.invite_list: List[FakeInvite] = []
+        self._cache: Optional[Dict[int, FakeMember]] = None if chunked else {}
+
+    @property
+    def _members(self) -> Dict[int, FakeMember]:
+        return self.members if self._cache is None else self._cache
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self._members.get(member_id)
+
+    def _add_member(self, member: FakeMember):
+        self._members[member.id] = member
+
+    def _remove_member(self, member: FakeMember):
+        self._members.pop(member.id, None)
+
+    async def query_members(self, *, user_ids, cache=True) -> List[FakeMember]:
+        return [self.members[user_id] for user_id in user_ids if user_id in self.members]
+
+    def get_role(self, role_id: int) -> discord.Object:
+        return discord.Object(id=role_id)
+
+    async def fetch_member(self, member_id: int) -> FakeMember:
+        await self._http.request("GET /guilds/{guild}/members/{member}")
+        member = self.members.get(member_id)
+        if member is None:
+            raise discord.NotFound(_FakeResponse(404), "Unknown Member")
+        return member
+
+    async def invites(self) -> List[FakeInvite]:
+        await self._http.request("GET /guilds/{guild}/invites")
+        return list(self.invite_list)
+
+
+class _FakeResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "fake"
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        http: FakeHTTP,
+        channel: "FakeTextChannel",
+        author,
+        *,
+        message_id: Optional[int] = None,
+        reference_id: Optional[int] = None,
+        embed: Optional[discord.Embed] = None,
+    ):
+        self._http = http
+        self.id = message_id or next_snowflake()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.embed = embed
+        self.reference = discord.MessageReference(message_id=reference_id, channel_id=channel.id) if reference_id else None
+
+    async def reply(self, content=None, *, embed=None, mention_author=True):
+        await self._http.request("POST /channels/{channel}/messages")
+        return self.channel._record(embed)
+
+    async def edit(self, *, content=None, embed=None):
+        await self._http.request("PATCH /channels/{channel}/messages/{message}")
+        return self
+
+    async def delete(self):
+        await self._http.request("DELETE /channels/{channel}/messages/{message}")
+
+
+class FakeTextChannel(discord.TextChannel):
+    # Subclassed (without running TextChannel.__init__) so isinstance checks pass
+    def __init__(self, http: FakeHTTP, guild: FakeGuild, channel_id: int, bot_user_id: int):
+        self._http = http
+        self.id = channel_id
+        self.name = f"giveaway-{channel_id}"
+        self.guild = guild
+        self.bot_user = FakeUser(http, bot_user_id, bot=True)
+        self.sent: List[FakeMessage] = []
+        self._fake_overwrites: Dict = {}
+
+    @property
+    def overwrites(self) -> Dict:
+        return dict(self._fake_overwrites)
+
+    @property
+    def locked(self) -> bool:
+        overwrite = self._fake_overwrites.get(self.guild.default_role)
+        return overwrite is not None and overwrite.send_messages is False
+
+    def sent_titles(self) -> List[str]:
+        return [message.embed.title for message in self.sent if message.embed is not None]
+
+    def _record(self, embed: Optional[discord.Embed]) -> FakeMessage:
+        message = FakeMessage(self._http, self, self.bot_user, embed=embed)
+        self.sent.append(message)
+        return message
+
+    def overwrites_for(self, target) -> discord.PermissionOverwrite:
+        overwrite = self._fake_overwrites.get(target)
+        return discord.PermissionOverwrite(**dict(overwrite)) if overwrite else discord.PermissionOverwrite()
+
+    async def set_permissions(self, target, *, overwrite=None, reason=None):
+        await self._http.request("PUT /channels/{channel}/permissions/{overwrite}")
+        if overwrite is None:
+            self._fake_overwrites.pop(target, None)
+        else:
+            self._fake_overwrites[target] = overwrite
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return FakeMessage(self._http, self, None, message_id=message_id)
+
+    async def send(self, content=None, *, embed=None, allowed_mentions=None):
+        await self._http.request("POST /channels/{channel}/messages")
+        return self._record(embed)
+
+    async def delete_messages(self, messages, *, reason=None):
+        await self._http.request("POST /channels/{channel}/messages/bulk-delete")
+
+    async def edit(self, *, overwrites=None, reason=None, **kwargs):
+        await self._http.request("PATCH /channels/{channel}")
+        if overwrites is not None:
+            self._fake_overwrites = dict(overwrites)
@@ -6,26 +6,41 @@
 #   Python 3.10+
 #
 # Behavior Summary:
-# - Only replies to a specific target message in a specific channel start/refresh the countdown.
+# - Each giveaway session is a (channel, target message) pair; several can run in one process.
+# - Only replies to the session's target message in its channel start/refresh the countdown.
 # - Non-reply messages in that channel are deleted (admins exempt).
 # - The active participant cannot post in the channel during their countdown (their messages get auto-deleted).
 # - New valid reply cancels previous participant, deletes previous countdown message, and restarts the timer.
-# - Quiet hours: between QUIET_START and QUIET_END, members with QUIET_ROLE_IDS cannot send messages (their messages get deleted).
+# - Quiet hours: between QUIET_START and QUIET_END (in TIMEZONE, or per-role QUIET_WINDOWS), members with QUIET_ROLE_IDS
+#   lose Send Messages in giveaway channels via permission overwrites; anything that still gets through is deleted.
 # - When the countdown reaches zero with no new reply, the last participant is announced as Winner and the channel is locked permanently.
 
 import os
 import asyncio
+import bisect
 import contextlib
 import datetime as dt
+import functools
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import math
+import re
+from collections import OrderedDict, deque
 import sqlite3
 import threading
-from typing import Dict, Optional, Set
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
 
+import aiohttp
+from aiohttp import web
 import discord
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
+import pytz
 load_dotenv()
 # ---------------- CONFIG (env-driven) ----------------
 GUILD_ID              = int(os.getenv("GUILD_ID", "0"))                   # Optional: set for faster slash sync
@@ -36,12 +51,16 @@ QUIET_ROLE_IDS        = {int(x) for x in os.getenv("QUIET_ROLE_IDS", "").split("
 PARTICIPANT_ROLE_IDS  = {int(x) for x in os.getenv("PARTICIPANT_ROLE_IDS", "").split(",") if x.strip().isdigit()}
 
 COUNTDOWN_SECONDS     = int(os.getenv("COUNTDOWN_SECONDS", "60"))         # e.g., 60
-TICK_RATE             = float(os.getenv("TICK_RATE", "1.0"))              # seconds between UI updates
-TIMEZONE              = os.getenv("TIMEZONE", "Europe/London")            # display only (not required)
+TICK_RATE             = float(os.getenv("TICK_RATE", "1.0"))              # min seconds between UI updates
+TIMEZONE              = os.getenv("TIMEZONE", "Europe/London")            # quiet hours are local to this zone
 
 # Quiet window (24h HH:MM). If start<end: same day window; if start>end: crosses midnight.
 QUIET_START           = os.getenv("QUIET_START", "00:00")
 QUIET_END             = os.getenv("QUIET_END", "09:00")
+# Per-role windows, e.g. "333=00:00-09:00,13:00-14:00;444=22:00-06:00" (roles listed here are quiet roles too)
+QUIET_WINDOWS         = os.getenv("QUIET_WINDOWS", "")
+# "overwrite" denies Send Messages to quiet roles at each window boundary; "delete" only deletes their messages
+QUIET_ENFORCEMENT     = os.getenv("QUIET_ENFORCEMENT", "overwrite").strip().lower()
 
 BOT_TOKEN             = os.getenv("DISCORD_BOT_TOKEN", "")
 ALERT_AT_SECONDS     = int(os.getenv("ALERT_AT_SECONDS", "10"))
@@ -50,6 +69,288 @@ STATE_DB_PATH        = os.getenv("STATE_DB_PATH", "giveaway_state.db")
 INVITE_ROLE_BONUS_SECONDS = int(os.getenv("INVITE_ROLE_BONUS_SECONDS", "10"))
 # Minimum account age (days) for an invited user to be eligible for any invite bonus
 INVITE_MIN_ACCOUNT_AGE_DAYS = int(os.getenv("INVITE_MIN_ACCOUNT_AGE_DAYS", "3"))
+# Countdown rendering: "live" edits the remaining seconds, "native" renders a Discord
+# relative timestamp once and only re-edits when the deadline moves.
+COUNTDOWN_RENDER_MODE = os.getenv("COUNTDOWN_RENDER_MODE", "live").strip().lower()
+# Countdown message edit budget (edits per window, seconds). Frames beyond it are merged.
+EDIT_RATE_LIMIT      = int(os.getenv("EDIT_RATE_LIMIT", "5"))
+EDIT_RATE_WINDOW     = float(os.getenv("EDIT_RATE_WINDOW", "5.0"))
+# Takeovers: "edit" updates one persistent countdown message in place (notice folded in),
+# "repost" deletes it, replies with a new one and posts a short "taken over" note.
+TAKEOVER_MODE        = os.getenv("TAKEOVER_MODE", "edit").strip().lower()
+# Messages arriving within this window (seconds) are processed as one ordered burst
+INGEST_BATCH_WINDOW  = float(os.getenv("INGEST_BATCH_WINDOW", "0.05"))
+# Write-behind persistence: group-commit interval (seconds) and max distinct pending writes
+PERSIST_COMMIT_INTERVAL = float(os.getenv("PERSIST_COMMIT_INTERVAL", "0.05"))
+PERSIST_MAX_PENDING     = int(os.getenv("PERSIST_MAX_PENDING", "10000"))
+# Journal events folded into the state tables per compaction; compacted events older than
+# JOURNAL_RETENTION_DAYS are pruned (0 keeps the full history for replay)
+JOURNAL_COMPACT_EVENTS  = int(os.getenv("JOURNAL_COMPACT_EVENTS", "500"))
+JOURNAL_RETENTION_DAYS  = int(os.getenv("JOURNAL_RETENTION_DAYS", "0"))
+# Joins arriving within this window (seconds) share one invite snapshot
+INVITE_BATCH_WINDOW     = float(os.getenv("INVITE_BATCH_WINDOW", "1.5"))
+# Moderation deletes are gathered for this long (seconds) and sent as bulk deletes
+DELETE_BATCH_LINGER     = float(os.getenv("DELETE_BATCH_LINGER", "0.25"))
+# DM dispatch: concurrent senders, queue bound, per-user/template cooldown and closed-DM cache
+DM_WORKERS              = int(os.getenv("DM_WORKERS", "4"))
+DM_QUEUE_SIZE           = int(os.getenv("DM_QUEUE_SIZE", "1000"))
+DM_COOLDOWN_SECONDS     = float(os.getenv("DM_COOLDOWN_SECONDS", "900"))
+DM_NEGATIVE_TTL_SECONDS = float(os.getenv("DM_NEGATIVE_TTL_SECONDS", "86400"))
+DM_CACHE_SIZE           = int(os.getenv("DM_CACHE_SIZE", "50000"))
+# Max members whose admin/quiet/participant classification is cached
+ROLE_CACHE_SIZE         = int(os.getenv("ROLE_CACHE_SIZE", "20000"))
+# "full" keeps every guild member resident (chunked at startup); "lean" keeps only the
+# members the giveaway touches, at most MEMBER_CACHE_SIZE, plus fresh joins
+MEMBER_CACHE_MODE       = os.getenv("MEMBER_CACHE_MODE", "full").strip().lower()
+MEMBER_CACHE_SIZE       = int(os.getenv("MEMBER_CACHE_SIZE", "5000"))
+# Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics; 0 turns instrumentation off
+METRICS_PORT            = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST            = os.getenv("METRICS_HOST", "127.0.0.1")
+# REST calls in flight at once while (re)starting: session restores and invite snapshots
+STARTUP_CONCURRENCY     = int(os.getenv("STARTUP_CONCURRENCY", "8"))
+# Per-user message budget in giveaway channels: THROTTLE_BURST messages, refilled at
+# THROTTLE_RATE per second; over-budget messages are only deleted
+THROTTLE_RATE           = float(os.getenv("THROTTLE_RATE", "0.5"))
+THROTTLE_BURST          = float(os.getenv("THROTTLE_BURST", "5"))
+THROTTLE_CACHE_SIZE     = int(os.getenv("THROTTLE_CACHE_SIZE", "10000"))
+# Time out members after this many over-budget messages in one spree (0 disables)
+THROTTLE_TIMEOUT_STRIKES = int(os.getenv("THROTTLE_TIMEOUT_STRIKES", "0"))
+THROTTLE_TIMEOUT_SECONDS = int(os.getenv("THROTTLE_TIMEOUT_SECONDS", "300"))
+# At most one "replies only" warning per channel per window, naming every offender
+WARN_WINDOW_SECONDS     = float(os.getenv("WARN_WINDOW_SECONDS", "10"))
+# "raw" moderates giveaway-channel messages straight from the gateway payload and drops
+# every other channel's messages before a Message is built; "full" uses discord.py models
+MESSAGE_PARSE_MODE      = os.getenv("MESSAGE_PARSE_MODE", "raw").strip().lower()
+# Bonuses earned without a running countdown are kept as credits; "redeem" spends them
+# on the user's next takeover, "off" only records them
+BONUS_CARRYOVER         = os.getenv("BONUS_CARRYOVER", "off").strip().lower()
+# Inviters per /leaderboard page
+LEADERBOARD_PAGE_SIZE   = max(1, min(25, int(os.getenv("LEADERBOARD_PAGE_SIZE", "10"))))
+
+# ---------------- Metrics ----------------
+# Counters, gauges and histograms in the Prometheus text format. Components keep their
+# own stats() counters, which are read at scrape time by collectors; timings are only
+# recorded when METRICS_PORT is set (otherwise instrumented() returns the function
+# unchanged and the record calls return immediately).
+METRICS_ENABLED = METRICS_PORT > 0
+# Latency buckets (seconds)
+METRIC_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Collector = Callable[[], Iterable[Tuple[str, Dict[str, str], Dict]]]
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    def __init__(self, *, enabled: bool):
+        self.enabled = enabled
+        # The state writer records from its own thread
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._collectors: List[Collector] = []
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(METRIC_BUCKETS)
+            hist.observe(value)
+
+    def add_collector(self, collector: Collector):
+        # collector() yields (subsystem, labels, stats dict); numeric stats become gauges
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            histograms = {
+                name: {key: (list(h.counts), h.sum, h.count) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, "counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for name, series in sorted(gauges.items()):
+            self._header(lines, name, "gauge")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, "histogram")
+            for key, (counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket in zip(METRIC_BUCKETS + (math.inf,), counts):
+                    cumulative += bucket
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        lines.extend(self._collected())
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, kind: str):
+        help_text = self._meta.get(name, (kind, ""))[1]
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def _collected(self) -> List[str]:
+        series: Dict[str, List[str]] = {}
+        for collector in self._collectors:
+            try:
+                rows = list(collector())
+            except Exception as e:
+                print(f"[{BRAND}] Metrics collector failed: {e!r}")
+                continue
+            for subsystem, labels, stats in rows:
+                key = tuple(sorted(labels.items()))
+                for stat, value in stats.items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    name = f"giveaway_{subsystem}_{stat}"
+                    series.setdefault(name, []).append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        lines: List[str] = []
+        for name, samples in sorted(series.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return lines
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (
+        f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+        for k, v in key
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+metrics = MetricsRegistry(enabled=METRICS_ENABLED)
+metrics.describe("giveaway_handler_seconds", "histogram", "Time spent in each event handler.")
+metrics.describe("giveaway_handler_errors_total", "counter", "Event handler calls that raised.")
+metrics.describe("giveaway_rest_requests_total", "counter", "Discord REST requests by route and status.")
+metrics.describe("giveaway_rest_seconds", "histogram", "Discord REST request latency by route.")
+metrics.describe("giveaway_rest_rate_limited_total", "counter", "Discord REST responses with status 429.")
+metrics.describe("giveaway_loop_lag_seconds", "histogram", "How late the event loop wakes a sleeping task.")
+metrics.describe("giveaway_countdown_drift_seconds", "histogram", "Countdown timer wakeups past their due time.")
+metrics.describe("giveaway_persist_commit_seconds", "histogram", "State writer transaction time.")
+metrics.describe("giveaway_persist_flush_wait_seconds", "histogram", "Time callers wait for pending state to be committed.")
+metrics.describe("giveaway_startup_phase_seconds", "gauge", "Duration of each phase of the last (re)start.")
+
+def instrumented(name: str):
+    # Times an async handler under giveaway_handler_seconds{handler=name}
+    def wrap(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                metrics.inc("giveaway_handler_errors_total", handler=name)
+                raise
+            finally:
+                metrics.observe("giveaway_handler_seconds", time.perf_counter() - started, handler=name)
+        return timed
+    return wrap
+
+_ROUTE_PREFIX = re.compile(r"^/api/v\d+")
+
+def rest_route(method: str, path: str) -> str:
+    # "PATCH /api/v10/channels/123/messages/456" -> "PATCH /channels/{id}/messages/{id}"
+    parts = []
+    for part in _ROUTE_PREFIX.sub("", path).split("/"):
+        if part.isdigit():
+            part = "{id}"
+        elif len(part) >= 32:
+            part = "{token}"  # interaction/webhook tokens
+        parts.append(part)
+    return f"{method} {'/'.join(parts)}"
+
+def rest_trace() -> aiohttp.TraceConfig:
+    # Hooks discord.py's HTTP session: every REST call is counted and timed by route
+    trace = aiohttp.TraceConfig()
+
+    async def on_start(session, ctx, params):
+        ctx.started = time.perf_counter()
+
+    async def on_end(session, ctx, params):
+        route = rest_route(params.method, params.url.path)
+        status = params.response.status
+        metrics.inc("giveaway_rest_requests_total", route=route, status=str(status))
+        metrics.observe("giveaway_rest_seconds", time.perf_counter() - ctx.started, route=route)
+        if status == 429:
+            metrics.inc("giveaway_rest_rate_limited_total", route=route)
+
+    async def on_exception(session, ctx, params):
+        metrics.inc("giveaway_rest_requests_total", route=rest_route(params.method, params.url.path), status="error")
+
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    trace.on_request_exception.append(on_exception)
+    return trace
+
+async def monitor_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe("giveaway_loop_lag_seconds", max(0.0, loop.time() - started - interval))
+
+async def start_metrics_server() -> web.AppRunner:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(
+            body=metrics.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    print(f"[{BRAND}] Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
 
 # ---------------- Messages (EN - Nox RP) ----------------
 BRAND = "Nox RP"
@@ -93,24 +394,542 @@ def make_embed(title: str, description: str = "", *, fields: Optional[list] = No
     return emb
 
 
+# Per-user totals derived from the bonus ledger (applied bonuses and unspent credits)
+USER_STAT_FIELDS = (
+    "invites_applied",
+    "invite_seconds_applied",
+    "role_bonuses_applied",
+    "role_seconds_applied",
+)
+BONUS_STAT_FIELDS = {"invite": USER_STAT_FIELDS[0:2], "role": USER_STAT_FIELDS[2:4]}
+# session_key is the countdown that applied the row, followed by (space-separated) any
+# other countdown of the same user the bonus also shortened
+LEDGER_FIELDS = (
+    "id", "earned_at", "guild_id", "user_id", "invitee_id", "reason", "count", "seconds", "session_key", "applied_at",
+)
+
+def session_key(channel_id: int, target_message_id: int) -> str:
+    # Channel IDs are globally unique, so the guild is implied by the channel
+    return f"{channel_id}:{target_message_id}"
+
+# Giveaway state changes are appended to the journal as events. The sessions,
+# session_state, referrals and bonus_ledger tables are a snapshot of the journal up to
+# kv 'snapshot_seq'; compaction folds newer events into them, so recovery is the
+# snapshot plus the (short) journal tail, read locally before the bot connects.
+ACTIVE_STATE_EVENTS = ("takeover", "resume", "repost", "bonus")
+
+def journal_ops(kind: str, key: Optional[str], data: Dict) -> List[Tuple[str, tuple]]:
+    # Row writes that apply one event to the snapshot tables
+    if kind == "session_opened":
+        return [("session", (key, data["guild_id"], data["channel_id"], data["target_message_id"]))]
+    if kind == "session_closed":
+        return [("delete_session", (key,))]
+    if kind in ACTIVE_STATE_EVENTS:
+        # "bonus" events also carry the ledger rows they applied, redeemed or (applied by
+        # another of the user's countdowns in the same batch) extended to this one
+        return [(
+            "active_state",
+            (key, data["user_id"], data["until"], data.get("source_msg_id"), data.get("countdown_msg_id")),
+        )] + [
+            ("ledger_entry", tuple(entry[name] for name in LEDGER_FIELDS)) for entry in data.get("entries", ())
+        ] + [
+            ("ledger_applied", (entry_id, key, data["applied_at"])) for entry_id in data.get("redeemed", ())
+        ] + [
+            ("ledger_extended", (entry_id, key)) for entry_id in data.get("extended", ())
+        ]
+    if kind == "cleared":
+        return [("clear_active_state", (key,))]
+    if kind in ("locked", "unlocked"):
+        return [("session_locked", (key, kind == "locked"))]
+    if kind == "referral":
+        return [("referral", (data["invitee_id"], data["inviter_id"], data["role_bonus_applied"]))]
+    if kind == "credit":
+        # Bonuses earned while the user held no countdown (pre-ledger events carry only totals)
+        return [("ledger_entry", tuple(entry[name] for name in LEDGER_FIELDS)) for entry in data.get("entries", ())]
+    return []  # audit-only events (e.g. "winner")
+
 class StateStore:
-    def __init__(self, path: str):
+    # Bumped whenever the table layout changes; stored in PRAGMA user_version
+    SCHEMA_VERSION = 4
+
+    def __init__(self, path: str, *, legacy_session: Optional[Tuple[int, int]] = None):
         self._path = path
         self._lock = threading.Lock()
         self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
         with self._conn:
-            self._conn.execute(
-                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_key TEXT PRIMARY KEY,
+                    guild_id INTEGER NOT NULL DEFAULT 0,
+                    channel_id INTEGER NOT NULL,
+                    target_message_id INTEGER NOT NULL,
+                    locked INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS session_state (
+                    session_key TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    active_until TEXT NOT NULL,
+                    source_msg_id INTEGER,
+                    countdown_message_id INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS referrals (
+                    invitee_id INTEGER PRIMARY KEY,
+                    inviter_id INTEGER NOT NULL,
+                    role_bonus_applied INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_referrals_inviter ON referrals (inviter_id);
+                CREATE TABLE IF NOT EXISTS bonus_ledger (
+                    id INTEGER PRIMARY KEY,
+                    earned_at TEXT NOT NULL,
+                    guild_id INTEGER NOT NULL DEFAULT 0,
+                    user_id INTEGER NOT NULL,
+                    invitee_id INTEGER,
+                    reason TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 1,
+                    seconds INTEGER NOT NULL,
+                    session_key TEXT,
+                    applied_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_bonus_ledger_user ON bonus_ledger (user_id);
+                CREATE TABLE IF NOT EXISTS notified_users (user_id INTEGER PRIMARY KEY);
+                CREATE TABLE IF NOT EXISTS journal (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    at TEXT NOT NULL,
+                    session_key TEXT,
+                    kind TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_journal_session ON journal (session_key);
+                """
             )
+        self._migrate(legacy_session)
+        self.compactions = 0
+        self.events_compacted = 0
+        self.events_pruned = 0
+        self.journal_tail = self._count_tail()
+        # Recovery: fold whatever the last run journaled since its last compaction
+        self.compact()
 
-    def _set(self, key: str, value: Dict):
-        payload = json.dumps(value)
+    def _migrate(self, legacy_session: Optional[Tuple[int, int]]):
         with self._lock, self._conn:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 4:
+                # Pre-ledger counters, folded into the ledger below
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS user_stats (user_id INTEGER PRIMARY KEY, "
+                    + ", ".join(f"{name} INTEGER NOT NULL DEFAULT 0" for name in USER_STAT_FIELDS)
+                    + ")"
+                )
+            if version < 1:
+                # v0 -> v1: move whole-blob kv rows into their own tables
+                legacy = dict(
+                    self._conn.execute(
+                        "SELECT key, value FROM kv WHERE key IN "
+                        "('active_state', 'referrals', 'user_stats', 'notified_users')"
+                    ).fetchall()
+                )
+                blobs = {}
+                for key, raw in legacy.items():
+                    try:
+                        blobs[key] = json.loads(raw)
+                    except json.JSONDecodeError:
+                        blobs[key] = None
+                active = blobs.get("active_state")
+                if isinstance(active, dict) and active.get("user_id") and active.get("active_until"):
+                    # Into the v1 table, which the v1 -> v2 step reads
+                    self._conn.execute(
+                        "CREATE TABLE IF NOT EXISTS active_state (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                        "user_id INTEGER NOT NULL, active_until TEXT NOT NULL, source_msg_id INTEGER, "
+                        "countdown_message_id INTEGER)"
+                    )
+                    with contextlib.suppress(sqlite3.Error):
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO active_state (id, user_id, active_until, source_msg_id, "
+                            "countdown_message_id) VALUES (1, ?, ?, ?, ?)",
+                            (
+                                active["user_id"], active["active_until"],
+                                active.get("source_msg_id"), active.get("countdown_message_id"),
+                            ),
+                        )
+                referrals = blobs.get("referrals")
+                if isinstance(referrals, dict):
+                    for invitee_id, info in referrals.items():
+                        with contextlib.suppress(TypeError, ValueError, AttributeError):
+                            self._write_referral(
+                                int(invitee_id),
+                                int(info["inviter_id"]),
+                                bool(info.get("role_bonus_applied", False)),
+                            )
+                stats = blobs.get("user_stats")
+                if isinstance(stats, dict):
+                    for user_id, values in stats.items():
+                        with contextlib.suppress(TypeError, ValueError, AttributeError):
+                            self._write_user_stats(int(user_id), values)
+                notified = blobs.get("notified_users")
+                if isinstance(notified, dict):
+                    for user_id in notified.get("ids", []):
+                        with contextlib.suppress(TypeError, ValueError):
+                            self._write_notified_user(int(user_id))
+                self._conn.execute(
+                    "DELETE FROM kv WHERE key IN "
+                    "('active_state', 'referrals', 'user_stats', 'notified_users')"
+                )
+            # v1 -> v2: the single pre-sessions giveaway becomes the env-configured session.
+            # Retried on every open until one is configured: the legacy rows stay until then.
+            self._adopt_legacy_session(legacy_session, journal=version >= 3)
+            if version < 3:
+                # v2 -> v3: start the journal with baseline events describing the existing
+                # rows, so a replay from the first event ends in the same state
+                self._write_baseline()
+            if version < 4:
+                # v3 -> v4: the hand-maintained user_stats counters become opening ledger
+                # rows (one per user and bonus kind), journaled so a replay includes them
+                self._write_opening_ledger()
+                self._conn.execute("DROP TABLE user_stats")
+            if version < self.SCHEMA_VERSION:
+                self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _adopt_legacy_session(self, legacy_session: Optional[Tuple[int, int]], *, journal: bool):
+        # The v1 active_state row and kv lock flag move to the (CHANNEL_ID, TARGET_MESSAGE_ID)
+        # session; journaled when the v2 -> v3 baseline has already been written
+        has_v1_table = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'active_state'"
+        ).fetchone()
+        locked_row = self._conn.execute("SELECT value FROM kv WHERE key = 'channel_locked'").fetchone()
+        if not (has_v1_table or locked_row) or not (legacy_session and all(legacy_session)):
+            return
+        active = None
+        if has_v1_table:
+            row = self._conn.execute(
+                "SELECT user_id, active_until, source_msg_id, countdown_message_id FROM active_state"
+            ).fetchone()
+            if row:
+                active = dict(zip(("user_id", "active_until", "source_msg_id", "countdown_message_id"), row))
+            self._conn.execute("DROP TABLE active_state")
+        locked = False
+        if locked_row:
+            with contextlib.suppress(json.JSONDecodeError, AttributeError):
+                locked = bool(json.loads(locked_row[0]).get("locked", False))
+            self._conn.execute("DELETE FROM kv WHERE key = 'channel_locked'")
+        channel_id, target_message_id = legacy_session
+        key = session_key(channel_id, target_message_id)
+        events: List[Tuple[str, Dict]] = [("session_opened", {
+            "guild_id": 0, "channel_id": channel_id, "target_message_id": target_message_id,
+        })]
+        if locked:
+            events.append(("locked", {}))
+        if active and active.get("user_id") and active.get("active_until"):
+            events.append(("resume", {
+                "user_id": active["user_id"], "until": active["active_until"],
+                "source_msg_id": active.get("source_msg_id"), "countdown_msg_id": active.get("countdown_message_id"),
+            }))
+        at = _now_utc_naive().isoformat()
+        for kind, data in events:
+            for name, args in journal_ops(kind, key, data):
+                getattr(self, f"_write_{name}")(*args)
+            if journal:
+                self._conn.execute(
+                    "INSERT INTO journal (at, session_key, kind, data) VALUES (?, ?, ?, ?)",
+                    (at, key, kind, json.dumps(data)),
+                )
+
+    def _write_baseline(self):
+        at = _now_utc_naive().isoformat()
+        events: List[Tuple[Optional[str], str, Dict]] = []
+        for key, guild_id, channel_id, target_message_id, locked in self._conn.execute(
+            "SELECT session_key, guild_id, channel_id, target_message_id, locked FROM sessions"
+        ).fetchall():
+            events.append((key, "session_opened", {
+                "guild_id": guild_id, "channel_id": channel_id, "target_message_id": target_message_id,
+            }))
+            if locked:
+                events.append((key, "locked", {}))
+        for key, user_id, until, source_msg_id, countdown_msg_id in self._conn.execute(
+            "SELECT session_key, user_id, active_until, source_msg_id, countdown_message_id FROM session_state"
+        ).fetchall():
+            events.append((key, "resume", {
+                "user_id": user_id, "until": until,
+                "source_msg_id": source_msg_id, "countdown_msg_id": countdown_msg_id,
+            }))
+        for invitee_id, inviter_id, applied in self._conn.execute(
+            "SELECT invitee_id, inviter_id, role_bonus_applied FROM referrals"
+        ).fetchall():
+            events.append((None, "referral", {
+                "invitee_id": invitee_id, "inviter_id": inviter_id, "role_bonus_applied": bool(applied),
+            }))
+        for row in self._conn.execute(f"SELECT user_id, {', '.join(USER_STAT_FIELDS)} FROM user_stats").fetchall():
+            events.append((None, "credit", {"user_id": row[0], "stats": dict(zip(USER_STAT_FIELDS, row[1:]))}))
+        for key, kind, data in events:
+            data["baseline"] = True
+            self._conn.execute(
+                "INSERT INTO journal (at, session_key, kind, data) VALUES (?, ?, ?, ?)",
+                (at, key, kind, json.dumps(data)),
+            )
+        # The rows already reflect the baseline
+        last = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM journal").fetchone()[0]
+        self._write_kv("snapshot_seq", {"seq": last})
+
+    def _write_opening_ledger(self):
+        # Counters journaled since the last compaction are not in user_stats yet
+        for (raw,) in self._conn.execute(
+            "SELECT data FROM journal WHERE seq > ? AND kind = 'credit' ORDER BY seq", (self._snapshot_seq(),)
+        ).fetchall():
+            with contextlib.suppress(json.JSONDecodeError, KeyError, TypeError):
+                data = json.loads(raw)
+                if "stats" in data:
+                    self._write_user_stats(int(data["user_id"]), data["stats"])
+        at = _now_utc_naive().isoformat()
+        next_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM bonus_ledger").fetchone()[0]
+        for row in self._conn.execute(f"SELECT user_id, {', '.join(USER_STAT_FIELDS)} FROM user_stats").fetchall():
+            stats = dict(zip(USER_STAT_FIELDS, row[1:]))
+            entries = []
+            for reason, (count_field, seconds_field) in BONUS_STAT_FIELDS.items():
+                if stats[count_field] or stats[seconds_field]:
+                    entries.append({
+                        "id": next_id, "earned_at": at, "guild_id": 0, "user_id": row[0], "invitee_id": None,
+                        "reason": reason, "count": stats[count_field], "seconds": stats[seconds_field],
+                        "session_key": None, "applied_at": at,
+                    })
+                    next_id += 1
+            if not entries:
+                continue
+            for entry in entries:
+                self._write_ledger_entry(*(entry[name] for name in LEDGER_FIELDS))
+            # Folding this again on the next compaction rewrites the same rows
             self._conn.execute(
-                "REPLACE INTO kv (key, value) VALUES (?, ?)",
-                (key, payload),
+                "INSERT INTO journal (at, session_key, kind, data) VALUES (?, ?, ?, ?)",
+                (at, None, "credit", json.dumps({"user_id": row[0], "entries": entries, "baseline": True})),
             )
 
+    # Row writers; callers hold the lock and own the transaction
+    def _write_session(self, key: str, guild_id: int, channel_id: int, target_message_id: int):
+        self._conn.execute(
+            "INSERT INTO sessions (session_key, guild_id, channel_id, target_message_id) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(session_key) DO UPDATE SET guild_id = MAX(guild_id, excluded.guild_id)",
+            (key, guild_id, channel_id, target_message_id),
+        )
+
+    def _write_delete_session(self, key: str):
+        self._conn.execute("DELETE FROM session_state WHERE session_key = ?", (key,))
+        self._conn.execute("DELETE FROM sessions WHERE session_key = ?", (key,))
+
+    def _write_session_locked(self, key: str, locked: bool):
+        self._conn.execute("UPDATE sessions SET locked = ? WHERE session_key = ?", (int(locked), key))
+
+    def _write_active_state(self, key: str, user_id, active_until, source_msg_id, countdown_msg_id):
+        self._conn.execute(
+            "INSERT INTO session_state (session_key, user_id, active_until, source_msg_id, countdown_message_id) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(session_key) DO UPDATE SET "
+            "user_id = excluded.user_id, active_until = excluded.active_until, "
+            "source_msg_id = excluded.source_msg_id, countdown_message_id = excluded.countdown_message_id",
+            (key, user_id, active_until, source_msg_id, countdown_msg_id),
+        )
+
+    def _write_referral(self, invitee_id: int, inviter_id: int, role_bonus_applied: bool):
+        self._conn.execute(
+            "INSERT INTO referrals (invitee_id, inviter_id, role_bonus_applied) VALUES (?, ?, ?) "
+            "ON CONFLICT(invitee_id) DO UPDATE SET "
+            "inviter_id = excluded.inviter_id, role_bonus_applied = excluded.role_bonus_applied",
+            (invitee_id, inviter_id, int(role_bonus_applied)),
+        )
+
+    def _write_user_stats(self, user_id: int, stats: Dict):
+        values = [int(stats.get(name, 0)) for name in USER_STAT_FIELDS]
+        self._conn.execute(
+            f"INSERT INTO user_stats (user_id, {', '.join(USER_STAT_FIELDS)}) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET "
+            + ", ".join(f"{name} = excluded.{name}" for name in USER_STAT_FIELDS),
+            (user_id, *values),
+        )
+
+    def _write_ledger_entry(
+        self,
+        entry_id: int,
+        earned_at: str,
+        guild_id: int,
+        user_id: int,
+        invitee_id: Optional[int],
+        reason: str,
+        count: int,
+        seconds: int,
+        session_key: Optional[str],
+        applied_at: Optional[str],
+    ):
+        self._conn.execute(
+            f"REPLACE INTO bonus_ledger ({', '.join(LEDGER_FIELDS)}) VALUES ({', '.join('?' * len(LEDGER_FIELDS))})",
+            (entry_id, earned_at, guild_id, user_id, invitee_id, reason, count, seconds, session_key, applied_at),
+        )
+
+    def _write_ledger_applied(self, entry_id: int, session_key: str, applied_at: str):
+        self._conn.execute(
+            "UPDATE bonus_ledger SET session_key = ?, applied_at = ? WHERE id = ?",
+            (session_key, applied_at, entry_id),
+        )
+
+    def _write_ledger_extended(self, entry_id: int, session_key: str):
+        self._conn.execute(
+            "UPDATE bonus_ledger SET session_key = session_key || ' ' || ? "
+            "WHERE id = ? AND instr(' ' || session_key || ' ', ' ' || ? || ' ') = 0",
+            (session_key, entry_id, session_key),
+        )
+
+    def _write_notified_user(self, user_id: int):
+        self._conn.execute("INSERT OR IGNORE INTO notified_users (user_id) VALUES (?)", (user_id,))
+
+    def _write_remove_notified_user(self, user_id: int):
+        self._conn.execute("DELETE FROM notified_users WHERE user_id = ?", (user_id,))
+
+    def _write_clear_active_state(self, key: str):
+        self._conn.execute("DELETE FROM session_state WHERE session_key = ?", (key,))
+
+    def _write_kv(self, key: str, value: Dict):
+        self._conn.execute("REPLACE INTO kv (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _write_journal(self, at: str, key: Optional[str], kind: str, data: str):
+        self._conn.execute(
+            "INSERT INTO journal (at, session_key, kind, data) VALUES (?, ?, ?, ?)",
+            (at, key, kind, data),
+        )
+        self.journal_tail += 1
+
+    def _snapshot_seq(self) -> int:
+        row = self._conn.execute("SELECT value FROM kv WHERE key = 'snapshot_seq'").fetchone()
+        return int(json.loads(row[0])["seq"]) if row else 0
+
+    def _count_tail(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM journal WHERE seq > ?", (self._snapshot_seq(),)
+            ).fetchone()[0]
+
+    def record(self, kind: str, key: Optional[str] = None, **data):
+        # Synchronous append, for startup paths that run before the writer matters
+        with self._lock, self._conn:
+            self._write_journal(_now_utc_naive().isoformat(), key, kind, json.dumps(data))
+
+    def compact(self, *, retention_days: int = 0) -> int:
+        # Fold the journal tail into the snapshot tables in one transaction
+        with self._lock, self._conn:
+            since = self._snapshot_seq()
+            rows = self._conn.execute(
+                "SELECT seq, session_key, kind, data FROM journal WHERE seq > ? ORDER BY seq", (since,)
+            ).fetchall()
+            for seq, key, kind, raw in rows:
+                try:
+                    ops = journal_ops(kind, key, json.loads(raw))
+                except (json.JSONDecodeError, KeyError, TypeError) as e:
+                    print(f"[{BRAND}] Skipping unreadable journal event #{seq} ({kind}): {e!r}")
+                    continue
+                for name, args in ops:
+                    getattr(self, f"_write_{name}")(*args)
+            if rows:
+                self._write_kv("snapshot_seq", {"seq": rows[-1][0]})
+            if retention_days > 0:
+                cutoff = (_now_utc_naive() - dt.timedelta(days=retention_days)).isoformat()
+                pruned = self._conn.execute(
+                    "DELETE FROM journal WHERE seq <= ? AND at < ?",
+                    (rows[-1][0] if rows else since, cutoff),
+                ).rowcount
+                self.events_pruned += pruned
+            self.journal_tail = 0
+        if rows:
+            self.compactions += 1
+            self.events_compacted += len(rows)
+        return len(rows)
+
+    def load_journal(
+        self,
+        *,
+        session_key: Optional[str] = None,
+        user_id: Optional[int] = None,
+        until_seq: Optional[int] = None,
+    ) -> List[Dict]:
+        # Events in commit order, for audits; user_id matches any user field of the event
+        query = "SELECT seq, at, session_key, kind, data FROM journal WHERE 1 = 1"
+        params: List = []
+        if session_key is not None:
+            query += " AND session_key = ?"
+            params.append(session_key)
+        if until_seq is not None:
+            query += " AND seq <= ?"
+            params.append(until_seq)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY seq", params).fetchall()
+        events = []
+        for seq, at, key, kind, raw in rows:
+            data = json.loads(raw)
+            if user_id is not None and user_id not in (
+                data.get("user_id"), data.get("invitee_id"), data.get("inviter_id"), data.get("previous_user_id"),
+            ):
+                continue
+            events.append({"seq": seq, "at": at, "session_key": key, "kind": kind, "data": data})
+        return events
+
+    def load_session_history(self, session_key: str, limit: int) -> Dict:
+        # Seeds a recovered session's status: its last `limit` takeovers (newest first)
+        # and the bonuses of the current turn, as far back as the journal is retained
+        with self._lock:
+            takeovers = self._conn.execute(
+                "SELECT COUNT(*) FROM journal WHERE session_key = ? AND kind = 'takeover'", (session_key,)
+            ).fetchone()[0]
+            recent = self._conn.execute(
+                "SELECT seq, at, data FROM journal WHERE session_key = ? AND kind = 'takeover' "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_key, limit),
+            ).fetchall()
+            bonuses = self._conn.execute(
+                "SELECT data FROM journal WHERE session_key = ? AND kind = 'bonus' AND seq > ?",
+                (session_key, recent[0][0] if recent else 0),
+            ).fetchall()
+        history = []
+        for _, at, raw in recent:
+            with contextlib.suppress(json.JSONDecodeError, KeyError, TypeError, ValueError):
+                history.append((int(json.loads(raw)["user_id"]), dt.datetime.fromisoformat(at)))
+        bonus_seconds = turn_bonuses = 0
+        for (raw,) in bonuses:
+            with contextlib.suppress(json.JSONDecodeError, TypeError, ValueError):
+                data = json.loads(raw)
+                bonus_seconds += int(data.get("seconds", 0))
+                turn_bonuses += (
+                    len(data.get("entries", ())) + len(data.get("redeemed", ())) + len(data.get("extended", ())) or 1
+                )
+        return {
+            "takeovers": takeovers,
+            "history": tuple(history),
+            "turn_started_at": history[0][1] if history else None,
+            "turn_bonus_seconds": bonus_seconds,
+            "turn_bonuses": turn_bonuses,
+        }
+
+    def replay(self, *, until_seq: Optional[int] = None) -> "StateStore":
+        # Rebuild the state as of until_seq in a scratch in-memory store
+        replica = StateStore(":memory:")
+        with replica._lock, replica._conn:
+            for event in self.load_journal(until_seq=until_seq):
+                for name, args in journal_ops(event["kind"], event["session_key"], event["data"]):
+                    getattr(replica, f"_write_{name}")(*args)
+        return replica
+
+    def write_batch(self, ops: List[Tuple[str, tuple]]):
+        # Apply several row writes in a single transaction (one fsync)
+        with self._lock, self._conn:
+            for name, args in ops:
+                getattr(self, f"_write_{name}")(*args)
+
+    def _set(self, key: str, value: Dict):
+        with self._lock, self._conn:
+            self._write_kv(key, value)
+
+    def save_setting(self, key: str, value: Dict):
+        self._set(key, value)
+
+    def load_setting(self, key: str) -> Optional[Dict]:
+        return self._get(key)
+
     def _get(self, key: str) -> Optional[Dict]:
         with self._lock:
             cursor = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,))
@@ -122,107 +941,351 @@ class StateStore:
         except json.JSONDecodeError:
             return None
 
-    def _delete(self, key: str):
+    def load_sessions(self) -> List[Dict]:
+        self.compact()  # include events committed since the last compaction
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_key, guild_id, channel_id, target_message_id, locked FROM sessions"
+            ).fetchall()
+        return [
+            {
+                "key": key,
+                "guild_id": guild_id,
+                "channel_id": channel_id,
+                "target_message_id": target_message_id,
+                "locked": bool(locked),
+            }
+            for key, guild_id, channel_id, target_message_id, locked in rows
+        ]
+
+    def load_active_state(self, key: str) -> Optional[Dict]:
+        self.compact()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, active_until, source_msg_id, countdown_message_id "
+                "FROM session_state WHERE session_key = ?",
+                (key,),
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "user_id": row[0],
+            "active_until": row[1],
+            "source_msg_id": row[2],
+            "countdown_message_id": row[3],
+        }
+
+    def load_channel_locked(self, key: str) -> bool:
+        self.compact()
+        with self._lock:
+            row = self._conn.execute("SELECT locked FROM sessions WHERE session_key = ?", (key,)).fetchone()
+        return bool(row and row[0])
+
+    def add_notified_user(self, user_id: int):
         with self._lock, self._conn:
-            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+            self._write_notified_user(user_id)
+
+    def load_notified_users(self) -> Set[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id FROM notified_users").fetchall()
+        return {row[0] for row in rows}
 
-    def save_active_state(
+    def load_referrals(self) -> Dict[int, Dict]:
+        self.compact()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT invitee_id, inviter_id, role_bonus_applied FROM referrals"
+            ).fetchall()
+        return {
+            invitee_id: {"inviter_id": inviter_id, "role_bonus_applied": bool(applied)}
+            for invitee_id, inviter_id, applied in rows
+        }
+
+    def load_bonus_totals(self) -> Dict[int, Dict]:
+        # Applied bonuses per user, summed in SQL rather than over every row in Python
+        self.compact()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, reason, SUM(count), SUM(seconds) FROM bonus_ledger "
+                "WHERE applied_at IS NOT NULL GROUP BY user_id, reason"
+            ).fetchall()
+        totals: Dict[int, Dict] = {}
+        for user_id, reason, count, seconds in rows:
+            fields = BONUS_STAT_FIELDS.get(reason)
+            if fields is None:
+                continue
+            stats = totals.setdefault(user_id, {name: 0 for name in USER_STAT_FIELDS})
+            stats[fields[0]] += count
+            stats[fields[1]] += seconds
+        return totals
+
+    def load_bonus_credits(self) -> List[Dict]:
+        # Ledger rows earned but not applied yet, oldest first
+        self.compact()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(LEDGER_FIELDS)} FROM bonus_ledger WHERE applied_at IS NULL ORDER BY id"
+            ).fetchall()
+        return [dict(zip(LEDGER_FIELDS, row)) for row in rows]
+
+    def last_bonus_id(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM bonus_ledger").fetchone()[0]
+
+# Write-behind layer around StateStore. Writes are queued from the event loop and
+# committed by a dedicated thread in one transaction per interval. Nearly all of them
+# are journal events, kept in order and never merged; the few keyed row writes left
+# (notified users, settings) keep only their latest value. The queue is not bounded:
+# the loop never waits on it, and max_pending only makes the thread commit at once
+# instead of waiting out the interval. flush() lets durability-critical paths wait.
+# Every compact_every journal events the thread folds the journal into the snapshot
+# tables.
+class StateWriter:
+    def __init__(
         self,
+        store: StateStore,
         *,
-        user_id: Optional[int],
-        active_until: Optional[str],
-        source_msg_id: Optional[int],
-        countdown_msg_id: Optional[int],
+        interval: float,
+        max_pending: int,
+        compact_every: int = 500,
+        retention_days: int = 0,
     ):
-        if user_id is None or active_until is None:
-            self._delete("active_state")
-            return
-        self._set(
-            "active_state",
-            {
-                "user_id": user_id,
-                "active_until": active_until,
-                "source_msg_id": source_msg_id,
-                "countdown_message_id": countdown_msg_id,
-            },
+        self._store = store
+        self._interval = max(0.0, interval)
+        self._max_pending = max(1, max_pending)
+        self._compact_every = max(1, compact_every)
+        self._retention_days = retention_days
+        self._events = 0
+        self._cond = threading.Condition()
+        self._pending: Dict[Tuple, Tuple[str, tuple]] = {}
+        self._submitted = 0
+        self._committed = 0
+        self._flush_requested = False
+        self._waiters: List[Tuple[int, asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._closed = False
+        self.row_writes = 0
+        self.writes_merged = 0
+        self.commits = 0
+        self.commit_errors = 0
+        self.commits_early = 0
+        self.writes_dropped = 0
+        self.commit_seconds_total = 0.0
+        self.commit_seconds_max = 0.0
+        self.last_batch_writes = 0
+        self._thread = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._thread.start()
+
+    def _enqueue(self, key: Tuple, name: str, args: tuple):
+        # Runs on the event loop: never waits. A full queue only cuts the group-commit
+        # wait short (row writes to the same key still merge; journal events never drop).
+        with self._cond:
+            if len(self._pending) >= self._max_pending and not self._flush_requested:
+                self._flush_requested = True
+                self.commits_early += 1
+            if name != "journal":
+                self.row_writes += 1
+                if key in self._pending:
+                    self.writes_merged += 1
+            self._pending[key] = (name, args)
+            self._submitted += 1
+            self._cond.notify_all()
+
+    def record(self, kind: str, key: Optional[str] = None, **data):
+        # Journal events are never merged: each one gets its own slot, in order
+        self._events += 1
+        self._enqueue(
+            ("journal", self._events),
+            "journal",
+            (_now_utc_naive().isoformat(), key, kind, json.dumps(data)),
         )
 
-    def load_active_state(self) -> Optional[Dict]:
-        return self._get("active_state")
+    def add_notified_user(self, user_id: int):
+        self._enqueue(("notified_user", user_id), "notified_user", (user_id,))
 
-    def clear_active_state(self):
-        self._delete("active_state")
+    def remove_notified_user(self, user_id: int):
+        self._enqueue(("notified_user", user_id), "remove_notified_user", (user_id,))
 
-    def save_channel_locked(self, locked: bool):
-        self._set("channel_locked", {"locked": bool(locked)})
+    def save_setting(self, key: str, value: Dict):
+        self._enqueue(("setting", key), "kv", (key, value))
 
-    def load_channel_locked(self) -> bool:
-        data = self._get("channel_locked") or {}
-        return bool(data.get("locked", False))
+    async def flush(self):
+        # Raises the commit's sqlite3.Error if a write submitted so far failed to commit
+        # (it stays queued and is retried)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._cond:
+            if self._committed >= self._submitted:
+                return
+            self._waiters.append((self._submitted, loop, fut))
+            self._flush_requested = True
+            self._cond.notify_all()
+        started = time.perf_counter()
+        await fut
+        metrics.observe("giveaway_persist_flush_wait_seconds", time.perf_counter() - started)
 
-    def save_notified_users(self, user_ids: Set[int]):
-        self._set("notified_users", {"ids": sorted(user_ids)})
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with contextlib.suppress(sqlite3.Error):
+            self._store.compact(retention_days=self._retention_days)
 
-    def load_notified_users(self) -> Set[int]:
-        data = self._get("notified_users") or {}
-        ids = data.get("ids", [])
-        try:
-            return {int(x) for x in ids}
-        except (TypeError, ValueError):
-            return set()
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            depth = len(self._pending)
+        mean = self.commit_seconds_total / self.commits if self.commits else 0.0
+        return {
+            "queue_depth": depth,
+            "row_writes": self.row_writes,
+            "writes_merged": self.writes_merged,
+            "commits": self.commits,
+            "commit_errors": self.commit_errors,
+            "commits_early": self.commits_early,
+            "writes_dropped": self.writes_dropped,
+            "commit_latency_mean_ms": round(mean * 1000, 3),
+            "commit_latency_max_ms": round(self.commit_seconds_max * 1000, 3),
+            "last_batch_writes": self.last_batch_writes,
+            "row_merge_rate": round(self.writes_merged / self.row_writes, 3) if self.row_writes else 0.0,
+            "journal_events": self._events,
+            "journal_tail": self._store.journal_tail,
+            "compactions": self._store.compactions,
+            "events_compacted": self._store.events_compacted,
+            "events_pruned": self._store.events_pruned,
+        }
 
-    def save_referrals(self, referrals: Dict[int, Dict]):
-        serializable = {str(k): v for k, v in referrals.items()}
-        self._set("referrals", serializable)
+    def _run(self):
+        retry_delay = 0.0
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # Group commit: let more writes accumulate unless someone is waiting;
+                # after a failed commit, back off before retrying
+                deadline = time.monotonic() + max(self._interval, retry_delay)
+                while not (self._flush_requested and not retry_delay or self._closed):
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch, self._pending = self._pending, {}
+                target = self._submitted
+                self._flush_requested = False
+                self._cond.notify_all()
+            ops = list(batch.values())
+            started = time.monotonic()
+            try:
+                self._store.write_batch(ops)
+            except sqlite3.Error as e:
+                self.commit_errors += 1
+                self._failed(batch, target, e)
+                retry_delay = min(max(2 * retry_delay, 1.0), 30.0)
+                continue
+            retry_delay = 0.0
+            elapsed = time.monotonic() - started
+            self.commits += 1
+            self.commit_seconds_total += elapsed
+            self.commit_seconds_max = max(self.commit_seconds_max, elapsed)
+            metrics.observe("giveaway_persist_commit_seconds", elapsed)
+            self.last_batch_writes = len(ops)
+            if self._store.journal_tail >= self._compact_every:
+                try:
+                    self._store.compact(retention_days=self._retention_days)
+                except sqlite3.Error as e:
+                    print(f"[{BRAND}] Journal compaction failed: {e}")
+            with self._cond:
+                self._committed = target
+                ready = [w for w in self._waiters if w[0] <= target]
+                self._waiters = [w for w in self._waiters if w[0] > target]
+            for _, loop, fut in ready:
+                loop.call_soon_threadsafe(_resolve_future, fut, None)
 
-    def load_referrals(self) -> Dict[int, Dict]:
-        data = self._get("referrals") or {}
-        try:
-            return {int(k): v for k, v in data.items()}
-        except (ValueError, AttributeError):
-            return {}
+    def _failed(self, batch: Dict[Tuple, Tuple[str, tuple]], target: int, error: sqlite3.Error):
+        # The batch goes back in front of newer writes (which win for the same key); whoever
+        # waits on it is told the commit failed
+        with self._cond:
+            if self._closed:
+                self.writes_dropped += len(batch)
+                print(f"[{BRAND}] State commit failed on shutdown, {len(batch)} writes lost: {error}")
+            else:
+                print(f"[{BRAND}] State commit failed, {len(batch)} writes kept for retry: {error}")
+                self._pending = {**batch, **self._pending}
+            failed = [w for w in self._waiters if w[0] <= target]
+            self._waiters = [w for w in self._waiters if w[0] > target]
+        for _, loop, fut in failed:
+            loop.call_soon_threadsafe(_resolve_future, fut, error)
 
-    def save_user_stats(self, stats: Dict[int, Dict]):
-        serializable = {str(k): v for k, v in stats.items()}
-        self._set("user_stats", serializable)
+def _resolve_future(fut: asyncio.Future, error: Optional[BaseException]):
+    if fut.done():
+        return
+    if error is None:
+        fut.set_result(None)
+    else:
+        fut.set_exception(error)
 
-    def load_user_stats(self) -> Dict[int, Dict]:
-        data = self._get("user_stats") or {}
-        try:
-            return {int(k): v for k, v in data.items()}
-        except (ValueError, AttributeError):
-            return {}
-
-def _get_user_stats(uid: int) -> Dict:
-    s = user_stats.get(uid)
-    if not s:
-        s = {
-            "invites_applied": 0,
-            "invite_seconds_applied": 0,
-            "role_bonuses_applied": 0,
-            "role_seconds_applied": 0,
-        }
-        user_stats[uid] = s
-    return s
-
-def msg_countdown(user: discord.Member, seconds_left: int) -> discord.Embed:
-    s = _get_user_stats(user.id)
-    inv_applied = int(s.get("invites_applied", 0))
-    inv_secs = int(s.get("invite_seconds_applied", 0))
-    role_applied = int(s.get("role_bonuses_applied", 0))
-    role_secs = int(s.get("role_seconds_applied", 0))
-    total_bonus = inv_secs + role_secs
-    desc = (
-        f"Active participant: {user.mention}\n"
-        f"⏳ Remaining: **{seconds_left}s**\n"
-        f"Reply to the pinned target message to take over."
+# Countdown embeds share everything but the description and field values, so a frame is
+# just the tuple of strings that change. Equal frames mean an identical payload, which
+# lets the renderer skip the edit without building an embed at all.
+CountdownFrame = Tuple[str, str, str, str]
+
+class CountdownTemplate:
+    def __init__(self):
+        self.reload()
+
+    def reload(self):
+        self._title = "Giveaway Countdown"
+        self._field_names = ("Invites Applied", "Role Bonuses Applied", "Total Bonus")
+
+    def frame(
+        self,
+        user: discord.Member,
+        seconds_left: int,
+        *,
+        until: Optional[dt.datetime] = None,
+        notice: Optional[str] = None,
+    ) -> CountdownFrame:
+        s = bonus_ledger.totals(user.id)
+        inv_secs = int(s.get("invite_seconds_applied", 0))
+        role_secs = int(s.get("role_seconds_applied", 0))
+        if until is not None:
+            # Native mode: Discord clients tick the relative timestamp themselves
+            remaining_line = f"⏳ Ends: **<t:{_unix_ts(until)}:R>**"
+        else:
+            remaining_line = f"⏳ Remaining: **{seconds_left}s**"
+        desc = (
+            f"Active participant: {user.mention}\n"
+            f"{remaining_line}\n"
+            f"Reply to the pinned target message to take over."
+        )
+        if notice:
+            desc += f"\n\n{notice}"
+        return (
+            desc,
+            f"{int(s.get('invites_applied', 0))} (−{inv_secs}s)",
+            f"{int(s.get('role_bonuses_applied', 0))} (−{role_secs}s)",
+            f"−{inv_secs + role_secs}s",
+        )
+
+    def render(self, frame: CountdownFrame) -> discord.Embed:
+        # Building through the public API is cheaper than copying a prebuilt embed
+        # (Embed.copy() round-trips through a dict), so only the strings are cached
+        fields = [(name, value, True) for name, value in zip(self._field_names, frame[1:])]
+        return make_embed(self._title, frame[0], fields=fields)
+
+countdown_template = CountdownTemplate()
+
+def msg_countdown(
+    user: discord.Member,
+    seconds_left: int,
+    *,
+    until: Optional[dt.datetime] = None,
+    notice: Optional[str] = None,
+) -> discord.Embed:
+    return countdown_template.render(
+        countdown_template.frame(user, seconds_left, until=until, notice=notice)
     )
-    fields = [
-        ("Invites Applied", f"{inv_applied} (−{inv_secs}s)", True),
-        ("Role Bonuses Applied", f"{role_applied} (−{role_secs}s)", True),
-        ("Total Bonus", f"−{total_bonus}s", True),
-    ]
-    return make_embed("Giveaway Countdown", desc, fields=fields)
 
 def msg_taken_over(new_user: discord.Member) -> discord.Embed:
     return make_embed(
@@ -230,16 +1293,40 @@ def msg_taken_over(new_user: discord.Member) -> discord.Embed:
         f"{new_user.mention} has taken over. Countdown restarted.",
     )
 
-def msg_deleted_non_reply() -> discord.Embed:
-    return make_embed(
+def takeover_notice(new_user: discord.Member, previous_user_id: Optional[int]) -> str:
+    # Folded into the countdown embed when takeovers edit in place
+    if previous_user_id and previous_user_id != new_user.id:
+        return f"🔄 {new_user.mention} took over from <@{previous_user_id}>. Countdown restarted."
+    return f"🔄 {new_user.mention} has taken over. Countdown restarted."
+
+# Static embeds are built once; they are shared, so callers must not mutate them
+static_embeds: Dict[str, discord.Embed] = {}
+
+def reload_templates():
+    # Rebuild every cached embed (call again after changing the message config)
+    static_embeds["deleted_non_reply"] = make_embed(
         "How To Participate",
         "Please reply to the pinned target message to participate.",
     )
+    static_embeds["quiet_hours"] = make_embed(
+        "ساعت سکوت | Quiet Hours",
+        f"🇮🇷 {QUIET_HOURS_MESSAGE_FA}\n\n🇬🇧 {QUIET_HOURS_MESSAGE_EN}",
+    )
+    static_embeds["registration_dm"] = make_embed(
+        "ثبت‌نام لازم است | Registration Required",
+        f"🇮🇷 {REGISTRATION_DM_MESSAGE_FA}\n\n🇬🇧 {REGISTRATION_DM_MESSAGE_EN}",
+    )
+    static_embeds["alert"] = make_embed(
+        "Countdown Alert",
+        f"Only **{ALERT_AT_SECONDS} seconds** left!",
+    )
+    countdown_template.reload()
+
+def msg_deleted_non_reply() -> discord.Embed:
+    return static_embeds["deleted_non_reply"]
 
 def msg_quiet_hours() -> discord.Embed:
-    title = "ساعت سکوت | Quiet Hours"
-    desc = f"🇮🇷 {QUIET_HOURS_MESSAGE_FA}\n\n🇬🇧 {QUIET_HOURS_MESSAGE_EN}"
-    return make_embed(title, desc)
+    return static_embeds["quiet_hours"]
 
 def msg_winner(user: discord.Member) -> discord.Embed:
     return make_embed(
@@ -248,163 +1335,1499 @@ def msg_winner(user: discord.Member) -> discord.Embed:
     )
 
 def msg_alert(seconds: int) -> discord.Embed:
+    if seconds == ALERT_AT_SECONDS:
+        return static_embeds["alert"]
     return make_embed(
         "Countdown Alert",
         f"Only **{seconds} seconds** left!",
     )
 
 def msg_registration_dm() -> discord.Embed:
-    title = "ثبت‌نام لازم است | Registration Required"
-    desc = f"🇮🇷 {REGISTRATION_DM_MESSAGE_FA}\n\n🇬🇧 {REGISTRATION_DM_MESSAGE_EN}"
-    return make_embed(title, desc)
+    return static_embeds["registration_dm"]
+
+def msg_leaderboard(rows: List[Tuple[int, int, int, int, int]], page: int, pages: int) -> discord.Embed:
+    # rows: (rank, inviter_id, joined, registered, bonuses); mentions in embeds never ping
+    lines = [
+        f"**#{rank}** <@{inviter_id}> — {joined} joined · {registered} registered · {bonuses} bonuses applied"
+        for rank, inviter_id, joined, registered, bonuses in rows
+    ]
+    emb = make_embed("Invite Leaderboard", "\n".join(lines) or "No invites recorded yet.")
+    emb.set_footer(text=f"Page {page}/{max(1, pages)}")
+    return emb
+
+def msg_status(
+    status: "SessionStatus",
+    now: dt.datetime,
+    totals: Dict[str, int],
+    credits: int,
+    internals: Optional[Dict[str, Dict]] = None,
+) -> discord.Embed:
+    # Built from the snapshot alone: mentions, not member lookups
+    if status.user_id is not None and status.until is not None:
+        remaining = max(0.0, (status.until - now).total_seconds())
+        turn = status.turn_started_at
+        desc = (
+            f"Active participant: <@{status.user_id}>\n"
+            f"⏳ Remaining: **{remaining:.1f}s** (ends <t:{_unix_ts(status.until)}:T>)\n"
+            f"Turn bonuses: {status.turn_bonuses} (−{status.turn_bonus_seconds}s)"
+            + (f", held since <t:{_unix_ts(turn)}:R>" if turn else "")
+        )
+    elif status.winner_id is not None:
+        desc = f"Winner: <@{status.winner_id}>"
+    else:
+        desc = "No active participant."
+    desc += f"\nChannel: {'🔒 locked' if status.locked else '🔓 open'}"
+    emb = make_embed("Giveaway Status", desc)
+    if status.user_id is not None:
+        emb.add_field(
+            name="Bonuses Applied",
+            value=(
+                f"{int(totals.get('invites_applied', 0))} invites (−{int(totals.get('invite_seconds_applied', 0))}s) · "
+                f"{int(totals.get('role_bonuses_applied', 0))} roles (−{int(totals.get('role_seconds_applied', 0))}s) · "
+                f"{credits} carried over"
+            ),
+            inline=False,
+        )
+    history = [f"<@{user_id}> <t:{_unix_ts(at)}:R>" for user_id, at in status.history]
+    emb.add_field(
+        name=f"Recent Takeovers ({status.takeovers} total)",
+        value="\n".join(history) or "None yet.",
+        inline=False,
+    )
+    if internals is not None:
+        for name, values in internals.items():
+            emb.add_field(
+                name=name,
+                value="```" + "\n".join(
+                    f"{key}={round(value, 3) if isinstance(value, float) else value}"
+                    for key, value in values.items()
+                ) + "```",
+                inline=True,
+            )
+    emb.set_footer(text=f"Snapshot v{status.version}")
+    return emb
+
+reload_templates()
+
+# ---------------- Clock ----------------
+# Wall-clock source for deadlines, quiet hours, bonuses and bulk-delete age checks.
+# Durations come from the event loop's clock; simulate.py swaps in a LoopClock on a
+# virtual-time loop so both advance together without real waiting.
+class SystemClock:
+    def utcnow(self) -> dt.datetime:
+        return dt.datetime.utcnow()
+
+class LoopClock:
+    # Naive UTC that advances with loop.time(), starting at `start`
+    def __init__(self, loop: asyncio.AbstractEventLoop, start: dt.datetime):
+        self._loop = loop
+        self._start = start
+        self._origin = loop.time()
+
+    def utcnow(self) -> dt.datetime:
+        return self._start + dt.timedelta(seconds=self._loop.time() - self._origin)
+
+clock = SystemClock()
+
+def set_clock(new_clock):
+    global clock
+    clock = new_clock
+
+def _now_utc_naive() -> dt.datetime:
+    return clock.utcnow()
 
 # ---------------- Helpers ----------------
 def _parse_hhmm(s: str) -> dt.time:
     hh, mm = s.strip().split(":")
     return dt.time(int(hh), int(mm), 0)
 
-Q_START = _parse_hhmm(QUIET_START)
-Q_END   = _parse_hhmm(QUIET_END)
+QuietWindow = Tuple[dt.time, dt.time]
+
+def _parse_quiet_windows(spec: str) -> Dict[int, List[QuietWindow]]:
+    # "role=HH:MM-HH:MM,HH:MM-HH:MM;role=..." -> {role_id: [(start, end), ...]}
+    windows: Dict[int, List[QuietWindow]] = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        role, _, ranges = entry.partition("=")
+        for window in filter(None, (part.strip() for part in ranges.split(","))):
+            start, _, end = window.partition("-")
+            windows.setdefault(int(role), []).append((_parse_hhmm(start), _parse_hhmm(end)))
+    return windows
+
+# Quiet windows are local times in TIMEZONE. The schedule turns them into UTC spans for
+# the surrounding days (DST-aware) and caches which roles are quiet until the next
+# boundary, so a per-message check is a comparison and a set lookup.
+class QuietSchedule:
+    def __init__(self, windows: Dict[int, List[QuietWindow]], tz: dt.tzinfo):
+        self.windows = windows
+        self.tz = tz
+        self._active: frozenset = frozenset()
+        self._valid_from = dt.datetime.max
+        self._valid_until = dt.datetime.min
+        self.recomputes = 0
+
+    def _to_utc(self, day: dt.date, at: dt.time) -> dt.datetime:
+        local = self.tz.localize(dt.datetime.combine(day, at))
+        return local.astimezone(pytz.utc).replace(tzinfo=None)
+
+    def _spans(self, now: dt.datetime) -> List[Tuple[int, dt.datetime, dt.datetime]]:
+        today = pytz.utc.localize(now).astimezone(self.tz).date()
+        spans = []
+        for offset in (-1, 0, 1, 2):
+            day = today + dt.timedelta(days=offset)
+            for role_id, windows in self.windows.items():
+                for start, end in windows:
+                    # end <= start crosses midnight (equal means the whole day)
+                    end_day = day if start < end else day + dt.timedelta(days=1)
+                    spans.append((role_id, self._to_utc(day, start), self._to_utc(end_day, end)))
+        return spans
+
+    def _recompute(self, now: dt.datetime):
+        self.recomputes += 1
+        spans = self._spans(now)
+        self._active = frozenset(role_id for role_id, start, end in spans if start <= now < end)
+        boundaries = [t for _, start, end in spans for t in (start, end)]
+        self._valid_from = max((t for t in boundaries if t <= now), default=now)
+        self._valid_until = min((t for t in boundaries if t > now), default=now + dt.timedelta(days=1))
+
+    def active_roles(self, now: Optional[dt.datetime] = None) -> frozenset:
+        now = now or _now_utc_naive()
+        if not self._valid_from <= now < self._valid_until:
+            self._recompute(now)
+        return self._active
+
+    def next_transition(self, now: Optional[dt.datetime] = None) -> dt.datetime:
+        now = now or _now_utc_naive()
+        self.active_roles(now)
+        return self._valid_until
+
+QUIET_WINDOWS_BY_ROLE = _parse_quiet_windows(QUIET_WINDOWS)
+QUIET_ROLE_IDS.update(QUIET_WINDOWS_BY_ROLE)
+quiet_schedule = QuietSchedule(
+    {
+        role_id: QUIET_WINDOWS_BY_ROLE.get(role_id, [(_parse_hhmm(QUIET_START), _parse_hhmm(QUIET_END))])
+        for role_id in QUIET_ROLE_IDS
+    },
+    pytz.timezone(TIMEZONE),
+)
 
 def in_quiet_hours(now: Optional[dt.datetime] = None) -> bool:
-    now = now or dt.datetime.utcnow()
-    t = now.time()
-    if Q_START < Q_END:
-        return Q_START <= t < Q_END
-    else:
-        # crosses midnight (e.g., 23:00 -> 07:00)
-        return t >= Q_START or t < Q_END
+    # Any quiet role's window is open
+    return bool(quiet_schedule.active_roles(now))
+
+def quiet_muted(member: discord.Member, now: Optional[dt.datetime] = None) -> bool:
+    return any(member.get_role(role_id) for role_id in quiet_schedule.active_roles(now))
+
+def _unix_ts(when: dt.datetime) -> int:
+    # Runtime datetimes are naive UTC
+    return int(when.replace(tzinfo=dt.timezone.utc).timestamp())
+
+# Member classification bitflags, computed once per member from role IDs
+ROLE_FLAG_ADMIN = 1
+ROLE_FLAG_QUIET = 2
+ROLE_FLAG_PARTICIPANT = 4
+
+def classify_member(member: discord.Member) -> int:
+    flags = 0
+    if member.guild_permissions.administrator or any(member.get_role(rid) for rid in ADMIN_ROLE_IDS):
+        flags |= ROLE_FLAG_ADMIN
+    if any(member.get_role(rid) for rid in QUIET_ROLE_IDS):
+        flags |= ROLE_FLAG_QUIET
+    if not PARTICIPANT_ROLE_IDS or any(member.get_role(rid) for rid in PARTICIPANT_ROLE_IDS):
+        flags |= ROLE_FLAG_PARTICIPANT
+    return flags
+
+# LRU of (guild_id, member_id) -> classification flags. Entries are only dropped on
+# role changes (on_member_update), role deletions/permission edits, eviction here or
+# eviction from the member cache.
+class RoleClassCache:
+    def __init__(self, *, size: int):
+        self._size = max(1, size)
+        self._flags: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        # guild_id -> (@everyone is admin, IDs of roles granting admin) for raw payloads
+        self._admin_roles: Dict[int, Tuple[bool, FrozenSet[str]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def flags(self, member: discord.Member) -> int:
+        key = (member.guild.id, member.id)
+        flags = self._flags.get(key)
+        if flags is not None:
+            self.hits += 1
+            self._flags.move_to_end(key)
+            return flags
+        self.misses += 1
+        flags = classify_member(member)
+        self._flags[key] = flags
+        if len(self._flags) > self._size:
+            self._flags.popitem(last=False)
+        return flags
+
+    def invalidate(self, member: discord.Member):
+        self._flags.pop((member.guild.id, member.id), None)
+
+    def clear_guild(self, guild_id: int):
+        for key in [key for key in self._flags if key[0] == guild_id]:
+            del self._flags[key]
+        self._admin_roles.pop(guild_id, None)
+
+    def admin_roles(self, guild: discord.Guild) -> Tuple[bool, FrozenSet[str]]:
+        # Role IDs as they appear in gateway payloads: configured admin roles plus every
+        # role with the Administrator permission
+        entry = self._admin_roles.get(guild.id)
+        if entry is None:
+            keys = {str(role_id) for role_id in ADMIN_ROLE_IDS}
+            keys.update(str(role.id) for role in guild.roles if role.permissions.administrator)
+            entry = self._admin_roles[guild.id] = (guild.default_role.permissions.administrator, frozenset(keys))
+        return entry
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._flags),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+role_cache = RoleClassCache(size=ROLE_CACHE_SIZE)
 
 def is_admin(member: discord.Member) -> bool:
-    if member.guild_permissions.administrator:
-        return True
-    return any(r.id in ADMIN_ROLE_IDS for r in member.roles)
+    return bool(role_cache.flags(member) & ROLE_FLAG_ADMIN)
 
 def has_quiet_role(member: discord.Member) -> bool:
-    return any(r.id in QUIET_ROLE_IDS for r in member.roles)
+    return bool(role_cache.flags(member) & ROLE_FLAG_QUIET)
 
 def has_participant_role(member: discord.Member) -> bool:
-    if not PARTICIPANT_ROLE_IDS:
-        return True
-    return any(r.id in PARTICIPANT_ROLE_IDS for r in member.roles)
+    return bool(role_cache.flags(member) & ROLE_FLAG_PARTICIPANT)
+
+# ---------------- Member Cache ----------------
+# Lookups of participants, inviters and invitees go through here. In lean mode
+# discord.py only caches joins and the members put here: an LRU of MEMBER_CACHE_SIZE
+# decides who stays resident (and so keeps receiving on_member_update), and whatever
+# else the library picked up is trimmed once the guild cache outgrows it. Invitees
+# still owed a role bonus are never evicted: their role grant arrives as that update.
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak; KiB on Linux
+
+# discord.py has no public API to add members to or drop them from a guild's cache: the
+# private calls are kept here, and degrade to a full cache if the library changes them
+def _resident(guild: discord.Guild) -> Dict[int, discord.Member]:
+    return getattr(guild, "_members", {})
+
+def _cache_member(guild: discord.Guild, member: discord.Member):
+    add = getattr(guild, "_add_member", None)
+    if add is not None:
+        add(member)
+
+def _uncache_member(guild: discord.Guild, member: discord.Member) -> bool:
+    remove = getattr(guild, "_remove_member", None)
+    if remove is None:
+        return False
+    remove(member)
+    return True
+
+def _awaiting_role_bonus(member_id: int) -> bool:
+    info = referral_map.get(member_id)
+    return info is not None and not info.get("role_bonus_applied")
+
+class MemberCache:
+    def __init__(self, *, size: int, lean: bool):
+        self._size = max(1, size)
+        self.lean = lean
+        self._lru: "OrderedDict[Tuple[int, int], discord.Member]" = OrderedDict()
+        self._guilds: Dict[int, discord.Guild] = {}
+        # guild_id -> resident count the last trim left (pinned invitees stay), so a guild
+        # with many of them is not trimmed again on every touch
+        self._trimmed_to: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.fetch_failures = 0
+        self.evictions = 0
+        self.trimmed = 0
+        self.pinned = 0
+
+    def get(self, guild: discord.Guild, member_id: int) -> Optional[discord.Member]:
+        member = guild.get_member(member_id)
+        if member is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(member)
+        return member
+
+    async def fetch(self, guild: discord.Guild, member_id: int) -> Optional[discord.Member]:
+        member = self.get(guild, member_id)
+        if member is not None:
+            return member
+        self.fetches += 1
+        try:
+            member = await guild.fetch_member(member_id)
+        except discord.HTTPException:
+            self.fetch_failures += 1
+            return None
+        self.keep(member)
+        return member
+
+    def keep(self, member: discord.Member):
+        # Make (or keep) a member resident
+        if self.lean and member.guild.get_member(member.id) is None:
+            _cache_member(member.guild, member)
+        self._touch(member)
+
+    def forget(self, member: discord.Member):
+        self._lru.pop((member.guild.id, member.id), None)
+
+    async def warm(self, guild: discord.Guild, member_ids: List[int]):
+        # Lean mode: bring members we expect updates for back after a restart (one
+        # gateway request per 100 IDs instead of a REST call each)
+        missing = [member_id for member_id in member_ids if guild.get_member(member_id) is None]
+        for start in range(0, len(missing), 100):
+            try:
+                members = await guild.query_members(user_ids=missing[start:start + 100], cache=False)
+            except (asyncio.TimeoutError, discord.ClientException):
+                break
+            for member in members:
+                self.keep(member)
+
+    def _touch(self, member: discord.Member):
+        if not self.lean:
+            return
+        guild = member.guild
+        key = (guild.id, member.id)
+        self._lru[key] = member
+        self._lru.move_to_end(key)
+        self._guilds[guild.id] = guild
+        while len(self._lru) > self._size:
+            (guild_id, member_id), evicted = self._lru.popitem(last=False)
+            if member_id == getattr(bot.user, "id", None) or _awaiting_role_bonus(member_id):
+                self.pinned += 1  # leaves the LRU, stays resident
+                continue
+            self.evictions += 1
+            _uncache_member(self._guilds[guild_id], evicted)
+            role_cache.invalidate(evicted)  # no on_member_update reaches it from here on
+        if len(_resident(guild)) > max(self._size * 2, self._trimmed_to.get(guild.id, 0) + self._size):
+            self._trim(guild)
+
+    def _trim(self, guild: discord.Guild):
+        keep = {member_id for guild_id, member_id in self._lru if guild_id == guild.id}
+        keep.add(getattr(bot.user, "id", None))
+        for member in [m for m in _resident(guild).values() if m.id not in keep]:
+            if _awaiting_role_bonus(member.id):
+                continue
+            if not _uncache_member(guild, member):
+                break
+            role_cache.invalidate(member)
+            self.trimmed += 1
+        self._trimmed_to[guild.id] = len(_resident(guild))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "mode_lean": int(self.lean),
+            "lru_entries": len(self._lru),
+            "resident_members": sum(len(guild.members) for guild in bot.guilds),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "fetches": self.fetches,
+            "fetch_failures": self.fetch_failures,
+            "evictions": self.evictions,
+            "trimmed": self.trimmed,
+            "pinned": self.pinned,
+            "rss_mb": round(_rss_bytes() / (1024 * 1024), 1),
+        }
+
+member_cache = MemberCache(size=MEMBER_CACHE_SIZE, lean=MEMBER_CACHE_MODE == "lean")
+
+# ---------------- Countdown Rendering ----------------
+# Owns the countdown message: callers submit frames without awaiting the REST call.
+# Only the newest pending frame is kept, sends are paced to the channel edit budget,
+# and a frame that would already be outdated once the budget allows it is dropped.
+class CountdownRenderer:
+    def __init__(self, *, limit: int, window: float, on_lost: Optional[Callable[[], None]] = None):
+        self._limit = max(1, limit)
+        self._window = max(0.0, window)
+        self._on_lost = on_lost
+        self._message: Optional[discord.Message] = None
+        self._pending: Optional[Dict] = None
+        self._last_key = None
+        self._wakeup = asyncio.Event()
+        self._sent_at: Deque[float] = deque(maxlen=self._limit)
+        self._blocked_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.edits_sent = 0
+        self.edits_merged = 0
+        self.edits_stale = 0
+        self.edits_identical = 0
+        self.edits_failed = 0
+
+    @property
+    def message(self) -> Optional[discord.Message]:
+        return self._message
+
+    def attach(self, message: discord.Message, *, key=None):
+        # key describes what the message currently shows, if known
+        self._message = message
+        self._pending = None
+        self._last_key = key
+
+    def detach(self):
+        self._message = None
+        if self._pending is not None:
+            self.edits_merged += 1
+        self._pending = None
+
+    def close(self):
+        self.detach()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def submit(
+        self,
+        build: Callable[[], discord.Embed],
+        *,
+        expires_at: Optional[float] = None,
+        key=None,
+    ):
+        # key identifies the payload build() renders; equal keys are never sent twice
+        if self._message is None:
+            return
+        if self._pending is not None:
+            self.edits_merged += 1
+        elif key is not None and key == self._last_key:
+            self.edits_identical += 1
+            return
+        self._pending = {"build": build, "expires_at": expires_at, "key": key}
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "edits_sent": self.edits_sent,
+            "edits_skipped": self.edits_merged + self.edits_stale + self.edits_identical,
+            "edits_merged": self.edits_merged,
+            "edits_stale": self.edits_stale,
+            "edits_identical": self.edits_identical,
+            "edits_failed": self.edits_failed,
+        }
+
+    def _next_slot(self, now: float) -> float:
+        slot = self._blocked_until
+        if len(self._sent_at) >= self._limit:
+            slot = max(slot, self._sent_at[0] + self._window)
+        return max(slot, now)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._pending is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = loop.time()
+            slot = self._next_slot(now)
+            if slot > now:
+                await asyncio.sleep(slot - now)
+                continue  # a newer frame may have replaced the pending one
+            frame, self._pending = self._pending, None
+            message = self._message
+            if message is None:
+                continue
+            if frame["expires_at"] is not None and frame["expires_at"] <= loop.time():
+                self.edits_stale += 1
+                continue
+            key = frame["key"]
+            if key is not None and key == self._last_key:
+                self.edits_identical += 1
+                continue
+            self._sent_at.append(loop.time())
+            self._last_key = None  # unknown until the edit lands
+            try:
+                await message.edit(embed=frame["build"]())
+            except discord.RateLimited as e:
+                self.edits_failed += 1
+                self._blocked_until = loop.time() + e.retry_after
+            except discord.NotFound:
+                # Deleted under us: let the owner post a fresh one
+                self.edits_failed += 1
+                if self._message is message:
+                    self._message = None
+                    if self._on_lost is not None:
+                        self._on_lost()
+            except (discord.HTTPException, discord.Forbidden):
+                self.edits_failed += 1
+            else:
+                self.edits_sent += 1
+                if self._message is message:
+                    self._last_key = key
+
+# ---------------- Countdown Engine ----------------
+# Deadline timer on the loop's monotonic clock. Instead of polling every TICK_RATE it
+# only asks to be woken for the next event that matters: a visible second change (live
+# rendering only), the alert threshold or the deadline. It does not sleep itself; the
+# shared TimerScheduler wakes it, and moving the deadline reschedules it.
+class CountdownEngine:
+    def __init__(
+        self,
+        *,
+        alert_at: int,
+        tick_rate: float,
+        live: bool,
+        on_tick: Callable[[], None],
+        on_alert: Callable[[], None],
+        on_expire: Callable[[], None],
+    ):
+        self._alert_at = alert_at
+        self._tick_rate = max(0.0, tick_rate)
+        self._live = live
+        self._on_tick = on_tick
+        self._on_alert = on_alert
+        self._on_expire = on_expire
+        self._deadline: Optional[float] = None
+        self._alert_pending = False
+        self._shown = 0
+        self._last_tick = 0.0
+        self._timer_token: Optional[int] = None
+        self.wakeups = 0
+        self.drift_samples = 0
+        self.drift_total = 0.0
+        self.drift_max = 0.0
+
+    def start(self, until: dt.datetime):
+        self._set(until)
+        # Only arm the alert when the threshold is still ahead of us
+        self._alert_pending = self._alert_at > 0 and self.remaining() > self._alert_at
+        timer_scheduler.schedule(self)
+
+    def set_deadline(self, until: dt.datetime):
+        self._set(until)
+        timer_scheduler.schedule(self)
+
+    def stop(self):
+        self._deadline = None
+        timer_scheduler.schedule(self)
+
+    def _set(self, until: dt.datetime):
+        loop = asyncio.get_running_loop()
+        self._deadline = loop.time() + (until - _now_utc_naive()).total_seconds()
+        self._shown = math.ceil(self.remaining())
+
+    def remaining(self) -> float:
+        if self._deadline is None:
+            return 0.0
+        return max(0.0, self._deadline - asyncio.get_running_loop().time())
+
+    def stats(self) -> Dict[str, float]:
+        mean = self.drift_total / self.drift_samples if self.drift_samples else 0.0
+        return {
+            "wakeups": self.wakeups,
+            "drift_samples": self.drift_samples,
+            "drift_mean_ms": round(mean * 1000, 3),
+            "drift_max_ms": round(self.drift_max * 1000, 3),
+        }
+
+    def next_wakeup(self) -> Optional[float]:
+        if self._deadline is None:
+            return None
+        return self._next_event()[0]
+
+    def _next_event(self) -> Tuple[float, str]:
+        when, kind = self._deadline, "expire"
+        if self._alert_pending:
+            alert_at = self._deadline - self._alert_at
+            if alert_at < when:
+                when, kind = alert_at, "alert"
+        if self._live and self._shown > 1:
+            # The displayed (rounded-up) second changes once remaining reaches shown - 1
+            tick_at = max(self._deadline - (self._shown - 1), self._last_tick + self._tick_rate)
+            if tick_at < when:
+                when, kind = tick_at, "tick"
+        return when, kind
+
+    def fire(self, now: float, scheduled: float):
+        drift = max(0.0, now - scheduled)
+        self.wakeups += 1
+        self.drift_samples += 1
+        self.drift_total += drift
+        self.drift_max = max(self.drift_max, drift)
+        # Handle everything that became due, in order (e.g. alert and tick together)
+        while self._deadline is not None:
+            when, kind = self._next_event()
+            if when > now:
+                return
+            if kind == "alert":
+                self._alert_pending = False
+                self._on_alert()
+            elif kind == "tick":
+                self._last_tick = now
+                self._shown = math.ceil(self.remaining())
+                self._on_tick()
+            else:
+                self._deadline = None
+                self._on_expire()
+
+# One task drives every session's countdown: engines sit in a heap ordered by their
+# next wakeup, so hosting many concurrent giveaways costs a single sleeping task.
+# Rescheduling pushes a fresh entry; superseded entries are skipped when popped.
+class TimerScheduler:
+    def __init__(self):
+        self._heap: List[Tuple[float, int, CountdownEngine]] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.fired = 0
+        self.stale_skipped = 0
+        self.drift_total = 0.0
+        self.drift_max = 0.0
+
+    def schedule(self, engine: CountdownEngine):
+        when = engine.next_wakeup()
+        token = next(self._counter)
+        engine._timer_token = token
+        if when is None:
+            return
+        heapq.heappush(self._heap, (when, token, engine))
+        if self._heap[0][1] == token:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stats(self) -> Dict[str, float]:
+        mean = self.drift_total / self.fired if self.fired else 0.0
+        return {
+            "heap_size": len(self._heap),
+            "fired": self.fired,
+            "stale_skipped": self.stale_skipped,
+            "drift_mean_ms": round(mean * 1000, 3),
+            "drift_max_ms": round(self.drift_max * 1000, 3),
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while self._heap and self._heap[0][2]._timer_token != self._heap[0][1]:
+                heapq.heappop(self._heap)
+                self.stale_skipped += 1
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            when = self._heap[0][0]
+            now = loop.time()
+            if when > now:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), when - now)
+                continue
+            _, _, engine = heapq.heappop(self._heap)
+            engine._timer_token = None
+            self.fired += 1
+            drift = max(0.0, now - when)
+            self.drift_total += drift
+            self.drift_max = max(self.drift_max, drift)
+            metrics.observe("giveaway_countdown_drift_seconds", drift)
+            try:
+                engine.fire(now, when)
+            except Exception as e:
+                print(f"[{BRAND}] Countdown timer callback failed: {e!r}")
+            if engine._timer_token is None:
+                self.schedule(engine)
+
+timer_scheduler = TimerScheduler()
+
+# ---------------- Message Handles ----------------
+# Handles for messages the bot only needs to reply to, edit or delete (the target and
+# countdown messages). get_partial_message costs no REST call; handles are dropped on
+# raw edit/delete events and deleted IDs are remembered so they are not used again.
+class MessageHandleCache:
+    def __init__(self, *, size: int):
+        self._size = max(1, size)
+        self._handles: "OrderedDict[int, discord.abc.Snowflake]" = OrderedDict()
+        self._deleted: "OrderedDict[int, None]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, channel: discord.TextChannel, message_id: int):
+        if message_id in self._deleted:
+            return None
+        handle = self._handles.get(message_id)
+        if handle is not None:
+            self.hits += 1
+            self._handles.move_to_end(message_id)
+            return handle
+        self.misses += 1
+        handle = channel.get_partial_message(message_id)
+        self._remember(self._handles, message_id, handle)
+        return handle
+
+    def invalidate(self, message_id: int, *, deleted: bool = False):
+        if self._handles.pop(message_id, None) is not None:
+            self.invalidations += 1
+        if deleted:
+            self._remember(self._deleted, message_id, None)
+
+    def is_deleted(self, message_id: int) -> bool:
+        return message_id in self._deleted
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._handles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "known_deleted": len(self._deleted),
+        }
+
+    def _remember(self, store: OrderedDict, key: int, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self._size:
+            store.popitem(last=False)
+
+message_handles = MessageHandleCache(size=1024)
+
+# ---------------- Message Ingest ----------------
+# Single-consumer, gateway-ordered queue per giveaway channel. Handlers only enqueue;
+# the consumer drains whatever arrived within a short window as one burst, so racing
+# replies resolve deterministically to the last one instead of fighting over the session.
+class ChannelIngest:
+    def __init__(self, session: "GiveawaySession", *, window: float):
+        self._session = session
+        self._window = max(0.0, window)
+        self._queue: Deque[Tuple[float, discord.Message]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.messages = 0
+        self.batches = 0
+        self.burst_max = 0
+        self.last_burst = 0
+        self.takeovers_collapsed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def put(self, message: discord.Message):
+        self._queue.append((asyncio.get_running_loop().time(), message))
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def close(self):
+        # Queued messages are dropped with the session
+        self._queue.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": len(self._queue),
+            "messages": self.messages,
+            "batches": self.batches,
+            "burst_mean": round(self.messages / self.batches, 3) if self.batches else 0.0,
+            "burst_max": self.burst_max,
+            "last_burst": self.last_burst,
+            "takeovers_collapsed": self.takeovers_collapsed,
+            "latency_mean_ms": round(self.latency_total / self.messages * 1000, 3) if self.messages else 0.0,
+            "latency_max_ms": round(self.latency_max * 1000, 3),
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if self._window:
+                await asyncio.sleep(self._window)
+            batch = list(self._queue)
+            self._queue.clear()
+            now = loop.time()
+            for queued_at, _ in batch:
+                latency = now - queued_at
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+            self.messages += len(batch)
+            self.batches += 1
+            self.last_burst = len(batch)
+            self.burst_max = max(self.burst_max, len(batch))
+            try:
+                candidates = await process_ingest_batch(self._session, [message for _, message in batch])
+            except Exception as e:
+                print(f"[{BRAND}] Message batch failed in {self._session.key}: {e!r}")
+            else:
+                self.takeovers_collapsed += max(0, candidates - 1)
+
+# ---------------- Giveaway Sessions ----------------
+# Takeovers listed by /giveaway status
+STATUS_HISTORY = 5
+
+# What /giveaway status shows, as of the last journaled change of the session. Never
+# mutated: publish() builds the next one and swaps it in with a single assignment, so
+# a reader always sees one consistent state, whatever is in flight.
+class SessionStatus(NamedTuple):
+    version: int
+    published_at: Optional[dt.datetime]
+    user_id: Optional[int]
+    until: Optional[dt.datetime]
+    turn_started_at: Optional[dt.datetime]
+    turn_bonus_seconds: int
+    turn_bonuses: int
+    locked: bool
+    winner_id: Optional[int]
+    countdown_msg_id: Optional[int]
+    takeovers: int
+    history: Tuple[Tuple[int, dt.datetime], ...]  # (user_id, at), newest first
+
+# One giveaway per (guild, channel, target message). Each session owns its runtime
+# state, countdown renderer (edit budgets are per channel) and countdown engine.
+class GiveawaySession:
+    def __init__(self, *, guild_id: int, channel_id: int, target_message_id: int, locked: bool = False):
+        self.key = session_key(channel_id, target_message_id)
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.target_message_id = target_message_id
+        self.channel: Optional[discord.TextChannel] = None
+        self.locked = locked
+        self.user_id: Optional[int] = None
+        self.participant: Optional[discord.Member] = None
+        self.until: Optional[dt.datetime] = None
+        self.source_msg_id: Optional[int] = None  # the user's replied message id (should be the target, sanity)
+        self.countdown_msg: Optional[discord.Message] = None
+        self.countdown_msg_id: Optional[int] = None
+        self.reposting = False
+        self.notice: Optional[str] = None
+        self.restored = False
+        self.stored: Optional[Dict] = None  # active state read at startup, taken by recover_session()
+        self.ingest = ChannelIngest(self, window=INGEST_BATCH_WINDOW)
+        self.renderer = CountdownRenderer(
+            limit=EDIT_RATE_LIMIT,
+            window=EDIT_RATE_WINDOW,
+            on_lost=lambda: _spawn(repost_countdown(self)),
+        )
+        self.timer = CountdownEngine(
+            alert_at=ALERT_AT_SECONDS,
+            tick_rate=TICK_RATE,
+            live=COUNTDOWN_RENDER_MODE != "native",
+            on_tick=lambda: on_countdown_tick(self),
+            on_alert=lambda: _spawn(send_countdown_alert(self)),
+            on_expire=lambda: _spawn(declare_winner(self)),
+        )
+        self.status = SessionStatus(0, None, None, None, None, 0, 0, locked, None, None, 0, ())
+
+    def publish(self, kind: str, data: Dict):
+        # Fold one journaled event into a new status snapshot
+        prev = self.status
+        now = _now_utc_naive()
+        turn_started_at, bonus_seconds, bonuses = prev.turn_started_at, prev.turn_bonus_seconds, prev.turn_bonuses
+        takeovers, history, winner_id = prev.takeovers, prev.history, prev.winner_id
+        if kind == "takeover":
+            turn_started_at, bonus_seconds, bonuses = now, 0, 0
+            takeovers += 1
+            history = ((self.user_id, now),) + history[:STATUS_HISTORY - 1]
+            winner_id = None
+        elif kind == "bonus":
+            bonus_seconds += int(data.get("seconds", 0))
+            bonuses += (
+                len(data.get("entries", ())) + len(data.get("redeemed", ())) + len(data.get("extended", ())) or 1
+            )
+        elif kind == "cleared":
+            turn_started_at, bonus_seconds, bonuses = None, 0, 0
+        elif kind == "winner":
+            winner_id = data.get("user_id")
+        elif kind == "recovered":
+            takeovers, history = data["takeovers"], data["history"]
+            turn_started_at = data["turn_started_at"]
+            bonus_seconds, bonuses = data["turn_bonus_seconds"], data["turn_bonuses"]
+        self.status = SessionStatus(
+            version=prev.version + 1,
+            published_at=now,
+            user_id=self.user_id,
+            until=self.until,
+            turn_started_at=turn_started_at,
+            turn_bonus_seconds=bonus_seconds,
+            turn_bonuses=bonuses,
+            locked=self.locked,
+            winner_id=winner_id,
+            countdown_msg_id=self.countdown_msg_id,
+            takeovers=takeovers,
+            history=history,
+        )
+
+    def is_active_for(self, user_id: int) -> bool:
+        return self.user_id == user_id and self.until is not None
+
+    def close(self):
+        # Stop the session's timer and background tasks once it is no longer hosted
+        self.timer.stop()
+        self.renderer.close()
+        self.ingest.close()
+
+# ---------------- Bonus Ledger ----------------
+# Every earned bonus is a ledger row. Rows for a user with a running countdown are
+# queued per session and applied together once the current loop iteration is done:
+# one deadline change, one render and one journal event per session, however many
+# joins or role grants landed. A bonus is one row however many of the user's countdowns
+# it shortens (the first applies it, the others extend it), and becomes a credit when
+# none is left to shorten. The per-user totals on the countdown are sums over the rows.
+class BonusLedger:
+    def __init__(self, store: StateStore, *, redeem: bool):
+        self._redeem = redeem
+        self._next_id = store.last_bonus_id() + 1
+        self._totals: Dict[int, Dict[str, int]] = store.load_bonus_totals()
+        # (guild_id, user_id) -> unspent credits, oldest first
+        self._credits: Dict[Tuple[int, int], List[Dict]] = {}
+        for entry in store.load_bonus_credits():
+            self._credits.setdefault((entry["guild_id"], entry["user_id"]), []).append(entry)
+        # session key -> (session, new rows, redeemed credits) awaiting the flush
+        self._batches: Dict[str, Tuple[GiveawaySession, List[Dict], List[Dict]]] = {}
+        self._unjournaled: List[Dict] = []  # new credits
+        self._flush_task: Optional[asyncio.Task] = None
+        self.earned = 0
+        self.applied = 0
+        self.extended = 0
+        self.carried = 0
+        self.redeemed = 0
+        self.batches = 0
+        self.seconds_applied = 0
+
+    def totals(self, user_id: int) -> Dict[str, int]:
+        return self._totals.get(user_id) or dict.fromkeys(USER_STAT_FIELDS, 0)
+
+    def applied_counts(self) -> Dict[int, int]:
+        # Applied bonuses per user (opening rows count as many as they summarise)
+        return {
+            user_id: totals["invites_applied"] + totals["role_bonuses_applied"]
+            for user_id, totals in self._totals.items()
+        }
+
+    def credits(self, guild_id: int, user_id: int) -> List[Dict]:
+        return list(self._credits.get((guild_id, user_id), ()))
+
+    def earn(self, guild_id: int, user_id: int, reason: str, seconds: int, *, invitee_id: Optional[int] = None):
+        if seconds <= 0:
+            return
+        self.earned += 1
+        entry = self._entry(guild_id, user_id, reason, seconds, invitee_id)
+        active = [session for session in active_sessions_for(guild_id, user_id) if not session.locked]
+        if not active:
+            self._carry(entry)
+        for session in active:
+            self._batch(session)[1].append(entry)
+        self._schedule()
+
+    def redeem(self, session: GiveawaySession):
+        # On a takeover: spend the new participant's credits on their countdown
+        if not self._redeem or session.user_id is None:
+            return
+        credits = self._credits.pop((session.guild_id, session.user_id), None)
+        if credits:
+            self._batch(session)[2].extend(credits)
+            self._schedule()
+
+    def _entry(self, guild_id: int, user_id: int, reason: str, seconds: int, invitee_id: Optional[int]) -> Dict:
+        entry = {
+            "id": self._next_id, "earned_at": _now_utc_naive().isoformat(), "guild_id": guild_id,
+            "user_id": user_id, "invitee_id": invitee_id, "reason": reason, "count": 1, "seconds": seconds,
+            "session_key": None, "applied_at": None,
+        }
+        self._next_id += 1
+        return entry
+
+    def _carry(self, entry: Dict):
+        self.carried += 1
+        self._credits.setdefault((entry["guild_id"], entry["user_id"]), []).append(entry)
+        self._unjournaled.append(entry)
+        self._schedule()
+
+    def _batch(self, session: GiveawaySession) -> Tuple[GiveawaySession, List[Dict], List[Dict]]:
+        batch = self._batches.get(session.key)
+        if batch is None or batch[0] is not session:
+            batch = self._batches[session.key] = (session, [], [])
+        return batch
+
+    def _schedule(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = _spawn(self._flush())
+
+    async def _flush(self):
+        # Loops until nothing is queued: rows queued meanwhile (e.g. carried over by this
+        # very flush) have no other flush scheduled
+        while self._unjournaled or self._batches:
+            # Credits are journaled first: a redeemed one must exist before it is applied
+            unjournaled, self._unjournaled = self._unjournaled, []
+            by_user: Dict[int, List[Dict]] = {}
+            for entry in unjournaled:
+                by_user.setdefault(entry["user_id"], []).append(entry)
+            for user_id, entries in by_user.items():
+                state_writer.record("credit", user_id=user_id, entries=[dict(entry) for entry in entries])
+            batches, self._batches = self._batches, {}
+            for session, entries, redeemed in batches.values():
+                await self._apply(session, entries, redeemed)
+            # The countdowns ended or changed hands before the batch landed
+            unapplied = {
+                entry["id"]: entry
+                for _, entries, _ in batches.values()
+                for entry in entries
+                if entry["applied_at"] is None
+            }
+            for entry in unapplied.values():
+                self._carry(entry)
+
+    async def _apply(self, session: GiveawaySession, entries: List[Dict], redeemed: List[Dict]):
+        rows = entries + redeemed
+        user_id = rows[0]["user_id"]
+        now = _now_utc_naive()
+        if (
+            sessions.get(session.channel_id) is not session
+            or session.locked
+            or session.user_id != user_id
+            or session.until is None
+            or session.until <= now
+        ):
+            # Left unapplied: carried over by _flush unless another countdown takes them
+            if redeemed:
+                key = (redeemed[0]["guild_id"], user_id)
+                self._credits[key] = redeemed + self._credits.get(key, [])
+            return
+        applied_at = now.isoformat()
+        fresh = [entry for entry in entries if entry["applied_at"] is None]
+        extended = [entry for entry in entries if entry["applied_at"] is not None]
+        for entry in fresh + redeemed:
+            entry["session_key"] = session.key
+            entry["applied_at"] = applied_at
+            count_field, seconds_field = BONUS_STAT_FIELDS[entry["reason"]]
+            totals = self._totals.setdefault(user_id, dict.fromkeys(USER_STAT_FIELDS, 0))
+            totals[count_field] += entry["count"]
+            totals[seconds_field] += entry["seconds"]
+        for entry in extended:
+            entry["session_key"] += f" {session.key}"
+        seconds = sum(entry["seconds"] for entry in rows)
+        self.applied += len(fresh)
+        self.extended += len(extended)
+        self.redeemed += len(redeemed)
+        referral_index.bonuses_applied(user_id, sum(entry["count"] for entry in fresh + redeemed))
+        self.batches += 1
+        self.seconds_applied += seconds
+        # Totals first: the countdown re-rendered by this shows them
+        await reduce_active_time(
+            session,
+            seconds,
+            reason="+".join(sorted({entry["reason"] for entry in rows})),
+            entries=fresh,
+            redeemed=[entry["id"] for entry in redeemed],
+            extended=[entry["id"] for entry in extended],
+            applied_at=applied_at,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        applied_rows = self.applied + self.extended + self.redeemed
+        return {
+            "earned": self.earned,
+            "applied": self.applied,
+            "extended": self.extended,
+            "carried": self.carried,
+            "redeemed": self.redeemed,
+            "batches": self.batches,
+            "rows_per_batch": round(applied_rows / self.batches, 3) if self.batches else 0.0,
+            "seconds_applied": self.seconds_applied,
+            "credits_outstanding": sum(len(credits) for credits in self._credits.values()),
+            "credit_seconds_outstanding": sum(
+                entry["seconds"] for credits in self._credits.values() for entry in credits
+            ),
+        }
+
+# ---------------- Referral Index ----------------
+# Inviter-side view of referral_map with per-inviter aggregates (joined invitees, those
+# who gained a participant role, applied ledger bonuses), updated with every referral
+# write. The leaderboard is a list kept sorted by rank key and updated by bisection, so
+# a page is a slice and no query ever scans the referrals.
+class ReferralIndex:
+    def __init__(self, referrals: Dict[int, Dict], bonuses: Dict[int, int]):
+        self._invitees: Dict[int, Set[int]] = {}
+        # inviter_id -> [joined, registered, bonuses applied]
+        self._counts: Dict[int, List[int]] = {}
+        for invitee_id, info in referrals.items():
+            counts = self._counts.setdefault(info["inviter_id"], [0, 0, 0])
+            counts[0] += 1
+            counts[1] += int(bool(info.get("role_bonus_applied")))
+            self._invitees.setdefault(info["inviter_id"], set()).add(invitee_id)
+        for inviter_id, count in bonuses.items():
+            self._counts.setdefault(inviter_id, [0, 0, 0])[2] += count
+        self._ranking: List[Tuple[int, int, int, int]] = sorted(
+            self._rank_key(inviter_id, counts) for inviter_id, counts in self._counts.items()
+        )
+        self.updates = 0
+
+    @staticmethod
+    def _rank_key(inviter_id: int, counts: List[int]) -> Tuple[int, int, int, int]:
+        # Most joins first, then registrations, then bonuses; ties by ID
+        return (-counts[0], -counts[1], -counts[2], inviter_id)
+
+    def referred(self, invitee_id: int, inviter_id: int, previous: Optional[Dict]):
+        # Called after referral_map[invitee_id] was (re)written; previous is the old entry
+        if previous is not None:
+            self._update(previous["inviter_id"], -1, -int(bool(previous.get("role_bonus_applied"))), 0)
+            self._invitees.get(previous["inviter_id"], set()).discard(invitee_id)
+        self._invitees.setdefault(inviter_id, set()).add(invitee_id)
+        self._update(inviter_id, 1, 0, 0)
+
+    def registered(self, inviter_id: int):
+        self._update(inviter_id, 0, 1, 0)
+
+    def bonuses_applied(self, inviter_id: int, count: int):
+        self._update(inviter_id, 0, 0, count)
+
+    def invitees(self, inviter_id: int) -> Set[int]:
+        return set(self._invitees.get(inviter_id, ()))
+
+    def counts(self, inviter_id: int) -> Dict[str, int]:
+        joined, registered, bonuses = self._counts.get(inviter_id, (0, 0, 0))
+        return {"joined": joined, "registered": registered, "bonuses_applied": bonuses}
+
+    def rank(self, inviter_id: int) -> Optional[int]:
+        counts = self._counts.get(inviter_id)
+        if counts is None:
+            return None
+        return bisect.bisect_left(self._ranking, self._rank_key(inviter_id, counts)) + 1
+
+    def page(self, index: int, size: int) -> Tuple[List[Tuple[int, int, int, int, int]], int, int]:
+        # Rows (rank, inviter_id, joined, registered, bonuses) of a 0-based page, clamped
+        # to the last one; returns (rows, page index, page count)
+        pages = -(-len(self._ranking) // size)
+        index = max(0, min(index, pages - 1))
+        start = index * size
+        rows = [
+            (start + offset + 1, key[3], -key[0], -key[1], -key[2])
+            for offset, key in enumerate(self._ranking[start:start + size])
+        ]
+        return rows, index, pages
+
+    def _update(self, inviter_id: int, joined: int, registered: int, bonuses: int):
+        counts = self._counts.get(inviter_id)
+        if counts is not None:
+            position = bisect.bisect_left(self._ranking, self._rank_key(inviter_id, counts))
+            del self._ranking[position]
+        else:
+            counts = self._counts[inviter_id] = [0, 0, 0]
+        counts[0] += joined
+        counts[1] += registered
+        counts[2] += bonuses
+        self.updates += 1
+        if any(counts):
+            bisect.insort(self._ranking, self._rank_key(inviter_id, counts))
+        else:
+            del self._counts[inviter_id]
+            self._invitees.pop(inviter_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "inviters": len(self._counts),
+            "referrals": sum(counts[0] for counts in self._counts.values()),
+            "updates": self.updates,
+        }
 
 # ---------------- Bot Setup ----------------
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+if MEMBER_CACHE_MODE == "lean":
+    # Joins stay cached (invitees need on_member_update); no startup chunking
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.joined = True
+bot = commands.Bot(
+    command_prefix="!",
+    intents=intents,
+    member_cache_flags=member_cache_flags,
+    chunk_guilds_at_startup=MEMBER_CACHE_MODE != "lean",
+    max_messages=None,  # nothing reads the message cache; deletes/edits use raw events
+    http_trace=rest_trace() if METRICS_ENABLED else None,
+)
 
-state_store = StateStore(STATE_DB_PATH)
+state_store = StateStore(STATE_DB_PATH, legacy_session=(CHANNEL_ID, TARGET_MESSAGE_ID))
+state_writer = StateWriter(
+    state_store,
+    interval=PERSIST_COMMIT_INTERVAL,
+    max_pending=PERSIST_MAX_PENDING,
+    compact_every=JOURNAL_COMPACT_EVENTS,
+    retention_days=JOURNAL_RETENTION_DAYS,
+)
 
 # Runtime state
-active_user_id: Optional[int] = None
-active_until: Optional[dt.datetime] = None
-active_countdown_msg: Optional[discord.Message] = None
-active_countdown_msg_id: Optional[int] = None
-active_source_msg_id: Optional[int] = None  # the user's replied message id (should be TARGET_MESSAGE_ID, sanity)
-countdown_task: Optional[asyncio.Task] = None
-channel_locked_forever: bool = state_store.load_channel_locked()
+sessions: Dict[int, GiveawaySession] = {}  # channel_id -> session
 notified_missing_role: Set[int] = set(state_store.load_notified_users())
-invite_uses: Dict[int, Dict[str, int]] = {}
 state_restored: bool = False
-referral_map: Dict[int, Dict] = {}
-user_stats: Dict[int, Dict] = {}
-
-def persist_active_state():
-    iso_until = active_until.isoformat() if active_until else None
-    state_store.save_active_state(
-        user_id=active_user_id,
-        active_until=iso_until,
-        source_msg_id=active_source_msg_id,
-        countdown_msg_id=active_countdown_msg_id,
+referral_map: Dict[int, Dict] = state_store.load_referrals()
+bonus_ledger = BonusLedger(state_store, redeem=BONUS_CARRYOVER == "redeem")
+referral_index = ReferralIndex(referral_map, bonus_ledger.applied_counts())
+
+_background_tasks: Set[asyncio.Task] = set()
+
+def _spawn(coro: Awaitable) -> asyncio.Task:
+    # Keep a strong reference so fire-and-forget tasks are not garbage collected
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def _component_stats():
+    yield "state_writer", {}, state_writer.stats()
+    yield "deletion_queue", {}, deletion_queue.stats()
+    yield "dm_dispatcher", {}, dm_dispatcher.stats()
+    yield "invite_attributor", {}, invite_attributor.stats()
+    yield "role_cache", {}, role_cache.stats()
+    yield "member_cache", {}, member_cache.stats()
+    yield "timer_scheduler", {}, timer_scheduler.stats()
+    yield "message_handles", {}, message_handles.stats()
+    yield "quiet_hours", {}, quiet_hours.stats()
+    yield "throttle", {}, message_throttle.stats()
+    yield "warnings", {}, warning_batcher.stats()
+    yield "gateway", {}, gateway_fast_path.stats()
+    yield "bonus_ledger", {}, bonus_ledger.stats()
+    yield "referral_index", {}, referral_index.stats()
+    yield "sessions", {}, {"hosted": len(sessions)}
+    for session in list(sessions.values()):
+        labels = {"session": session.key}
+        yield "renderer", labels, session.renderer.stats()
+        yield "ingest", labels, session.ingest.stats()
+        yield "countdown", labels, session.timer.stats()
+
+metrics.add_collector(_component_stats)
+metrics_runner: Optional[web.AppRunner] = None
+
+def add_session(guild_id: int, channel_id: int, target_message_id: int, *, locked: bool = False) -> GiveawaySession:
+    session = GiveawaySession(
+        guild_id=guild_id,
+        channel_id=channel_id,
+        target_message_id=target_message_id,
+        locked=locked,
+    )
+    sessions[channel_id] = session
+    return session
+
+def load_sessions():
+    # Runs at import, before the event loop, so the synchronous reads here cost nothing;
+    # everything the loop writes later goes through state_writer
+    for row in state_store.load_sessions():
+        session = add_session(row["guild_id"], row["channel_id"], row["target_message_id"], locked=row["locked"])
+        session.stored = state_store.load_active_state(row["key"])
+    # The env-configured giveaway is always hosted; a new TARGET_MESSAGE_ID for the same
+    # channel replaces the stored giveaway there, as it did before sessions were stored
+    if not (CHANNEL_ID and TARGET_MESSAGE_ID):
+        return
+    stored = sessions.get(CHANNEL_ID)
+    if stored is not None and stored.target_message_id != TARGET_MESSAGE_ID:
+        print(
+            f"[{BRAND}] TARGET_MESSAGE_ID changed for channel {CHANNEL_ID}: closing giveaway "
+            f"{stored.key}, hosting target {TARGET_MESSAGE_ID}"
+        )
+        del sessions[CHANNEL_ID]
+        stored.close()
+        state_writer.record("session_closed", stored.key, reason="env_target_changed")
+        stored = None
+    if stored is None:
+        session = add_session(GUILD_ID, CHANNEL_ID, TARGET_MESSAGE_ID)
+        state_writer.record(
+            "session_opened",
+            session.key,
+            guild_id=GUILD_ID,
+            channel_id=CHANNEL_ID,
+            target_message_id=TARGET_MESSAGE_ID,
+        )
+
+load_sessions()
+
+def active_sessions_for(guild_id: int, user_id: int) -> List[GiveawaySession]:
+    return [
+        session for session in sessions.values()
+        if session.guild_id in (0, guild_id) and session.is_active_for(user_id)
+    ]
+
+def persist_session(session: GiveawaySession):
+    state_writer.record(
+        "session_opened",
+        session.key,
+        guild_id=session.guild_id,
+        channel_id=session.channel_id,
+        target_message_id=session.target_message_id,
+    )
+
+def journal_session(session: GiveawaySession, kind: str, **data):
+    # Every journaled change of a session also refreshes its /giveaway status snapshot
+    state_writer.record(kind, session.key, **data)
+    session.publish(kind, data)
+
+def persist_active_state(session: GiveawaySession, kind: str, **details):
+    # Journal a change of the running countdown; kind is one of ACTIVE_STATE_EVENTS
+    if session.user_id is None or session.until is None:
+        journal_session(session, "cleared")
+        return
+    journal_session(
+        session,
+        kind,
+        user_id=session.user_id,
+        until=session.until.isoformat(),
+        source_msg_id=session.source_msg_id,
+        countdown_msg_id=session.countdown_msg_id,
+        **details,
     )
 
-def persist_notified_users():
-    state_store.save_notified_users(notified_missing_role)
+async def persisted() -> bool:
+    # Waits until the state writes so far are committed; False if the commit failed
+    # (the writer logs it and keeps the writes queued for retry)
+    try:
+        await state_writer.flush()
+    except sqlite3.Error:
+        return False
+    return True
+
+NOT_SAVED_NOTE = " Saving it to the state DB failed and is being retried; check the logs."
+
+def persist_notified_user(user_id: int):
+    state_writer.add_notified_user(user_id)
 
-def persist_user_stats():
-    state_store.save_user_stats(user_stats)
+def persist_referral(invitee_id: int):
+    info = referral_map[invitee_id]
+    state_writer.record(
+        "referral",
+        invitee_id=invitee_id,
+        inviter_id=int(info["inviter_id"]),
+        role_bonus_applied=bool(info.get("role_bonus_applied", False)),
+    )
 
-async def lock_channel_permanently(channel: discord.TextChannel):
-    global channel_locked_forever
+async def lock_channel_permanently(session: GiveawaySession, channel: discord.TextChannel):
     overwrites = channel.overwrites
     overwrites[channel.guild.default_role] = discord.PermissionOverwrite(send_messages=False)
     await channel.edit(overwrites=overwrites, reason=f"{BRAND} Giveaway: locked after winner declared")
-    channel_locked_forever = True
-    state_store.save_channel_locked(True)
-
-async def clear_active(skip_cancel: bool = False):
-    global active_user_id, active_until, active_countdown_msg, active_source_msg_id, countdown_task, active_countdown_msg_id
-    active_user_id = None
-    active_until = None
-    active_source_msg_id = None
-    active_countdown_msg_id = None
-    if active_countdown_msg:
-        with contextlib.suppress(discord.NotFound, discord.Forbidden):
-            await active_countdown_msg.delete()
-    active_countdown_msg = None
-    if countdown_task and not countdown_task.done():
-        if skip_cancel:
-            countdown_task = None
-        else:
-            countdown_task.cancel()
-            countdown_task = None
-    else:
-        countdown_task = None
-    state_store.clear_active_state()
+    session.locked = True
+    journal_session(session, "locked")
 
-def _now_utc_naive() -> dt.datetime:
-    return dt.datetime.utcnow()
+async def clear_active(session: GiveawaySession):
+    session.user_id = None
+    session.participant = None
+    session.notice = None
+    session.until = None
+    session.source_msg_id = None
+    session.countdown_msg_id = None
+    session.timer.stop()
+    session.renderer.detach()
+    if session.countdown_msg:
+        with contextlib.suppress(discord.HTTPException):
+            await session.countdown_msg.delete()
+    session.countdown_msg = None
+    journal_session(session, "cleared")
 
-async def reduce_active_time(inviter: discord.Member, seconds: int):
-    global active_until, active_countdown_msg
-    if seconds <= 0:
+def render_countdown(session: GiveawaySession):
+    # Queue a countdown frame; the renderer decides when (and whether) it is sent
+    participant, until = session.participant, session.until
+    if participant is None or until is None:
         return
+    if COUNTDOWN_RENDER_MODE == "native":
+        frame = countdown_template.frame(participant, 0, until=until, notice=session.notice)
+        session.renderer.submit(lambda: countdown_template.render(frame), key=frame)
+        return
+    delta = max(0.0, (until - _now_utc_naive()).total_seconds())
+    remaining = math.ceil(delta)
+    frame = countdown_template.frame(participant, remaining, notice=session.notice)
+    # The frame is outdated once the displayed second has passed
+    expires_at = asyncio.get_running_loop().time() + (delta - (remaining - 1))
+    session.renderer.submit(
+        lambda: countdown_template.render(frame),
+        expires_at=expires_at,
+        key=frame,
+    )
 
-    if active_user_id != inviter.id or not active_until:
+def on_countdown_tick(session: GiveawaySession):
+    # Update countdown message (native timestamps tick client-side)
+    render_countdown(session)
+
+async def send_countdown_alert(session: GiveawaySession):
+    # Fired as its own task so a slow send never delays the deadline
+    if session.channel is None:
         return
+    with contextlib.suppress(discord.Forbidden, discord.HTTPException):
+        await session.channel.send(content="@here", embed=msg_alert(ALERT_AT_SECONDS))
 
-    active_until -= dt.timedelta(seconds=seconds)
+# Backoff for the winner announcement and channel lock
+WINNER_RETRY_SECONDS = 5.0
+WINNER_RETRY_MAX_SECONDS = 300.0
 
-    now = _now_utc_naive()
-    if active_until < now:
-        active_until = now
+async def declare_winner(session: GiveawaySession):
+    participant, channel = session.participant, session.channel
+    if session.locked or participant is None or channel is None:
+        return
+    # Closed to takeovers and bonuses before the first await, so nothing re-arms the timer
+    session.locked = True
+    session.timer.stop()
+    session.renderer.detach()
+    # The deadline decided it: journal the winner first, then announce and lock, retrying
+    # until both went through (a restart before that resumes the expired countdown and
+    # declares the same winner again)
+    journal_session(session, "winner", user_id=participant.id)
+    announced = False
+    delay = WINNER_RETRY_SECONDS
+    while True:
+        try:
+            if not announced:
+                await channel.send(embed=msg_winner(participant))
+                announced = True
+            await lock_channel_permanently(session, channel)
+            break
+        except discord.HTTPException as e:
+            print(
+                f"[{BRAND}] Winner {'lock' if announced else 'announcement'} failed in {session.key}: "
+                f"{e}; retrying in {delay:.0f}s"
+            )
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WINNER_RETRY_MAX_SECONDS)
+        if sessions.get(session.channel_id) is not session:
+            return  # stopped meanwhile
+    await clear_active(session)
+    await persisted()
+    edits = session.renderer.stats()
+    timing = session.timer.stats()
+    print(
+        f"[{BRAND}] Countdown {session.key} edits: sent={edits['edits_sent']} "
+        f"skipped={edits['edits_skipped']} failed={edits['edits_failed']} | "
+        f"wakeups={timing['wakeups']} drift mean={timing['drift_mean_ms']}ms "
+        f"max={timing['drift_max_ms']}ms"
+    )
 
-    remaining = int((active_until - now).total_seconds())
+async def reduce_active_time(session: GiveawaySession, seconds: int, *, reason: str = "bonus", **details):
+    if seconds <= 0 or not session.until or session.locked:
+        return
 
-    if active_countdown_msg:
-        with contextlib.suppress(discord.HTTPException, discord.Forbidden):
-            await active_countdown_msg.edit(embed=msg_countdown(inviter, remaining))
+    now = _now_utc_naive()
+    if session.until <= now:
+        return  # already reached; the winner is being declared
 
-    persist_active_state()
+    session.until -= dt.timedelta(seconds=seconds)
+    if session.until < now:
+        session.until = now
 
-async def apply_invite_bonus(inviter: discord.Member, invite_count: int):
-    global active_user_id, active_until
-    if invite_count <= 0 or INVITE_BONUS_SECONDS <= 0:
-        return
-    seconds = INVITE_BONUS_SECONDS * invite_count
-    did_apply = active_user_id == inviter.id and active_until is not None
-    if did_apply:
-        await reduce_active_time(inviter, seconds)
-        s = _get_user_stats(inviter.id)
-        s["invites_applied"] = int(s.get("invites_applied", 0)) + invite_count
-        s["invite_seconds_applied"] = int(s.get("invite_seconds_applied", 0)) + seconds
-        persist_user_stats()
-
-async def apply_role_bonus(inviter: discord.Member):
-    global active_user_id, active_until
-    if INVITE_ROLE_BONUS_SECONDS <= 0:
-        return
-    did_apply = active_user_id == inviter.id and active_until is not None
-    if did_apply:
-        await reduce_active_time(inviter, INVITE_ROLE_BONUS_SECONDS)
-        s = _get_user_stats(inviter.id)
-        s["role_bonuses_applied"] = int(s.get("role_bonuses_applied", 0)) + 1
-        s["role_seconds_applied"] = int(s.get("role_seconds_applied", 0)) + INVITE_ROLE_BONUS_SECONDS
-        persist_user_stats()
+    session.timer.set_deadline(session.until)
+    render_countdown(session)
 
+    persist_active_state(session, "bonus", seconds=seconds, reason=reason, **details)
 
 async def start_countdown(
+    session: GiveawaySession,
     channel: discord.TextChannel,
     participant: discord.Member,
     reply_to: discord.Message,
@@ -412,137 +2835,234 @@ async def start_countdown(
     resume_until: Optional[dt.datetime] = None,
     existing_message: Optional[discord.Message] = None,
 ):
-    global active_user_id, active_until, active_countdown_msg, active_source_msg_id, countdown_task, active_countdown_msg_id
+    # In edit mode a takeover reuses the live countdown message: one (mergeable) edit
+    reuse_message = (
+        TAKEOVER_MODE == "edit"
+        and existing_message is None
+        and session.countdown_msg is not None
+        and session.renderer.message is not None
+    )
+    previous_user_id = session.user_id
+    if session.countdown_msg is None and session.countdown_msg_id and existing_message is None:
+        # Recovered from the journal but not restored yet: still ours to replace
+        session.countdown_msg = message_handles.get(channel, session.countdown_msg_id)
 
-    # Cancel previous
-    if countdown_task and not countdown_task.done():
-        countdown_task.cancel()
-    if (
-        active_countdown_msg
-        and (existing_message is None or active_countdown_msg.id != existing_message.id)
-    ):
-        with contextlib.suppress(discord.NotFound, discord.Forbidden):
-            await active_countdown_msg.delete()
+    # Cancel previous; if the message work below fails, the previous countdown goes on
+    previous = (
+        session.user_id,
+        session.participant,
+        session.until,
+        session.source_msg_id,
+        session.countdown_msg,
+        session.countdown_msg_id,
+    )
+    deleted = False
+    session.timer.stop()
+    try:
+        if (
+            not reuse_message
+            and session.countdown_msg
+            and (existing_message is None or session.countdown_msg.id != existing_message.id)
+        ):
+            session.renderer.detach()
+            # Forget the ID first so our own delete is not mistaken for a moderator's
+            session.countdown_msg_id = None
+            with contextlib.suppress(discord.NotFound, discord.Forbidden):
+                await session.countdown_msg.delete()
+            deleted = True
 
-    active_user_id = participant.id
-    active_source_msg_id = reply_to.id
+        session.channel = channel
+        if session.guild_id != channel.guild.id:
+            session.guild_id = channel.guild.id
+            persist_session(session)
+        session.user_id = participant.id
+        session.participant = participant
+        session.source_msg_id = reply_to.id
 
-    now = dt.datetime.utcnow()
-    if resume_until and resume_until > now:
-        active_until = resume_until
-        initial_remaining = int((resume_until - now).total_seconds())
-    else:
-        active_until = now + dt.timedelta(seconds=COUNTDOWN_SECONDS)
-        initial_remaining = COUNTDOWN_SECONDS
-
-    if existing_message:
-        active_countdown_msg = existing_message
-        active_countdown_msg_id = existing_message.id
-        with contextlib.suppress(discord.HTTPException, discord.Forbidden):
-            await active_countdown_msg.edit(
-                embed=msg_countdown(participant, initial_remaining)
+        now = _now_utc_naive()
+        if resume_until and resume_until > now:
+            session.until = resume_until
+            initial_remaining = math.ceil((resume_until - now).total_seconds())
+        else:
+            session.until = now + dt.timedelta(seconds=COUNTDOWN_SECONDS)
+            initial_remaining = COUNTDOWN_SECONDS
+
+        until = session.until if COUNTDOWN_RENDER_MODE == "native" else None
+        session.notice = None
+        if reuse_message:
+            session.notice = takeover_notice(participant, previous_user_id)
+            render_countdown(session)
+        elif existing_message:
+            session.countdown_msg = existing_message
+            session.countdown_msg_id = existing_message.id
+            session.renderer.attach(session.countdown_msg)
+            render_countdown(session)
+        else:
+            frame = countdown_template.frame(participant, initial_remaining, until=until)
+            session.countdown_msg = await post_countdown_message(
+                channel, reply_to, countdown_template.render(frame)
             )
+            session.countdown_msg_id = session.countdown_msg.id
+            session.renderer.attach(session.countdown_msg, key=frame)
+    except BaseException:
+        _restore_countdown(session, previous, deleted)
+        raise
+
+    if resume_until:
+        persist_active_state(session, "resume")
     else:
-        active_countdown_msg = await reply_to.reply(
-            embed=msg_countdown(participant, initial_remaining), mention_author=False
-        )
-        active_countdown_msg_id = active_countdown_msg.id
+        persist_active_state(session, "takeover", previous_user_id=previous_user_id)
+    session.timer.start(session.until)
 
-    persist_active_state()
+def _restore_countdown(session: GiveawaySession, previous: Tuple, deleted: bool):
+    # Nothing was persisted yet: put the previous holder back and restart their timer
+    (
+        session.user_id,
+        session.participant,
+        session.until,
+        session.source_msg_id,
+        countdown_msg,
+        countdown_msg_id,
+    ) = previous
+    if deleted:
+        session.countdown_msg, session.countdown_msg_id = None, None
+    elif countdown_msg is not None and session.renderer.message is None:
+        session.countdown_msg, session.countdown_msg_id = countdown_msg, countdown_msg_id
+        session.renderer.attach(countdown_msg)
+    if session.until is not None:
+        session.timer.start(session.until)
+        _spawn(repost_countdown(session))  # only posts if no countdown message is left
 
-    async def run_countdown():
-        nonlocal participant, channel
-        try:
-            while True:
-                await asyncio.sleep(TICK_RATE)
-                if channel_locked_forever:
-                    return
-                if active_user_id != participant.id:
-                    return  # taken over
-                now_tick = dt.datetime.utcnow()
-                remaining = int((active_until - now_tick).total_seconds()) if active_until else 0
-                if remaining == ALERT_AT_SECONDS:
-                    alert_msg = f"@here"
-                    with contextlib.suppress(discord.Forbidden):
-                        await channel.send(content=alert_msg, embed=msg_alert(ALERT_AT_SECONDS))
-                if remaining <= 0:
-                    # Declare winner and lock channel
-                    await channel.send(embed=msg_winner(participant))
-                    await lock_channel_permanently(channel)
-                    await clear_active(skip_cancel=True)
-                    return
-                # Update countdown message
-                if active_countdown_msg:
-                    with contextlib.suppress(discord.HTTPException, discord.Forbidden):
-                        await active_countdown_msg.edit(
-                            embed=msg_countdown(participant, remaining)
-                        )
-        except asyncio.CancelledError:
-            return
+async def post_countdown_message(
+    channel: discord.TextChannel,
+    reply_to: discord.abc.Snowflake,
+    embed: discord.Embed,
+) -> discord.Message:
+    # reply_to is usually a cached partial handle, so the target may be gone by now
+    try:
+        return await reply_to.reply(embed=embed, mention_author=False)
+    except discord.HTTPException:
+        message_handles.invalidate(reply_to.id, deleted=True)
+        return await channel.send(embed=embed)
+
+async def repost_countdown(session: GiveawaySession):
+    # The countdown message was deleted while a countdown is running
+    participant, channel = session.participant, session.channel
+    if (
+        participant is None
+        or channel is None
+        or session.until is None
+        or session.renderer.message
+        or session.reposting
+    ):
+        return
+    session.reposting = True
+    target = message_handles.get(channel, session.target_message_id) or channel
+    until = session.until if COUNTDOWN_RENDER_MODE == "native" else None
+    remaining = math.ceil(max(0.0, (session.until - _now_utc_naive()).total_seconds()))
+    try:
+        frame = countdown_template.frame(participant, remaining, until=until, notice=session.notice)
+        embed = countdown_template.render(frame)
+        if target is channel:
+            message = await channel.send(embed=embed)
+        else:
+            message = await post_countdown_message(channel, target, embed)
+    except discord.HTTPException:
+        return
+    finally:
+        session.reposting = False
+    if session.user_id != participant.id or session.renderer.message:
+        # A takeover or the winner was handled while we were posting
+        with contextlib.suppress(discord.HTTPException):
+            await message.delete()
+        return
+    session.countdown_msg = message
+    session.countdown_msg_id = message.id
+    session.renderer.attach(message, key=frame)
+    persist_active_state(session, "repost")
 
-    countdown_task = asyncio.create_task(run_countdown())
+def recover_session(session: GiveawaySession):
+    # Local half of a restart: the journaled countdown is live again (bonuses apply,
+    # the timer runs) before any REST call; restore_session() resolves the objects
+    if session.locked or session.until is not None:
+        return
+    stored, session.stored = session.stored, None
+    if not stored or not stored.get("user_id"):
+        return
+    try:
+        until = dt.datetime.fromisoformat(stored.get("active_until"))
+    except (TypeError, ValueError):
+        journal_session(session, "cleared", reason="unreadable_deadline")
+        return
+    session.user_id = stored["user_id"]
+    session.until = until
+    session.source_msg_id = stored.get("source_msg_id")
+    session.countdown_msg_id = stored.get("countdown_message_id")
+    session.publish("recovered", state_store.load_session_history(session.key, STATUS_HISTORY))
+    session.timer.start(until)
+
+def recover_sessions():
+    for session in sessions.values():
+        recover_session(session)
 
-async def restore_persisted_state():
-    global active_user_id, active_until, active_source_msg_id, active_countdown_msg, active_countdown_msg_id
+def _drop_recovered(session: GiveawaySession, reason: str):
+    # The stored countdown cannot be resumed (channel, target or participant is gone)
+    session.timer.stop()
+    session.user_id = None
+    session.until = None
+    session.source_msg_id = None
+    session.countdown_msg_id = None
+    journal_session(session, "cleared", reason=reason)
 
-    if channel_locked_forever:
-        state_store.clear_active_state()
+async def restore_session(session: GiveawaySession):
+    if session.locked:
+        if session.stored:
+            session.stored = None
+            journal_session(session, "cleared", reason="locked")
         return
 
-    stored = state_store.load_active_state()
-    if not stored:
+    recover_session(session)
+    user_id, resume_until = session.user_id, session.until
+    if not user_id or resume_until is None:
         return
 
-    channel = bot.get_channel(CHANNEL_ID)
+    channel = bot.get_channel(session.channel_id)
     if channel is None:
         try:
-            channel = await bot.fetch_channel(CHANNEL_ID)
+            channel = await bot.fetch_channel(session.channel_id)
         except discord.HTTPException:
             return
 
     if not isinstance(channel, discord.TextChannel):
         return
+    session.channel = channel
 
-    try:
-        base_msg = await channel.fetch_message(TARGET_MESSAGE_ID)
-    except discord.NotFound:
-        state_store.clear_active_state()
-        return
-
-    user_id = stored.get("user_id")
-    if not user_id:
-        state_store.clear_active_state()
+    base_msg = message_handles.get(channel, session.target_message_id)
+    if base_msg is None:
+        _drop_recovered(session, "target_deleted")
         return
 
-    participant = channel.guild.get_member(user_id)
-    if participant is None:
-        try:
-            participant = await channel.guild.fetch_member(user_id)
-        except (discord.NotFound, discord.HTTPException):
-            participant = None
+    participant = await member_cache.fetch(channel.guild, user_id)
+    if session.user_id != user_id:
+        return  # taken over while we were fetching
     if participant is None:
-        state_store.clear_active_state()
+        _drop_recovered(session, "participant_left")
         return
 
+    # A partial handle is enough to edit or delete it; if it is gone the renderer reposts
     countdown_msg = None
-    countdown_msg_id = stored.get("countdown_message_id")
-    if countdown_msg_id:
-        with contextlib.suppress(discord.HTTPException, discord.NotFound):
-            countdown_msg = await channel.fetch_message(countdown_msg_id)
-
-    try:
-        resume_until = dt.datetime.fromisoformat(stored.get("active_until"))
-    except (TypeError, ValueError):
-        state_store.clear_active_state()
-        return
+    if session.countdown_msg_id:
+        countdown_msg = message_handles.get(channel, session.countdown_msg_id)
 
-    if resume_until <= dt.datetime.utcnow():
-        await channel.send(embed=msg_winner(participant))
-        await lock_channel_permanently(channel)
-        await clear_active(skip_cancel=True)
+    resume_until = session.until  # bonuses may have landed meanwhile
+    if resume_until <= _now_utc_naive():
+        session.participant = participant
+        session.countdown_msg = countdown_msg
+        await declare_winner(session)
         return
 
     await start_countdown(
+        session,
         channel,
         participant,
         base_msg,
@@ -550,212 +3070,1217 @@ async def restore_persisted_state():
         existing_message=countdown_msg,
     )
 
+async def restore_persisted_state(limit: asyncio.Semaphore) -> str:
+    # Countdowns are already running from the journal; this resolves their Discord objects
+    pending = [session for session in sessions.values() if not session.restored]
+    for session in pending:
+        session.restored = True
+
+    async def restore_one(session: GiveawaySession):
+        async with limit:
+            await restore_session(session)
+
+    results = await asyncio.gather(*(restore_one(session) for session in pending), return_exceptions=True)
+    for session, result in zip(pending, results):
+        if isinstance(result, Exception):
+            print(f"[{BRAND}] Restoring {session.key} failed: {result!r}")
+    return f"{len(pending)} sessions"
+
+# ---------------- Moderation Deletes ----------------
+# Bulk delete accepts at most 100 messages, none older than 14 days
+BULK_DELETE_MAX = 100
+BULK_DELETE_MAX_AGE = dt.timedelta(days=14) - dt.timedelta(minutes=5)
+
+# Collects message IDs to remove per channel and flushes them with
+# channel.delete_messages in batches. Per-message delays are honoured by the
+# worker, so handlers never sleep; messages too old for bulk delete go one by one.
+class DeletionQueue:
+    def __init__(self, *, linger: float):
+        self._linger = max(0.0, linger)
+        self._channels: Dict[int, discord.abc.Messageable] = {}
+        # channel_id -> [(due, message_id)]
+        self._pending: Dict[int, List[Tuple[float, int]]] = {}
+        self._wakeups: Dict[int, asyncio.Event] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.enqueued = 0
+        self.deleted = 0
+        self.failed = 0
+        self.batches = 0
+        self.bulk_deleted = 0
+        self.single_deletes = 0
+        self.batch_size_max = 0
+        self.last_batch_size = 0
+
+    def enqueue(self, message: discord.abc.Snowflake, *, channel=None, delay: float = 0.0):
+        channel = channel or message.channel
+        due = asyncio.get_running_loop().time() + max(0.0, delay)
+        self._channels[channel.id] = channel
+        self._pending.setdefault(channel.id, []).append((due, message.id))
+        self.enqueued += 1
+        self._wakeups.setdefault(channel.id, asyncio.Event()).set()
+        worker = self._workers.get(channel.id)
+        if worker is None or worker.done():
+            self._workers[channel.id] = asyncio.create_task(self._run(channel.id))
+
+    def queue_depth(self) -> int:
+        return sum(len(items) for items in self._pending.values())
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.queue_depth(),
+            "enqueued": self.enqueued,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "batches": self.batches,
+            "single_deletes": self.single_deletes,
+            "batch_size_mean": round(self.bulk_deleted / self.batches, 3) if self.batches else 0.0,
+            "batch_size_max": self.batch_size_max,
+            "last_batch_size": self.last_batch_size,
+        }
+
+    async def _run(self, channel_id: int):
+        loop = asyncio.get_running_loop()
+        wakeup = self._wakeups[channel_id]
+        while True:
+            items = self._pending.get(channel_id)
+            if not items:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            next_due = min(due for due, _ in items)
+            now = loop.time()
+            if next_due > now:
+                wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(wakeup.wait(), next_due - now)
+                continue
+            # Give a flood a moment to accumulate into one request
+            if self._linger:
+                await asyncio.sleep(self._linger)
+            now = loop.time()
+            items = self._pending.get(channel_id, [])
+            due_ids = [mid for due, mid in items if due <= now]
+            self._pending[channel_id] = [(due, mid) for due, mid in items if due > now]
+            await self._delete(self._channels[channel_id], due_ids)
+
+    async def _delete(self, channel, message_ids: List[int]):
+        cutoff = _now_utc_naive().replace(tzinfo=dt.timezone.utc) - BULK_DELETE_MAX_AGE
+        fresh = [mid for mid in message_ids if discord.utils.snowflake_time(mid) > cutoff]
+        stale = [mid for mid in message_ids if discord.utils.snowflake_time(mid) <= cutoff]
+        for start in range(0, len(fresh), BULK_DELETE_MAX):
+            chunk = fresh[start:start + BULK_DELETE_MAX]
+            if len(chunk) == 1:
+                stale.extend(chunk)
+                continue
+            try:
+                await channel.delete_messages([discord.Object(id=mid) for mid in chunk])
+            except discord.NotFound:
+                stale.extend(chunk)
+            except (discord.Forbidden, discord.HTTPException):
+                # One bad ID fails the whole bulk request; retry individually
+                stale.extend(chunk)
+            else:
+                self.batches += 1
+                self.bulk_deleted += len(chunk)
+                self.deleted += len(chunk)
+                self.last_batch_size = len(chunk)
+                self.batch_size_max = max(self.batch_size_max, len(chunk))
+        for mid in stale:
+            try:
+                await channel.get_partial_message(mid).delete()
+            except discord.NotFound:
+                pass
+            except (discord.Forbidden, discord.HTTPException):
+                self.failed += 1
+            else:
+                self.single_deletes += 1
+                self.deleted += 1
+
+deletion_queue = DeletionQueue(linger=DELETE_BATCH_LINGER)
+
+# ---------------- Throttling ----------------
+# Token bucket per user (LRU-bounded). A spree is the run of over-budget messages until
+# the bucket has refilled completely; long sprees can end in a timeout.
+class MessageThrottle:
+    def __init__(self, *, rate: float, burst: float, size: int, timeout_strikes: int, timeout_seconds: int):
+        self._rate = max(0.0, rate)
+        self._burst = max(1.0, burst)
+        self._size = max(1, size)
+        self._timeout_strikes = timeout_strikes
+        self._timeout = dt.timedelta(seconds=timeout_seconds)
+        # user_id -> [tokens, last refill (loop time), strikes in the current spree]
+        self._buckets: "OrderedDict[int, List[float]]" = OrderedDict()
+        self.allowed = 0
+        self.throttled_messages = 0
+        self.throttled_users = 0
+        self.timeouts = 0
+        self.timeout_failures = 0
+
+    def allow(self, member: discord.Member) -> bool:
+        now = asyncio.get_running_loop().time()
+        bucket = self._buckets.get(member.id)
+        if bucket is None:
+            bucket = self._buckets[member.id] = [self._burst, now, 0]
+            if len(self._buckets) > self._size:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(member.id)
+            bucket[0] = min(self._burst, bucket[0] + (now - bucket[1]) * self._rate)
+            bucket[1] = now
+            if bucket[0] >= self._burst:
+                bucket[2] = 0  # fully refilled: the spree is over
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            self.allowed += 1
+            return True
+        self.throttled_messages += 1
+        bucket[2] += 1
+        if bucket[2] == 1:
+            self.throttled_users += 1
+        if self._timeout_strikes > 0 and bucket[2] == self._timeout_strikes:
+            _spawn(self._time_out(member))
+        return False
+
+    async def _time_out(self, member: discord.Member):
+        try:
+            await member.timeout(self._timeout, reason=f"{BRAND} Giveaway: message flood")
+        except discord.HTTPException:
+            self.timeout_failures += 1
+        else:
+            self.timeouts += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "tracked_users": len(self._buckets),
+            "in_spree": sum(1 for bucket in self._buckets.values() if bucket[2]),
+            "allowed": self.allowed,
+            "throttled_messages": self.throttled_messages,
+            "throttled_users": self.throttled_users,
+            "timeouts": self.timeouts,
+            "timeout_failures": self.timeout_failures,
+        }
+
+message_throttle = MessageThrottle(
+    rate=THROTTLE_RATE,
+    burst=THROTTLE_BURST,
+    size=THROTTLE_CACHE_SIZE,
+    timeout_strikes=THROTTLE_TIMEOUT_STRIKES,
+    timeout_seconds=THROTTLE_TIMEOUT_SECONDS,
+)
+
+# Collects everyone who posted a non-reply (or flooded) in a channel and posts one
+# short-lived warning per window that names them all, instead of one per message.
+WARNING_MENTIONS_MAX = 20
+
+class WarningBatcher:
+    def __init__(self, *, window: float, linger: float = 5.0):
+        self._window = max(0.0, window)
+        self._linger = linger
+        self._pending: Dict[int, "OrderedDict[int, str]"] = {}
+        self._channels: Dict[int, discord.abc.Messageable] = {}
+        self._last_sent: Dict[int, float] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.noted = 0
+        self.warnings_sent = 0
+        self.warnings_failed = 0
+        self.offenders_named = 0
+
+    def note(self, channel: discord.abc.Messageable, member: discord.abc.User):
+        self.noted += 1
+        pending = self._pending.setdefault(channel.id, OrderedDict())
+        pending[member.id] = member.mention
+        self._channels[channel.id] = channel
+        task = self._tasks.get(channel.id)
+        if task is None or task.done():
+            self._tasks[channel.id] = _spawn(self._flush_later(channel.id))
+
+    async def _flush_later(self, channel_id: int):
+        # Loops while offenders keep coming: note() only starts a new task once this returned
+        loop = asyncio.get_running_loop()
+        while True:
+            last = self._last_sent.get(channel_id)
+            if last is not None:
+                delay = last + self._window - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            pending = self._pending.pop(channel_id, None)
+            channel = self._channels.pop(channel_id, None)
+            if not pending or channel is None:
+                return
+            self._last_sent[channel_id] = loop.time()
+            mentions = list(pending.values())
+            content = " ".join(mentions[:WARNING_MENTIONS_MAX])
+            if len(mentions) > WARNING_MENTIONS_MAX:
+                content += f" (+{len(mentions) - WARNING_MENTIONS_MAX})"
+            try:
+                warn = await channel.send(
+                    content=content,
+                    embed=msg_deleted_non_reply(),
+                    allowed_mentions=discord.AllowedMentions.none(),
+                )
+            except discord.HTTPException:
+                self.warnings_failed += 1
+                continue
+            self.warnings_sent += 1
+            self.offenders_named += len(mentions)
+            deletion_queue.enqueue(warn, delay=self._linger)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending_channels": len(self._pending),
+            "noted": self.noted,
+            "warnings_sent": self.warnings_sent,
+            "warnings_failed": self.warnings_failed,
+            "offenders_named": self.offenders_named,
+        }
+
+warning_batcher = WarningBatcher(window=WARN_WINDOW_SECONDS)
+
+# ---------------- DM Dispatch ----------------
+DM_TEMPLATE_REGISTRATION = "registration"
+DM_TEMPLATE_QUIET_HOURS = "quiet_hours"
+
+# Sends DMs from a bounded worker pool. A (user, template) pair is sent at most once
+# per cooldown, registration DMs at most once per user (the persisted notified set),
+# and users whose DMs are closed are cached as negatives instead of being retried.
+class DMDispatcher:
+    def __init__(self, *, workers: int, queue_size: int, cooldown: float, negative_ttl: float, cache_size: int):
+        self._workers_count = max(1, workers)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._cooldown = max(0.0, cooldown)
+        self._negative_ttl = max(0.0, negative_ttl)
+        self._cache_size = max(1, cache_size)
+        # Expiries on the loop clock, one map per TTL so insertion order is expiry order
+        # and cooldown churn cannot push out closed-DM entries:
+        # (user_id, template) -> cooldown end, user_id -> end of the closed-DM backoff
+        self._cooldowns: "OrderedDict[Tuple[int, str], float]" = OrderedDict()
+        self._closed: "OrderedDict[int, float]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.suppressed_cooldown = 0
+        self.suppressed_closed = 0
+        self.suppressed_notified = 0
+        self.dropped_full = 0
+
+    def send(self, user: discord.abc.User, template: str, build: Callable[[], discord.Embed]) -> bool:
+        now = asyncio.get_running_loop().time()
+        self._evict(self._cooldowns, now)
+        self._evict(self._closed, now)
+        if self._active(self._closed, user.id, now):
+            self.suppressed_closed += 1
+            return False
+        if template == DM_TEMPLATE_REGISTRATION and user.id in notified_missing_role:
+            self.suppressed_notified += 1
+            return False
+        key = (user.id, template)
+        if self._active(self._cooldowns, key, now):
+            self.suppressed_cooldown += 1
+            return False
+        try:
+            self._queue.put_nowait((user, template, build))
+        except asyncio.QueueFull:
+            self.dropped_full += 1
+            return False
+        self._remember(self._cooldowns, key, now + self._cooldown)
+        self._ensure_workers()
+        return True
+
+    def forget(self, user_id: int, template: str):
+        self._cooldowns.pop((user_id, template), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "suppressed": (
+                self.suppressed_cooldown + self.suppressed_closed + self.suppressed_notified + self.dropped_full
+            ),
+            "suppressed_cooldown": self.suppressed_cooldown,
+            "suppressed_closed": self.suppressed_closed,
+            "suppressed_notified": self.suppressed_notified,
+            "dropped_full": self.dropped_full,
+            "queue_depth": self._queue.qsize(),
+            "cache_entries": len(self._cooldowns) + len(self._closed),
+            "closed_entries": len(self._closed),
+        }
+
+    @staticmethod
+    def _active(entries: "OrderedDict", key: Any, now: float) -> bool:
+        expires = entries.get(key)
+        return expires is not None and expires > now
+
+    def _remember(self, entries: "OrderedDict", key: Any, expires: float):
+        # Every entry of a map shares its TTL, so the front always expires first
+        entries[key] = expires
+        entries.move_to_end(key)
+        while len(entries) > self._cache_size:
+            entries.popitem(last=False)
+
+    @staticmethod
+    def _evict(entries: "OrderedDict", now: float):
+        while entries:
+            key, expires = next(iter(entries.items()))
+            if expires > now:
+                break
+            entries.popitem(last=False)
+
+    def _ensure_workers(self):
+        self._workers = [task for task in self._workers if not task.done()]
+        while len(self._workers) < self._workers_count:
+            self._workers.append(asyncio.create_task(self._run()))
+
+    async def _run(self):
+        while True:
+            user, template, build = await self._queue.get()
+            try:
+                await user.send(embed=build())
+            except discord.Forbidden:
+                # DMs closed or blocked: stop trying for a while
+                self.failed += 1
+                self._remember(self._closed, user.id, asyncio.get_running_loop().time() + self._negative_ttl)
+            except discord.HTTPException:
+                self.failed += 1
+                self.forget(user.id, template)
+            else:
+                self.sent += 1
+                if template == DM_TEMPLATE_REGISTRATION and user.id not in notified_missing_role:
+                    notified_missing_role.add(user.id)
+                    persist_notified_user(user.id)
+            finally:
+                self._queue.task_done()
+
+dm_dispatcher = DMDispatcher(
+    workers=DM_WORKERS,
+    queue_size=DM_QUEUE_SIZE,
+    cooldown=DM_COOLDOWN_SECONDS,
+    negative_ttl=DM_NEGATIVE_TTL_SECONDS,
+    cache_size=DM_CACHE_SIZE,
+)
+
+# ---------------- Invite Attribution ----------------
+# Joins are debounced per guild into batches. Each batch costs one invites() fetch,
+# whose per-invite use deltas (plus invites that vanished after hitting max_uses)
+# are matched to the batch's joins, one use per join, oldest join first. Joins that
+# arrive while the fetch is in flight join its batch, since the fetch may already count
+# their use; those it does not count yet go to the next batch, diffed against this fetch.
+class InviteAttributor:
+    def __init__(self, *, window: float):
+        self._window = max(0.0, window)
+        # guild_id -> code -> (uses, inviter_id, max_uses)
+        self._invites: Dict[int, Dict[str, Tuple[int, Optional[int], int]]] = {}
+        # guild_id -> code -> (uses, inviter_id, max_uses) for invites deleted since the last snapshot
+        self._vanished: Dict[int, Dict[str, Tuple[int, Optional[int], int]]] = {}
+        self._joins: Dict[int, List[discord.Member]] = {}
+        self._flushers: Dict[int, asyncio.Task] = {}
+        self.joins_seen = 0
+        self.invite_fetches = 0
+        self.batches = 0
+        self.attributed = 0
+        self.unattributed = 0
+        self.ambiguous_batches = 0
+
+    @staticmethod
+    def _entry(invite: discord.Invite) -> Tuple[int, Optional[int], int]:
+        inviter_id = invite.inviter.id if invite.inviter else None
+        return (invite.uses or 0, inviter_id, invite.max_uses or 0)
+
+    def snapshot(self, guild_id: int, invites: List[discord.Invite]):
+        self._invites[guild_id] = {invite.code: self._entry(invite) for invite in invites}
+        self._vanished.pop(guild_id, None)
+
+    def invite_created(self, guild_id: int, invite: discord.Invite):
+        self._invites.setdefault(guild_id, {})[invite.code] = self._entry(invite)
+
+    def invite_deleted(self, guild_id: int, code: str):
+        entry = self._invites.setdefault(guild_id, {}).pop(code, None)
+        if entry is not None:
+            self._vanished.setdefault(guild_id, {})[code] = entry
+
+    def member_joined(self, member: discord.Member):
+        self.joins_seen += 1
+        guild_id = member.guild.id
+        self._joins.setdefault(guild_id, []).append(member)
+        task = self._flushers.get(guild_id)
+        if task is None or task.done():
+            self._flushers[guild_id] = asyncio.create_task(self._flush_later(member.guild))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "joins": self.joins_seen,
+            "invite_fetches": self.invite_fetches,
+            "invite_fetches_per_join": round(self.invite_fetches / self.joins_seen, 4) if self.joins_seen else 0.0,
+            "batches": self.batches,
+            "attributed": self.attributed,
+            "unattributed": self.unattributed,
+            "ambiguous_batches": self.ambiguous_batches,
+        }
+
+    async def _flush_later(self, guild: discord.Guild):
+        # One task per guild while joins keep coming; member_joined only starts a new one
+        # once this has returned
+        while True:
+            await asyncio.sleep(self._window)
+            joins = self._joins.pop(guild.id, [])
+            if not joins:
+                return
+            self.batches += 1
+            self.invite_fetches += 1
+            try:
+                invites = await guild.invites()
+            except (discord.Forbidden, discord.HTTPException):
+                self.unattributed += len(joins)
+                continue
+            late = self._joins.pop(guild.id, [])
+            matches, unmatched = self._match(guild.id, invites, joins + late)
+            retry = [member for member in unmatched if member in late]
+            if retry:
+                self._joins[guild.id] = retry + self._joins.get(guild.id, [])
+            self.attributed += len(matches)
+            self.unattributed += len(joins) + len(late) - len(matches) - len(retry)
+            await credit_invited_members(guild, matches)
+
+    def _match(
+        self,
+        guild_id: int,
+        invites: List[discord.Invite],
+        joins: List[discord.Member],
+    ) -> Tuple[List[Tuple[discord.Member, int]], List[discord.Member]]:
+        # (join, inviter_id) matches, and the joins no use was left for
+        before = self._invites.get(guild_id, {})
+        vanished = self._vanished.pop(guild_id, {})
+        # (uses gained, inviter_id) for every invite that moved in this batch
+        deltas: List[Tuple[int, Optional[int]]] = []
+        for invite in invites:
+            uses, inviter_id, _ = self._entry(invite)
+            previous = before.get(invite.code, (0, None, 0))[0]
+            if uses > previous:
+                deltas.append((uses - previous, inviter_id))
+        for uses, inviter_id, max_uses in vanished.values():
+            # Discord deletes an invite once it reaches max_uses; a manual delete has no uses left to claim
+            if max_uses and max_uses > uses:
+                deltas.append((max_uses - uses, inviter_id))
+        self.snapshot(guild_id, invites)
+
+        inviters = {inviter_id for _, inviter_id in deltas}
+        if len(inviters) > 1 and len(joins) > 1:
+            self.ambiguous_batches += 1
+
+        ordered = sorted(joins, key=lambda m: m.joined_at or dt.datetime.min.replace(tzinfo=dt.timezone.utc))
+        matches: List[Tuple[discord.Member, int]] = []
+        pending = iter(ordered)
+        for count, inviter_id in deltas:
+            for _ in range(count):
+                member = next(pending, None)
+                if member is None:
+                    break
+                if inviter_id is not None:
+                    matches.append((member, inviter_id))
+        return matches, list(pending)
+
+invite_attributor = InviteAttributor(window=INVITE_BATCH_WINDOW)
+
+def _account_age_ok(member: discord.Member) -> bool:
+    # Check minimum account age for eligibility
+    try:
+        created_at = member.created_at
+        if created_at.tzinfo is not None:
+            created_at = created_at.replace(tzinfo=None)
+    except AttributeError:
+        created_at = None
+
+    if created_at is not None and INVITE_MIN_ACCOUNT_AGE_DAYS > 0:
+        return (_now_utc_naive() - created_at) >= dt.timedelta(days=INVITE_MIN_ACCOUNT_AGE_DAYS)
+    return True
+
+async def credit_invited_members(guild: discord.Guild, matches: List[Tuple[discord.Member, int]]):
+    for member, inviter_id in matches:
+        if inviter_id == member.id or not _account_age_ok(member):
+            continue  # New accounts do not count for any bonus
+        # Inviters who have since left earn nothing; lean mode may simply not have them cached
+        inviter = member_cache.get(guild, inviter_id)
+        if inviter is None and member_cache.lean:
+            inviter = await member_cache.fetch(guild, inviter_id)
+        if inviter is None:
+            continue
+        # Record referral for potential role-bonus later
+        previous = referral_map.get(member.id)
+        referral_map[member.id] = {
+            "inviter_id": inviter_id,
+            "role_bonus_applied": False,
+        }
+        persist_referral(member.id)
+        referral_index.referred(member.id, inviter_id, previous)
+        # Shortens the inviter's countdown if they hold one, else kept as a credit
+        bonus_ledger.earn(guild.id, inviter_id, "invite", INVITE_BONUS_SECONDS, invitee_id=member.id)
+
+# ---------------- Quiet Hours ----------------
+# At every quiet window boundary (a timer on the shared heap scheduler) the quiet roles
+# get Send Messages denied, or the deny lifted, on each hosted giveaway channel; while a
+# window is open Discord itself keeps their messages out. Only the send_messages bit of
+# an overwrite is touched, and only overwrites the bot applied (persisted) are lifted.
+QUIET_OVERWRITES_SETTING = "quiet_overwrites"
+
+class QuietHoursScheduler:
+    def __init__(self, schedule: QuietSchedule):
+        self._schedule = schedule
+        self._timer_token: Optional[int] = None
+        self._lock = asyncio.Lock()
+        self._started = False
+        stored = state_store.load_setting(QUIET_OVERWRITES_SETTING) or {}
+        self._applied: Set[Tuple[int, int]] = {tuple(pair) for pair in stored.get("applied", [])}
+        self.boundaries = 0
+        self.overwrites_set = 0
+        self.overwrites_cleared = 0
+        self.failures = 0
+
+    def start(self):
+        if self._started or not self._schedule.windows:
+            return
+        self._started = True
+        timer_scheduler.schedule(self)
+
+    # TimerScheduler protocol
+    def next_wakeup(self) -> Optional[float]:
+        if not self._started:
+            return None
+        now = _now_utc_naive()
+        delay = (self._schedule.next_transition(now) - now).total_seconds()
+        return asyncio.get_running_loop().time() + max(0.0, delay)
+
+    def fire(self, now: float, scheduled: float):
+        self.boundaries += 1
+        _spawn(self.reconcile())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active_roles": len(self._schedule.active_roles()),
+            "applied": len(self._applied),
+            "boundaries": self.boundaries,
+            "overwrites_set": self.overwrites_set,
+            "overwrites_cleared": self.overwrites_cleared,
+            "failures": self.failures,
+            "recomputes": self._schedule.recomputes,
+        }
+
+    async def reconcile(self):
+        # Bring every hosted channel in line with the roles that are quiet right now
+        async with self._lock:
+            active = self._schedule.active_roles()
+            channels: Dict[int, discord.TextChannel] = {}
+            for session in sessions.values():
+                channel = session.channel or bot.get_channel(session.channel_id)
+                if isinstance(channel, discord.TextChannel):
+                    channels[channel.id] = channel
+            # Role overwrites allow over deny, so while any role is quiet the admin roles get
+            # an explicit allow: admins who also hold a quiet role keep their voice
+            roles = {role_id for role_id in active if role_id not in ADMIN_ROLE_IDS}
+            if roles:
+                roles |= ADMIN_ROLE_IDS
+            desired = {(channel_id, role_id) for channel_id in channels for role_id in roles}
+            before = set(self._applied)
+            # Allows go on before the denies and come off after them
+            for channel_id, role_id in sorted(desired - self._applied, key=lambda p: (p[1] not in ADMIN_ROLE_IDS, p)):
+                if await self._set_quiet(channels[channel_id], role_id, True):
+                    self._applied.add((channel_id, role_id))
+            for channel_id, role_id in sorted(self._applied - desired, key=lambda p: (p[1] in ADMIN_ROLE_IDS, p)):
+                channel = channels.get(channel_id) or bot.get_channel(channel_id)
+                if not isinstance(channel, discord.TextChannel):
+                    continue  # not resolvable yet; retried at the next reconcile
+                if await self._set_quiet(channel, role_id, False):
+                    self._applied.discard((channel_id, role_id))
+            if self._applied != before:
+                state_writer.save_setting(QUIET_OVERWRITES_SETTING, {"applied": sorted(self._applied)})
+                print(
+                    f"[{BRAND}] Quiet hours: {len(active)} roles quiet, "
+                    f"{len(self._applied)} channel overwrites applied."
+                )
+
+    async def _set_quiet(self, channel: discord.TextChannel, role_id: int, quiet: bool) -> bool:
+        role = channel.guild.get_role(role_id)
+        if role is None:
+            return not quiet  # deleted role: nothing to deny or lift
+        overwrite = channel.overwrites_for(role)
+        if not quiet:
+            overwrite.send_messages = None
+        else:
+            overwrite.send_messages = role_id in ADMIN_ROLE_IDS
+        try:
+            await channel.set_permissions(
+                role,
+                overwrite=None if overwrite.is_empty() else overwrite,
+                reason=f"{BRAND} Quiet hours {'start' if quiet else 'end'}",
+            )
+        except discord.HTTPException as e:
+            # Without Manage Permissions the per-message deletion still applies
+            self.failures += 1
+            print(f"[{BRAND}] Quiet hours overwrite failed on #{channel.id} for role {role_id}: {e}")
+            return False
+        if quiet:
+            self.overwrites_set += 1
+        else:
+            self.overwrites_cleared += 1
+        return True
+
+quiet_hours = QuietHoursScheduler(quiet_schedule)
+
+# ---------------- Gateway Fast Path ----------------
+# With MESSAGE_PARSE_MODE=raw, MESSAGE_CREATE never reaches discord.py's parser. Messages
+# outside giveaway channels are dropped on their channel ID; the rest are wrapped around
+# the payload and classified from its member role IDs. A full Member is only built when
+# one is needed: DMs, timeouts and takeovers.
+_PARTICIPANT_ROLE_KEYS = frozenset(str(role_id) for role_id in PARTICIPANT_ROLE_IDS)
+_QUIET_ROLE_KEYS = frozenset(str(role_id) for role_id in QUIET_ROLE_IDS)
+
+class GatewayAuthor:
+    __slots__ = ("id", "guild", "bot", "flags", "_user", "_member", "_resolved")
+
+    def __init__(self, guild: discord.Guild, user: Dict[str, Any], member: Dict[str, Any]):
+        self.id = int(user["id"])
+        self.guild = guild
+        self.bot = bool(user.get("bot"))
+        self._user = user
+        self._member = member
+        self._resolved: Optional[discord.Member] = None
+        # Payload roles are current, unlike a role_cache entry of an uncached member
+        roles = member["roles"]
+        everyone_admin, admin_keys = role_cache.admin_roles(guild)
+        flags = 0
+        if everyone_admin or self.id == guild.owner_id or not admin_keys.isdisjoint(roles):
+            flags |= ROLE_FLAG_ADMIN
+        if not _QUIET_ROLE_KEYS.isdisjoint(roles):
+            flags |= ROLE_FLAG_QUIET
+        if not _PARTICIPANT_ROLE_KEYS or not _PARTICIPANT_ROLE_KEYS.isdisjoint(roles):
+            flags |= ROLE_FLAG_PARTICIPANT
+        self.flags = flags
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def get_role(self, role_id: int) -> Optional[discord.Role]:
+        return self.guild.get_role(role_id) if str(role_id) in self._member["roles"] else None
+
+    def resolve(self) -> discord.Member:
+        # The cached member, refreshed from the payload as discord.Message would, or a new one
+        if self._resolved is None:
+            member = self.guild.get_member(self.id)
+            if member is None:
+                data = {"flags": 0, **self._member, "user": self._user}
+                member = discord.Member(data=data, guild=self.guild, state=self.guild._state)
+            else:
+                member._update_from_message(self._member)
+            self._resolved = member
+        return self._resolved
+
+    async def send(self, *args, **kwargs):
+        return await self.resolve().send(*args, **kwargs)
+
+    async def timeout(self, *args, **kwargs):
+        return await self.resolve().timeout(*args, **kwargs)
+
+class GatewayMessage:
+    __slots__ = ("id", "channel", "guild", "author", "reference")
+
+    def __init__(self, channel: discord.TextChannel, data: Dict[str, Any], author: GatewayAuthor):
+        self.id = int(data["id"])
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.reference: Optional[discord.MessageReference] = None
+        ref = data.get("message_reference")
+        if ref and ref.get("message_id"):
+            self.reference = discord.MessageReference(message_id=int(ref["message_id"]), channel_id=channel.id)
+
+    async def reply(self, content: Optional[str] = None, **kwargs) -> discord.Message:
+        return await self.channel.get_partial_message(self.id).reply(content, **kwargs)
+
+def author_flags(author: "discord.Member | GatewayAuthor") -> int:
+    if isinstance(author, GatewayAuthor):
+        return author.flags
+    if member_cache.lean:
+        # The author's roles come with the message; a role_cache entry may predate a role
+        # change that was never dispatched for a member outside the cache
+        return classify_member(author)
+    return role_cache.flags(author)
+
+def resolve_author(author: "discord.Member | GatewayAuthor") -> discord.Member:
+    return author.resolve() if isinstance(author, GatewayAuthor) else author
+
+class GatewayFastPath:
+    def __init__(self):
+        self._full_parse: Optional[Callable[[Dict[str, Any]], None]] = None
+        self.received = 0
+        self.dropped_channel = 0
+        self.dropped_bot = 0
+        self.routed = 0
+        self.full_parses = 0
+        self.errors = 0
+
+    def install(self, state):
+        # Swaps discord.py's MESSAGE_CREATE parser; must run before the gateway connects
+        self._full_parse = state.parsers["MESSAGE_CREATE"]
+        state.parsers["MESSAGE_CREATE"] = self.parse_message_create
+
+    def parse_message_create(self, data: Dict[str, Any]):
+        self.received += 1
+        session = sessions.get(int(data["channel_id"]))
+        if session is None:
+            self.dropped_channel += 1
+            return
+        user = data["author"]
+        if user.get("bot"):
+            self.dropped_bot += 1
+            return
+        member = data.get("member")
+        channel = session.channel or bot.get_channel(session.channel_id)
+        if member is None or channel is None:
+            # Webhook posts or a channel not resolved yet: let discord.py build it
+            self.full_parses += 1
+            self._full_parse(data)
+            return
+        try:
+            message = GatewayMessage(channel, data, GatewayAuthor(channel.guild, user, member))
+            route_message(session, message)
+        except Exception as e:
+            # Raising here would tear down the gateway connection
+            self.errors += 1
+            print(f"[{BRAND}] Gateway message {data.get('id')} failed: {e!r}")
+        else:
+            self.routed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "installed": int(self._full_parse is not None),
+            "received": self.received,
+            "dropped_channel": self.dropped_channel,
+            "dropped_bot": self.dropped_bot,
+            "routed": self.routed,
+            "full_parses": self.full_parses,
+            "errors": self.errors,
+        }
+
+gateway_fast_path = GatewayFastPath()
+if MESSAGE_PARSE_MODE == "raw":
+    gateway_fast_path.install(bot._connection)
+
+# ---------------- Startup ----------------
+# Local state is recovered before login (see main()); on_ready then runs the REST phases
+# concurrently, each bounded by one semaphore, and logs how long each one took.
+def command_payload(command) -> Dict:
+    # discord.py 2.4 added the tree argument (for localisation); 2.3 takes none
+    try:
+        return command.to_dict(bot.tree)
+    except TypeError:
+        return command.to_dict()
+
+def command_tree_hash(guild: Optional[discord.Guild]) -> str:
+    payload = [command_payload(command) for command in bot.tree.get_commands(guild=guild)]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+async def sync_commands() -> str:
+    # Syncing is rate limited and slow; only push the tree when its payload changed
+    guild = bot.get_guild(GUILD_ID) if GUILD_ID else None
+    if GUILD_ID and guild is None:
+        return "guild unavailable"
+    setting = f"command_tree_hash:{GUILD_ID or 'global'}"
+    digest = command_tree_hash(guild)
+    stored = state_store.load_setting(setting)
+    if stored and stored.get("sha256") == digest:
+        return "unchanged"
+    try:
+        await bot.tree.sync(guild=guild)
+    except Exception as e:
+        print(f"[{BRAND}] Command sync failed: {e!r}")
+        return "failed"
+    state_writer.save_setting(setting, {"sha256": digest})
+    return "synced"
+
+async def snapshot_invites(limit: asyncio.Semaphore) -> str:
+    async def snapshot_one(guild: discord.Guild):
+        async with limit:
+            try:
+                invites = await guild.invites()
+            except (discord.Forbidden, discord.HTTPException):
+                invites = []
+        invite_attributor.snapshot(guild.id, invites)
+
+    guilds = list(bot.guilds)
+    await asyncio.gather(*(snapshot_one(guild) for guild in guilds))
+    return f"{len(guilds)} guilds"
+
+async def warm_member_cache(limit: asyncio.Semaphore) -> str:
+    # Lean mode: invitees still owed a role bonus must be resident to get on_member_update
+    pending = [invitee for invitee, info in referral_map.items() if not info.get("role_bonus_applied")]
+    pending = pending[-(MEMBER_CACHE_SIZE // 2):]
+    guild_ids = {session.guild_id for session in sessions.values()}
+    guilds = [guild for guild in bot.guilds if guild.id in guild_ids or 0 in guild_ids]
+
+    async def warm_one(guild: discord.Guild):
+        async with limit:
+            await member_cache.warm(guild, pending)
+
+    await asyncio.gather(*(warm_one(guild) for guild in guilds))
+    return f"{len(pending)} invitees"
+
+async def timed_phase(name: str, phase: Awaitable[str]) -> str:
+    started = time.perf_counter()
+    detail = await phase
+    elapsed = time.perf_counter() - started
+    metrics.set("giveaway_startup_phase_seconds", elapsed, phase=name)
+    return f"{name} {elapsed * 1000:.0f}ms ({detail})"
+
 # ---------------- Event Handlers ----------------
 @bot.event
 async def on_ready():
-    global state_restored
-    try:
-        if GUILD_ID:
-            guild = bot.get_guild(GUILD_ID)
-            if guild:
-                await bot.tree.sync(guild=guild)
-        else:
-            await bot.tree.sync()
-    except Exception:
-        pass
-    for guild in bot.guilds:
+    global state_restored, metrics_runner
+    if METRICS_ENABLED and metrics_runner is None:
         try:
-            invites = await guild.invites()
-        except (discord.Forbidden, discord.HTTPException):
-            invite_uses[guild.id] = {}
+            metrics_runner = await start_metrics_server()
+        except OSError as e:
+            print(f"[{BRAND}] Metrics server failed to start: {e!r}")
         else:
-            invite_uses[guild.id] = {invite.code: invite.uses or 0 for invite in invites}
+            _spawn(monitor_loop_lag())
 
+    # Restores first: they hold the semaphore ahead of the invite snapshots
+    started = time.perf_counter()
+    limit = asyncio.Semaphore(max(1, STARTUP_CONCURRENCY))
+    phases: List[Tuple[str, Awaitable[str]]] = []
     if not state_restored:
-        await restore_persisted_state()
         state_restored = True
-    # Load persisted referrals once on ready
-    global referral_map
-    referral_map = state_store.load_referrals()
-    # Load user stats for displaying in countdown
-    global user_stats
-    user_stats = state_store.load_user_stats()
+        phases.append(("restore", restore_persisted_state(limit)))
+        if member_cache.lean:
+            phases.append(("members", warm_member_cache(limit)))
+    phases.append(("invites", snapshot_invites(limit)))
+    phases.append(("commands", sync_commands()))
+    # A failing phase is logged; it never keeps the others (or quiet hours) from running
+    results = await asyncio.gather(*(timed_phase(name, phase) for name, phase in phases), return_exceptions=True)
+    timings = []
+    for (name, _), result in zip(phases, results):
+        if isinstance(result, Exception):
+            print(f"[{BRAND}] Startup phase {name} failed: {result!r}")
+            result = f"{name} failed"
+        timings.append(result)
+    if QUIET_ENFORCEMENT == "overwrite":
+        quiet_hours.start()
+        # Catch up on boundaries missed while offline and on channels restored just now
+        _spawn(quiet_hours.reconcile())
 
-    print(f"[{BRAND}] Giveaway bot is online as {bot.user}.")
+    print(
+        f"[{BRAND}] Giveaway bot is online as {bot.user} "
+        f"({time.perf_counter() - started:.2f}s: {', '.join(timings)})."
+    )
 
 @bot.event
+@instrumented("on_message")
 async def on_message(message: discord.Message):
-    global active_user_id, active_until, active_countdown_msg, channel_locked_forever
-
     # Ignore bot/self
     if message.author.bot:
         return
 
-    # Only target channel
-    if message.channel.id != CHANNEL_ID:
+    # Only giveaway channels
+    session = sessions.get(message.channel.id)
+    if session is None:
         return
+    route_message(session, message)
 
-    # If permanently locked, delete any message from non-admins
-    if channel_locked_forever and not is_admin(message.author):
-        with contextlib.suppress(discord.Forbidden, discord.NotFound):
-            await message.delete()
+def route_message(session: GiveawaySession, message: "discord.Message | GatewayMessage"):
+    # Flooding non-admins: their messages are only bulk-deleted (one merged warning)
+    if not author_flags(message.author) & ROLE_FLAG_ADMIN and not message_throttle.allow(message.author):
+        deletion_queue.enqueue(message)
+        warning_batcher.note(message.channel, message.author)
         return
 
+    # Processed in gateway order by the channel's single consumer
+    session.ingest.put(message)
+
+async def moderate_message(
+    session: GiveawaySession,
+    message: "discord.Message | GatewayMessage",
+    active_id: Optional[int],
+) -> bool:
+    # Returns True when the message is a valid takeover reply
     # Admins are exempt from all restrictions (but still can interact)
-    admin = is_admin(message.author)
+    flags = author_flags(message.author)
+    admin = bool(flags & ROLE_FLAG_ADMIN)
+
+    # If permanently locked, delete any message from non-admins
+    if session.locked and not admin:
+        deletion_queue.enqueue(message)
+        return False
 
     # Participant role requirement
-    if not admin and not has_participant_role(message.author):
-        # Send bilingual registration DM every time
-        with contextlib.suppress(discord.Forbidden):
-            await message.author.send(embed=msg_registration_dm())
+    if not admin and not flags & ROLE_FLAG_PARTICIPANT:
+        # Send bilingual registration DM once (persisted), closed DMs are not retried
+        dm_dispatcher.send(message.author, DM_TEMPLATE_REGISTRATION, msg_registration_dm)
         # Small delay so the user reliably sees removal client-side
-        await asyncio.sleep(1)
-        with contextlib.suppress(discord.Forbidden, discord.NotFound):
-            await message.delete()
-        return
+        deletion_queue.enqueue(message, delay=1.0)
+        return False
 
-    # Quiet hours: delete from members having quiet roles (admins exempt)
-    if not admin and in_quiet_hours() and has_quiet_role(message.author):
-        with contextlib.suppress(discord.Forbidden, discord.NotFound):
-            await message.delete()
-        with contextlib.suppress(discord.Forbidden):
-            await message.author.send(embed=msg_quiet_hours())
-        return
+    # Quiet hours: overwrites normally keep these out; delete what still gets through (admins exempt)
+    if not admin and flags & ROLE_FLAG_QUIET and quiet_muted(message.author):
+        deletion_queue.enqueue(message)
+        dm_dispatcher.send(message.author, DM_TEMPLATE_QUIET_HOURS, msg_quiet_hours)
+        return False
 
     # Must be a REPLY to the configured target message
     is_valid_reply = (
         message.reference is not None and
-        message.reference.message_id == TARGET_MESSAGE_ID
+        message.reference.message_id == session.target_message_id
     )
 
     if not is_valid_reply:
         # Delete non-replies (admins exempt)
         if not admin:
-            with contextlib.suppress(discord.Forbidden, discord.NotFound):
-                await message.delete()
-            # Optionally nudge (avoid DM spam by replying ephemerally—Discord bots can't true-ephemeral in text channels)
-            with contextlib.suppress(discord.Forbidden):
-                warn = await message.channel.send(embed=msg_deleted_non_reply(), delete_after=5)
-        return
+            deletion_queue.enqueue(message)
+            # Nudge in the channel (bots can't send ephemeral messages there); merged per window
+            warning_batcher.note(message.channel, message.author)
+        return False
 
     # If current participant tries to speak during their own countdown, delete their message
-    if active_user_id == message.author.id and active_until and dt.datetime.utcnow() < active_until:
+    if active_id == message.author.id:
         if not admin:
-            with contextlib.suppress(discord.Forbidden, discord.NotFound):
-                await message.delete()
-        return
+            deletion_queue.enqueue(message)
+        return False
+
+    return True
+
+@instrumented("process_ingest_batch")
+async def process_ingest_batch(session: GiveawaySession, messages: List["discord.Message | GatewayMessage"]) -> int:
+    # Apply a burst in order as if one by one, but only the last valid reply actually
+    # takes over; returns the number of valid replies seen
+    active_id = session.user_id if session.until and _now_utc_naive() < session.until else None
+    winner: Optional[discord.Message] = None
+    candidates = 0
+    for message in messages:
+        if await moderate_message(session, message, active_id):
+            candidates += 1
+            active_id = message.author.id
+            winner = message
+    if winner is not None:
+        await take_over(session, winner)
+    return candidates
 
+async def take_over(session: GiveawaySession, message: "discord.Message | GatewayMessage"):
     # Start/transfer countdown to this user
-    # Fetch the target message to reply under (ensures object exists)
-    try:
-        base_msg = await message.channel.fetch_message(TARGET_MESSAGE_ID)
-    except discord.NotFound:
+    # Reply under a cached handle of the target message (no REST round-trip)
+    base_msg = message_handles.get(message.channel, session.target_message_id)
+    if base_msg is None:
         # If target missing, ignore gracefully
         return
 
-    await start_countdown(message.channel, message.author, base_msg)
+    participant = resolve_author(message.author)
+    member_cache.keep(participant)
+    await start_countdown(session, message.channel, participant, base_msg)
+    if session.user_id == participant.id:
+        bonus_ledger.redeem(session)
+    if TAKEOVER_MODE == "edit":
+        return  # the notice is part of the countdown edit
     # Optional short confirmation
     with contextlib.suppress(discord.Forbidden):
-        note = await message.reply(embed=msg_taken_over(message.author), mention_author=False)
-        await asyncio.sleep(2)
-        with contextlib.suppress(discord.Forbidden, discord.NotFound):
-            await note.delete()
+        note = await message.reply(embed=msg_taken_over(participant), mention_author=False)
+        deletion_queue.enqueue(note, delay=2.0)
 
-@bot.event
-async def on_member_join(member: discord.Member):
-    try:
-        invites = await member.guild.invites()
-    except (discord.Forbidden, discord.HTTPException):
+def _forget_message(channel_id: int, message_id: int):
+    message_handles.invalidate(message_id, deleted=True)
+    session = sessions.get(channel_id)
+    if session is None:
         return
+    if message_id == session.countdown_msg_id:
+        # Removed by someone else mid-countdown: post a fresh one
+        session.renderer.detach()
+        session.countdown_msg = None
+        session.countdown_msg_id = None
+        _spawn(repost_countdown(session))
 
-    guild_invites = invite_uses.get(member.guild.id, {})
-    used_invite = None
-    usage_increase = 0
-    for invite in invites:
-        previous_uses = guild_invites.get(invite.code, 0)
-        current_uses = invite.uses or 0
-        if current_uses > previous_uses:
-            used_invite = invite
-            usage_increase = current_uses - previous_uses
-            break
-
-    invite_uses[member.guild.id] = {invite.code: invite.uses or 0 for invite in invites}
-
-    if not used_invite or not used_invite.inviter:
-        return
+@bot.event
+@instrumented("on_raw_message_delete")
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    _forget_message(payload.channel_id, payload.message_id)
 
-    inviter_member = member.guild.get_member(used_invite.inviter.id)
-    if not inviter_member:
+@bot.event
+@instrumented("on_raw_bulk_message_delete")
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    session = sessions.get(payload.channel_id)
+    if session is None:
         return
+    for message_id in (session.target_message_id, session.countdown_msg_id):
+        if message_id in payload.message_ids:
+            _forget_message(payload.channel_id, message_id)
 
-    # Check minimum account age for eligibility
-    try:
-        created_at = member.created_at
-        if created_at.tzinfo is not None:
-            created_at = created_at.replace(tzinfo=None)
-    except AttributeError:
-        created_at = None
-
-    age_ok = True
-    if created_at is not None and INVITE_MIN_ACCOUNT_AGE_DAYS > 0:
-        age_ok = (_now_utc_naive() - created_at) >= dt.timedelta(days=INVITE_MIN_ACCOUNT_AGE_DAYS)
-
-    if not age_ok:
-        return  # New accounts do not count for any bonus
-
-    # Record referral for potential role-bonus later
-    referral_map[member.id] = {
-        "inviter_id": inviter_member.id,
-        "role_bonus_applied": False,
-    }
-    state_store.save_referrals(referral_map)
+@bot.event
+@instrumented("on_raw_message_edit")
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    message_handles.invalidate(payload.message_id)
 
-    # Apply join-time invite bonus immediately (if inviter is currently active)
-    await apply_invite_bonus(inviter_member, usage_increase)
+@bot.event
+@instrumented("on_member_join")
+async def on_member_join(member: discord.Member):
+    # Possible invitee: stays resident for a later role-bonus update
+    member_cache.keep(member)
+    invite_attributor.member_joined(member)
 
 @bot.event
+@instrumented("on_invite_create")
 async def on_invite_create(invite: discord.Invite):
     if not invite.guild:
         return
-    guild_invites = invite_uses.setdefault(invite.guild.id, {})
-    guild_invites[invite.code] = invite.uses or 0
+    invite_attributor.invite_created(invite.guild.id, invite)
 
 @bot.event
+@instrumented("on_invite_delete")
 async def on_invite_delete(invite: discord.Invite):
     if not invite.guild:
         return
-    guild_invites = invite_uses.setdefault(invite.guild.id, {})
-    guild_invites.pop(invite.code, None)
+    invite_attributor.invite_deleted(invite.guild.id, invite.code)
 
 @bot.event
+@instrumented("on_member_update")
 async def on_member_update(before: discord.Member, after: discord.Member):
-    # Detect gaining the participant role later and reward inviter with role bonus
+    # Nickname/avatar/etc. changes never affect classification
+    if before.roles == after.roles:
+        return
+    # The cached entry (or `before` itself) still reflects the pre-update roles
     had_role_before = has_participant_role(before)
+    role_cache.invalidate(after)
     has_role_after = has_participant_role(after)
+
+    # Detect gaining the participant role later and reward inviter with role bonus
     if had_role_before or not has_role_after:
         return
 
+    # Registered now: a later role loss should trigger a fresh registration DM
+    if after.id in notified_missing_role:
+        notified_missing_role.discard(after.id)
+        state_writer.remove_notified_user(after.id)
+        dm_dispatcher.forget(after.id, DM_TEMPLATE_REGISTRATION)
+
+    # Earned once per invitee (role_bonus_applied), whether or not the inviter is active now
     info = referral_map.get(after.id)
-    if not info or info.get("role_bonus_applied"):
+    if not info or info.get("role_bonus_applied") or not info.get("inviter_id"):
+        return
+    info["role_bonus_applied"] = True
+    persist_referral(after.id)
+    referral_index.registered(info["inviter_id"])
+    bonus_ledger.earn(after.guild.id, info["inviter_id"], "role", INVITE_ROLE_BONUS_SECONDS, invitee_id=after.id)
+
+@bot.event
+@instrumented("on_member_remove")
+async def on_member_remove(member: discord.Member):
+    # Rejoining members start with fresh roles
+    role_cache.invalidate(member)
+    member_cache.forget(member)
+
+@bot.event
+@instrumented("on_guild_role_create")
+async def on_guild_role_create(role: discord.Role):
+    # Raw payload classification knows Administrator roles by ID
+    if role.permissions.administrator:
+        role_cache.clear_guild(role.guild.id)
+
+@bot.event
+@instrumented("on_guild_role_delete")
+async def on_guild_role_delete(role: discord.Role):
+    role_cache.clear_guild(role.guild.id)
+
+@bot.event
+@instrumented("on_guild_role_update")
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    # Administrator may have been granted or revoked through the role's permissions
+    if before.permissions != after.permissions:
+        role_cache.clear_guild(after.guild.id)
+
+# ---------------- Slash: /giveaway start|stop|status|admin-status ----------------
+giveaway_group = app_commands.Group(name="giveaway", description=f"{BRAND} giveaway sessions.")
+
+@giveaway_group.command(name="start", description="(Admin) Host a giveaway in this channel on the given target message.")
+@app_commands.describe(target_message_id="ID of the message participants must reply to.")
+@app_commands.checks.has_permissions(administrator=True)
+async def giveaway_start(interaction: discord.Interaction, target_message_id: str):
+    if not target_message_id.strip().isdigit():
+        await interaction.response.send_message("Target message ID must be numeric.", ephemeral=True)
         return
+    target_id = int(target_message_id)
+    existing = sessions.get(interaction.channel.id)
+    if existing is not None:
+        if existing.target_message_id == target_id:
+            await interaction.response.send_message("This giveaway is already running here.", ephemeral=True)
+            return
+        await interaction.response.send_message(
+            "This channel already hosts a giveaway. Stop it first with `/giveaway stop`.", ephemeral=True
+        )
+        return
+    session = add_session(interaction.guild.id, interaction.channel.id, target_id)
+    session.channel = interaction.channel
+    session.restored = True
+    persist_session(session)
+    saved = await persisted()
+    if QUIET_ENFORCEMENT == "overwrite":
+        _spawn(quiet_hours.reconcile())
+    await interaction.response.send_message(
+        f"{MSG_PREFIX} giveaway started. Reply to message `{target_id}` to participate."
+        + ("" if saved else NOT_SAVED_NOTE),
+        ephemeral=True,
+    )
 
-    inviter_id = info.get("inviter_id")
-    if not inviter_id:
+@giveaway_group.command(name="stop", description="(Admin) Stop hosting the giveaway in this channel.")
+@app_commands.checks.has_permissions(administrator=True)
+async def giveaway_stop(interaction: discord.Interaction):
+    session = sessions.pop(interaction.channel.id, None)
+    if session is None:
+        await interaction.response.send_message("No giveaway is running in this channel.", ephemeral=True)
         return
+    await clear_active(session)
+    session.close()
+    state_writer.record("session_closed", session.key)
+    saved = await persisted()
+    if QUIET_ENFORCEMENT == "overwrite":
+        _spawn(quiet_hours.reconcile())  # lift this channel's quiet overwrites
+    await interaction.response.send_message(
+        f"{MSG_PREFIX} giveaway stopped." + ("" if saved else NOT_SAVED_NOTE), ephemeral=True
+    )
+
+def status_session(guild_id: Optional[int], channel_id: Optional[int]) -> Optional[GiveawaySession]:
+    # This channel's giveaway, else the guild's only one
+    session = sessions.get(channel_id)
+    if session is not None:
+        return session
+    hosted = [session for session in sessions.values() if session.guild_id in (0, guild_id)]
+    return hosted[0] if len(hosted) == 1 else None
 
-    inviter_member = after.guild.get_member(inviter_id)
-    if not inviter_member:
-        with contextlib.suppress(discord.NotFound, discord.HTTPException):
-            inviter_member = await after.guild.fetch_member(inviter_id)
-    if not inviter_member:
+async def send_giveaway_status(interaction: discord.Interaction, *, admin: bool):
+    # Served from the session's status snapshot and in-memory ledger: no REST, no fetches
+    session = status_session(interaction.guild_id, interaction.channel_id)
+    if session is None:
+        await interaction.response.send_message("No giveaway is running here.", ephemeral=True)
         return
+    status = session.status
+    totals: Dict[str, int] = {}
+    credits = 0
+    if status.user_id is not None:
+        totals = bonus_ledger.totals(status.user_id)
+        credits = len(bonus_ledger.credits(session.guild_id, status.user_id))
+    internals = None
+    if admin:
+        internals = {
+            "Timer": session.timer.stats(),
+            "Renderer": session.renderer.stats(),
+            "Ingest": session.ingest.stats(),
+            "Ledger": bonus_ledger.stats(),
+        }
+    embed = msg_status(status, _now_utc_naive(), totals, credits, internals)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@giveaway_group.command(name="status", description="Who holds the giveaway, time left, bonuses and recent takeovers.")
+async def giveaway_status(interaction: discord.Interaction):
+    await send_giveaway_status(interaction, admin=False)
 
-    await apply_role_bonus(inviter_member)
-    applied_now = active_user_id == inviter_member.id and active_until is not None
-    if applied_now:
-        info["role_bonus_applied"] = True
-        state_store.save_referrals(referral_map)
+@giveaway_group.command(name="admin-status", description="(Admin) Giveaway status with timer, renderer and ingest internals.")
+@app_commands.checks.has_permissions(administrator=True)
+async def giveaway_admin_status(interaction: discord.Interaction):
+    await send_giveaway_status(interaction, admin=True)
+
+bot.tree.add_command(giveaway_group)
 
 # ---------------- Admin Slash: /unlock (optional safeguard) ----------------
 # Keeps things simple: we DON'T reopen automatically after winner.
@@ -763,29 +4288,69 @@ async def on_member_update(before: discord.Member, after: discord.Member):
 @bot.tree.command(name="unlock", description="(Admin) Unlock the giveaway channel manually.")
 @app_commands.checks.has_permissions(administrator=True)
 async def unlock(interaction: discord.Interaction):
-    global channel_locked_forever
-    if interaction.channel.id != CHANNEL_ID:
+    session = sessions.get(interaction.channel.id)
+    if session is None:
         await interaction.response.send_message("Use this in the giveaway channel.", ephemeral=True)
         return
     overwrites = interaction.channel.overwrites
     overwrites[interaction.guild.default_role] = discord.PermissionOverwrite(send_messages=True)
     await interaction.channel.edit(overwrites=overwrites, reason=f"{BRAND} Admin unlock")
-    channel_locked_forever = False
-    state_store.save_channel_locked(False)
-    await interaction.response.send_message(f"{MSG_PREFIX} channel unlocked by admin.", ephemeral=True)
+    session.locked = False
+    journal_session(session, "unlocked")
+    saved = await persisted()
+    await interaction.response.send_message(
+        f"{MSG_PREFIX} channel unlocked by admin." + ("" if saved else NOT_SAVED_NOTE), ephemeral=True
+    )
+
+# ---------------- Slash: /leaderboard ----------------
+# Served from referral_index: no REST calls, no member lookups (inviters are mentions)
+@bot.tree.command(name="leaderboard", description="Top inviters: joins, registrations and applied bonuses.")
+@app_commands.describe(page="Page number, starting at 1.")
+async def leaderboard(interaction: discord.Interaction, page: app_commands.Range[int, 1, None] = 1):
+    rows, index, pages = referral_index.page(page - 1, LEADERBOARD_PAGE_SIZE)
+    await interaction.response.send_message(embed=msg_leaderboard(rows, index + 1, pages), ephemeral=True)
+
+# ---------------- Admin Slash: /metrics ----------------
+@bot.tree.command(name="metrics", description="(Admin) Dump the bot's internal metrics.")
+@app_commands.checks.has_permissions(administrator=True)
+async def metrics_dump(interaction: discord.Interaction):
+    text = metrics.render()
+    note = "" if METRICS_ENABLED else " Timings are off; set METRICS_PORT to record them."
+    await interaction.response.send_message(
+        f"{MSG_PREFIX} metrics snapshot.{note}",
+        file=discord.File(io.BytesIO(text.encode("utf-8")), filename="metrics.txt"),
+        ephemeral=True,
+    )
 
 # ---------------- Main ----------------
 def _validate_env():
     missing = []
     if not BOT_TOKEN:
         missing.append("DISCORD_BOT_TOKEN")
-    if not CHANNEL_ID:
-        missing.append("CHANNEL_ID")
-    if not TARGET_MESSAGE_ID:
-        missing.append("TARGET_MESSAGE_ID")
+    # Sessions can also come from the store or /giveaway start, but a half-configured
+    # env giveaway is almost certainly a mistake
+    if bool(CHANNEL_ID) != bool(TARGET_MESSAGE_ID):
+        missing.append("TARGET_MESSAGE_ID" if CHANNEL_ID else "CHANNEL_ID")
     if missing:
         raise SystemExit(f"Missing required env vars: {', '.join(missing)}")
 
+async def main():
+    async with bot:
+        # Journaled countdowns resume before the bot logs in
+        started = time.perf_counter()
+        recover_sessions()
+        elapsed = time.perf_counter() - started
+        metrics.set("giveaway_startup_phase_seconds", elapsed, phase="recover")
+        resumed = sum(1 for session in sessions.values() if session.until is not None)
+        print(f"[{BRAND}] Recovered {len(sessions)} sessions ({resumed} running) in {elapsed * 1000:.0f}ms.")
+        await bot.start(BOT_TOKEN)
+
 if __name__ == "__main__":
     _validate_env()
-    bot.run(BOT_TOKEN)
+    discord.utils.setup_logging()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state_writer.close()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Audit tool for the giveaway journal: lists the recorded events (takeovers, bonuses,
+# credits, referrals, winners, locks) and rebuilds the giveaway state as of any event.
+#
+#   python replay.py [--db FILE] [--session KEY] [--user ID] [--until SEQ] [--state]
+#
+# Reads a private copy of the state DB (taken with SQLite's online backup, so the bot
+# can keep running): opening it folds the journal tail and runs any schema migration,
+# exactly as on startup, but never on the audited file itself.
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay the giveaway event journal")
+    parser.add_argument("--db", default=os.getenv("STATE_DB_PATH", "giveaway_state.db"), help="state DB to read")
+    parser.add_argument("--session", help="only events of this session key (channel_id:target_message_id)")
+    parser.add_argument("--user", type=int, help="only events involving this user (participant, inviter or invitee)")
+    parser.add_argument("--until", type=int, help="stop at this journal sequence number")
+    parser.add_argument("--state", action="store_true", help="print the rebuilt state instead of the events")
+    return parser.parse_args()
+
+
+def copy_db(path: str, workdir: str) -> str:
+    copy = os.path.join(workdir, "state.db")
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    target = sqlite3.connect(copy)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return copy
+
+
+def main_cli():
+    args = parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"No state DB at {args.db}")
+    workdir = tempfile.mkdtemp(prefix="giveaway-replay-")
+    try:
+        run(args, copy_db(args.db, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args: argparse.Namespace, db_path: str):
+    # main.py reads its config at import time: open the copy, host nothing
+    os.environ["STATE_DB_PATH"] = db_path
+    os.environ["CHANNEL_ID"] = "0"
+    os.environ["TARGET_MESSAGE_ID"] = "0"
+
+    import main
+
+    try:
+        store = main.state_store
+        if args.state:
+            replica = store.replay(until_seq=args.until)
+            sessions = replica.load_sessions()
+            if args.session:
+                sessions = [row for row in sessions if row["key"] == args.session]
+            result = {
+                "sessions": [dict(row, active=replica.load_active_state(row["key"])) for row in sessions],
+                "referrals": {str(k): v for k, v in replica.load_referrals().items()},
+                "bonus_totals": {str(k): v for k, v in replica.load_bonus_totals().items()},
+                "bonus_credits": replica.load_bonus_credits(),
+            }
+            if args.user is not None:
+                result["referrals"] = {
+                    k: v for k, v in result["referrals"].items()
+                    if args.user in (int(k), v["inviter_id"])
+                }
+                result["bonus_totals"] = {k: v for k, v in result["bonus_totals"].items() if int(k) == args.user}
+                result["bonus_credits"] = [row for row in result["bonus_credits"] if row["user_id"] == args.user]
+            print(json.dumps(result, indent=2))
+            return
+        for event in store.load_journal(session_key=args.session, user_id=args.user, until_seq=args.until):
+            print(json.dumps(event))
+    finally:
+        main.state_writer.close()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# Deterministic giveaway simulator on a virtual clock. Runs many complete giveaways
+# (takeovers, invite joins, role grants, graceful restarts) through the real handlers
+# in seconds of wall time, checks invariants and reports REST calls per scenario.
+#
+#   python simulate.py [--scenarios N] [--concurrency N] [--seed N] [--output FILE]
+#
+# The event loop never sleeps: when nothing is ready, its clock jumps straight to the
+# next timer (it only waits for real while the state writer thread flushes). main.clock
+# is a LoopClock on that loop, so deadlines, quiet hours and bonuses share virtual time.
+import argparse
+import asyncio
+import contextlib
+import datetime as dt
+import io
+import json
+import math
+import os
+import random
+import selectors
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# main.py reads its config at import time: use a throwaway DB, no env giveaway, and
+# simulation-sized timings unless overridden
+SIM_PARTICIPANT_ROLE_ID = 3000
+SIM_QUIET_ROLE_ID = 3001
+SIM_BOT_ID = 4000
+SIM_START = dt.datetime(2024, 1, 1, 6, 0, 0)
+
+os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="giveaway-sim-"), "state.db")
+os.environ["CHANNEL_ID"] = "0"
+os.environ["TARGET_MESSAGE_ID"] = "0"
+os.environ["GUILD_ID"] = "0"
+os.environ["PARTICIPANT_ROLE_IDS"] = str(SIM_PARTICIPANT_ROLE_ID)
+os.environ["QUIET_ROLE_IDS"] = str(SIM_QUIET_ROLE_ID)
+os.environ["ADMIN_ROLE_IDS"] = ""
+os.environ.setdefault("QUIET_START", "00:00")
+os.environ.setdefault("QUIET_END", "07:00")
+os.environ.setdefault("COUNTDOWN_SECONDS", "120")
+os.environ.setdefault("ALERT_AT_SECONDS", "10")
+os.environ.setdefault("INVITE_BONUS_SECONDS", "10")
+os.environ.setdefault("INVITE_ROLE_BONUS_SECONDS", "10")
+os.environ.setdefault("INVITE_MIN_ACCOUNT_AGE_DAYS", "0")
+
+import fake_discord  # noqa: E402
+from fake_discord import FakeGuild, FakeHTTP, FakeInvite, FakeMember, FakeMessage, FakeTextChannel, next_snowflake  # noqa: E402
+
+import main  # noqa: E402
+
+
+# ---------------- Virtual time ----------------
+class VirtualTimeSelector(selectors.BaseSelector):
+    # Real I/O (thread wakeups from the state writer) is still polled; instead of
+    # blocking until the next timer, the virtual clock jumps just past its deadline
+    def __init__(self):
+        self._real = selectors.DefaultSelector()
+        self.loop: "VirtualTimeLoop" = None
+        self.now = 0.0
+
+    def register(self, fileobj, events, data=None):
+        return self._real.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._real.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._real.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        ready = self._real.select(0)
+        if ready or self.loop.has_ready():
+            return ready
+        if timeout is None or self.loop.holding():
+            # Waiting on another thread (the state writer): real time, not virtual
+            return self._real.select(None)
+        deadline = self.loop.next_deadline()
+        if deadline is not None:
+            # Strictly past it, so a task comparing `when > now` sees the time as reached
+            self.now = max(self.now + timeout, math.nextafter(deadline, math.inf))
+        return []
+
+    def get_map(self):
+        return self._real.get_map()
+
+    def close(self):
+        self._real.close()
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self._virtual = VirtualTimeSelector()
+        super().__init__(self._virtual)
+        self._virtual.loop = self
+        # Timers fire only once virtual time has passed them
+        self._clock_resolution = 0.0
+        self._holds = 0
+
+    @contextlib.contextmanager
+    def hold_clock(self):
+        # Freeze virtual time while awaiting work done by a thread, for repeatable runs
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._holds -= 1
+
+    def holding(self) -> bool:
+        return self._holds > 0
+
+    def time(self) -> float:
+        return self._virtual.now
+
+    def has_ready(self) -> bool:
+        return bool(self._ready)
+
+    def next_deadline(self):
+        return self._scheduled[0].when() if self._scheduled else None
+
+
+# ---------------- Invariants ----------------
+class Violations:
+    def __init__(self):
+        self.by_channel: Dict[int, List[str]] = {}
+
+    def add(self, channel_id: int, message: str):
+        self.by_channel.setdefault(channel_id, []).append(message)
+
+
+def install_probes(violations: Violations):
+    # Wrap the module-level entry points the handlers call, to observe (not change) them
+    reduce_active_time = main.reduce_active_time
+    start_countdown = main.start_countdown
+
+    async def probed_reduce(session, seconds, **kwargs):
+        now = main._now_utc_naive()
+        if seconds > 0 and session.until is not None and session.until <= now:
+            violations.add(session.channel_id, f"bonus pushed an already-reached deadline back to now at {now.isoformat()}")
+        await reduce_active_time(session, seconds, **kwargs)
+
+    async def probed_start(session, channel, participant, reply_to, **kwargs):
+        if kwargs.get("resume_until") is None and participant.get_role(SIM_QUIET_ROLE_ID) and main.in_quiet_hours():
+            violations.add(session.channel_id, f"quiet-role member {participant.id} took over during quiet hours")
+        await start_countdown(session, channel, participant, reply_to, **kwargs)
+
+    main.reduce_active_time = probed_reduce
+    main.start_countdown = probed_start
+
+
+# ---------------- Scenarios ----------------
+class Scenario:
+    def __init__(self, index: int, rng: random.Random, args):
+        self.index = index
+        self.rng = rng
+        self.args = args
+        self.http = FakeHTTP(args.rest_latency / 1000)
+        self.guild = FakeGuild(self.http, 10_000 + index, chunked=not main.member_cache.lean)
+        self.channel = FakeTextChannel(self.http, self.guild, 20_000 + index, SIM_BOT_ID)
+        self.target_id = next_snowflake()
+        self.participants: List[FakeMember] = []
+        self.quiet: List[FakeMember] = []
+        self.unregistered: List[FakeMember] = []
+        self.counts = {"replies": 0, "invites": 0, "role_grants": 0, "restarts": 0}
+
+        for _ in range(rng.randint(3, args.max_participants)):
+            self.participants.append(self._member({SIM_PARTICIPANT_ROLE_ID}))
+        for _ in range(rng.randint(0, 2)):
+            self.quiet.append(self._member({SIM_PARTICIPANT_ROLE_ID, SIM_QUIET_ROLE_ID}))
+        self.guild.invite_list = [
+            FakeInvite(f"s{index}i{i}", inviter) for i, inviter in enumerate(self.participants[:3])
+        ]
+
+    def _member(self, roles) -> FakeMember:
+        member = FakeMember(self.http, self.guild, next_snowflake(), roles)
+        self.guild.members[member.id] = member
+        return member
+
+    @property
+    def session(self) -> main.GiveawaySession:
+        return main.sessions[self.channel.id]
+
+    async def run(self, channels: Dict[int, FakeTextChannel]):
+        channels[self.channel.id] = self.channel
+        session = main.add_session(self.guild.id, self.channel.id, self.target_id)
+        session.channel = self.channel
+        session.restored = True
+        main.persist_session(session)
+
+        await self.reply(self.rng.choice(self.participants))
+        for _ in range(self.rng.randint(0, self.args.max_events)):
+            await asyncio.sleep(self.rng.expovariate(1 / self.args.event_gap))
+            if self.session.locked:
+                break
+            kind = self.rng.choices(
+                ("takeover", "quiet", "invite", "role_grant", "restart"),
+                weights=(6, 1, 2, 2, 1),
+            )[0]
+            if kind == "takeover":
+                await self.reply(self.rng.choice(self.participants))
+            elif kind == "quiet" and self.quiet:
+                await self.reply(self.rng.choice(self.quiet))
+            elif kind == "invite":
+                await self.invite_join()
+            elif kind == "role_grant" and self.unregistered:
+                await self.grant_role(self.unregistered.pop(0))
+            elif kind == "restart":
+                await self.restart()
+
+        # Let the last countdown run out
+        loop = asyncio.get_running_loop()
+        give_up = loop.time() + self.args.countdown_limit
+        while not self.channel.locked and loop.time() < give_up:
+            await asyncio.sleep(1.0)
+
+    async def reply(self, author: FakeMember):
+        self.counts["replies"] += 1
+        await main.on_message(FakeMessage(self.http, self.channel, author, reference_id=self.target_id))
+
+    async def invite_join(self):
+        self.counts["invites"] += 1
+        invite = self.rng.choice(self.guild.invite_list)
+        invite.uses += 1
+        member = self._member(set())
+        self.unregistered.append(member)
+        await main.on_member_join(member)
+
+    async def grant_role(self, member: FakeMember):
+        self.counts["role_grants"] += 1
+        after = member.with_roles(member.role_ids | {SIM_PARTICIPANT_ROLE_ID})
+        self.guild.members[member.id] = after
+        await main.on_member_update(member, after)
+
+    async def restart(self):
+        # Graceful restart of this giveaway: pending writes land, in-memory state is
+        # dropped and rebuilt from the store. Skipped while a winner may be in flight.
+        session = self.session
+        if session.until is not None and (session.until - main._now_utc_naive()).total_seconds() < 5:
+            return
+        self.counts["restarts"] += 1
+        del main.sessions[self.channel.id]
+        session.close()
+        await main.state_writer.flush()
+        row = next(r for r in main.state_store.load_sessions() if r["channel_id"] == self.channel.id)
+        restored = main.add_session(row["guild_id"], row["channel_id"], row["target_message_id"], locked=row["locked"])
+        restored.stored = main.state_store.load_active_state(row["key"])
+        await main.restore_session(restored)
+        restored.restored = True
+
+    def check(self, violations: Violations) -> dict:
+        session = self.session
+        winners = self.channel.sent_titles().count("Winner Announced")
+        if winners != 1:
+            violations.add(self.channel.id, f"expected exactly one winner, got {winners}")
+        if not (self.channel.locked and session.locked and main.state_store.load_channel_locked(session.key)):
+            violations.add(self.channel.id, "channel not locked after the winner")
+        # /giveaway status must agree with the journal, across restarts too
+        status = session.status
+        journal = main.state_store.load_journal(session_key=session.key)
+        takeovers = [event["data"]["user_id"] for event in journal if event["kind"] == "takeover"]
+        winner = next((event["data"]["user_id"] for event in journal if event["kind"] == "winner"), None)
+        if (
+            status.takeovers != len(takeovers)
+            or [user_id for user_id, _ in status.history] != takeovers[::-1][: main.STATUS_HISTORY]
+            or status.winner_id != winner
+            or not status.locked
+        ):
+            violations.add(self.channel.id, f"status snapshot out of step with the journal: {status!r}")
+        return {
+            "scenario": self.index,
+            "events": dict(self.counts),
+            "winners": winners,
+            "rest_total": self.http.total(),
+            "rest_by_route": dict(sorted(self.http.calls.items())),
+            "violations": violations.by_channel.get(self.channel.id, []),
+        }
+
+
+async def simulate(args) -> dict:
+    loop = asyncio.get_running_loop()
+    main.set_clock(main.LoopClock(loop, SIM_START))
+    fake_discord.set_time_source(lambda: main.clock.utcnow().replace(tzinfo=dt.timezone.utc))
+    channels: Dict[int, FakeTextChannel] = {}
+    main.bot.get_channel = channels.get  # restore_session looks channels up on the bot
+    flush = main.state_writer.flush
+
+    async def held_flush():
+        with loop.hold_clock():
+            await flush()
+
+    main.state_writer.flush = held_flush
+    violations = Violations()
+    install_probes(violations)
+
+    rng = random.Random(args.seed)
+    limit = asyncio.Semaphore(max(1, args.concurrency))
+    results: List[dict] = []
+
+    async def run_one(index: int, seed: int):
+        async with limit:
+            scenario = Scenario(index, random.Random(seed), args)
+            try:
+                await scenario.run(channels)
+            except Exception as e:
+                violations.add(scenario.channel.id, f"scenario crashed: {e!r}")
+            await main.state_writer.flush()
+            results.append(scenario.check(violations))
+
+    start_virtual = loop.time()
+    await asyncio.gather(*(run_one(i, rng.getrandbits(32)) for i in range(args.scenarios)))
+    results.sort(key=lambda r: r["scenario"])
+
+    rest = sorted(r["rest_total"] for r in results)
+    failing = [r for r in results if r["violations"]]
+    return {
+        "scenarios": len(results),
+        "virtual_seconds": round(loop.time() - start_virtual, 3),
+        "failed_scenarios": len(failing),
+        "rest_per_scenario": {
+            "mean": round(sum(rest) / len(rest), 3) if rest else 0.0,
+            "p50": rest[len(rest) // 2] if rest else 0,
+            "max": rest[-1] if rest else 0,
+        },
+        "events": {
+            kind: sum(r["events"][kind] for r in results)
+            for kind in ("replies", "invites", "role_grants", "restarts")
+        },
+        "failures": failing[: args.show_failures],
+        "per_scenario": results if args.per_scenario else None,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Virtual-clock giveaway simulator")
+    parser.add_argument("--scenarios", type=int, default=1000, help="giveaways to simulate")
+    parser.add_argument("--concurrency", type=int, default=200, help="giveaways running at once")
+    parser.add_argument("--max-participants", type=int, default=8)
+    parser.add_argument("--max-events", type=int, default=30, help="events after the first takeover")
+    parser.add_argument("--event-gap", type=float, default=20.0, help="mean virtual seconds between events")
+    parser.add_argument("--countdown-limit", type=float, default=3600.0, help="virtual seconds to wait for a winner")
+    parser.add_argument("--rest-latency", type=float, default=50.0, help="simulated REST latency in virtual ms")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--per-scenario", action="store_true", help="include every scenario in the output")
+    parser.add_argument("--show-failures", type=int, default=10)
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's own log output")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+
+    loop = VirtualTimeLoop()
+    asyncio.set_event_loop(loop)
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+            result = loop.run_until_complete(simulate(args))
+    finally:
+        main.state_writer.close()
+        loop.close()
+    result["wall_seconds"] = round(time.perf_counter() - started, 3)
+
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.exit(1 if result["failed_scenarios"] else 0)
+
+
+if __name__ == "__main__":
+    main_cli()